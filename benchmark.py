@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+訊息處理效能測試
+
+- 指令判斷：原本逐一檢查的方式 vs CommandRouter（單一編譯正規表示式）
+- 記帳解析：原本的 MessageParser vs 預先編譯、只比對需要的格式的 MessageParser
+
+兩部分都會先確認新舊結果一致。
+
+使用方式：
+    python benchmark.py
+    python benchmark.py --iterations 50000
+"""
+
+import argparse
+import re
+import time
+
+from command_router import CommandRouter
+from message_parser import MessageParser
+from money import to_cents
+
+# 常見訊息：群組聊天、記帳、查詢、幫助、刪除、私聊指令
+CORPUS = [
+    '@ai 午餐 120', '@ai 咖啡 50元', '@ai 停車費 30塊', '@ai 買書 NT$200', '@ai 花了60 早餐',
+    '@ai 查詢', '@ai 查詢 30', '@ai list', '@ai LIST 10', '@ai 記錄50', '@ai 最近 100',
+    '@ai ?', '@ai 指令', '@ai hello', '@ai 幫助', '@AI menu',
+    '@ai /del #23', '@ai /del 23', '@ai /DEL   #7 謝謝', '@ai',
+    '查詢10', 'list30', '查詢', '本月', '當前統計', 'Help', 'help',
+    '大家好', '今天中午吃什麼？', '哈哈哈', '明天見', '@aiden 100',
+]
+
+COMMANDS = [
+    '記帳', '查詢', '本月', '總金額', '統計', '當前統計', '重新統計', '確認重新統計', '取消重新統計',
+    '幫助', '說明', 'help', '?', '？', '指令', '功能', '選單', '菜單', 'menu',
+    '開始', 'start', '歡迎', '你好', 'hi', 'hello', '記錄', '最近', 'list', '報告', 'stats',
+    '月統計', '這個月', '當月',
+]
+
+
+def legacy_classify(message_text, commands=COMMANDS):
+    """原本 handle_message 的判斷流程（每次都重新比對多個未編譯的正規表示式）"""
+    if message_text.strip().lower().startswith('@ai'):
+        content = message_text.strip()[3:].strip()
+        for pattern in [r'^查詢\s*(\d+)?$', r'^記錄\s*(\d+)?$', r'^最近\s*(\d+)?$', r'^list\s*(\d+)?$']:
+            if re.match(pattern, content, re.IGNORECASE):
+                return 'ai_query'
+        help_keywords = [
+            'help', '幫助', '說明', '指令', '功能', '選單', 'menu',
+            '?', '？', 'start', '開始', '歡迎', 'hi', 'hello'
+        ]
+        if content.lower() in help_keywords:
+            return 'ai_help'
+        if content.lower().startswith('/del'):
+            return 'delete'
+        return 'expense'
+    for pattern in [r'^查詢\d+$', r'^記錄\d+$', r'^最近\d+$', r'^list\d+$']:
+        if re.match(pattern, message_text.strip(), re.IGNORECASE):
+            return 'number_query'
+    if message_text.strip() in commands:
+        return 'command'
+    return 'chat'
+
+
+# 記帳解析語料：各種金額格式與容易出錯的寫法
+PARSER_CORPUS = [
+    '@ai 午餐 120', '@ai 咖啡 50元', '@ai 停車費 30塊', '@ai 買飲料 45', '@ai 電影票 280',
+    '@ai 油錢 800', '@ai 早餐 花了60', '@ai 花60 晚餐', '@ai NT$100 書', '@ai 買書 $80',
+    '@ai 咖啡 45.5', '@ai 午餐120', '@ai 3C 用品 1200', '@ai 咖啡 50元 2', '@ai 0元',
+    '@ai 午餐', '@ai /del #23', '@ai /del 23', '@ai', '大家好', '@AI 宵夜 99.99',
+    '@ai 計程車 NT$ 250 小費', '@ai 水果 2 斤 150', '@ai 咖啡 2 杯 100',
+    # 描述中有數字但沒有分隔符號或貨幣標記：一筆，以最後的金額為準
+    '@ai iPhone 15 保護殼 500', '@ai 7-11 買東西 50', '@ai 午餐 2 人 300', '@ai 停車 2 小時 60',
+    '@ai 早餐 60 午餐 120 咖啡 50',
+    # 最後一筆是合計：不拆成多筆
+    '@ai 早餐 60元 午餐 120元 共 180元', '@ai 早餐 60，午餐 120，合計 180',
+]
+
+
+def same_as_legacy(result, legacy_result):
+    """比較原本 dict 中有的欄位（新版另外有 items）"""
+    return all(result[key] == value for key, value in legacy_result.items())
+
+
+class LegacyMessageParser:
+    """原本的 MessageParser（每次比對都經過 re 模組快取，並建立 8 個鍵的 dict）"""
+
+    def __init__(self):
+        self.amount_patterns = [
+            r'(\d+(?:\.\d+)?)\s*[元塊錢]',
+            r'NT?\$\s*(\d+(?:\.\d+)?)',
+            r'花了?\s*(\d+(?:\.\d+)?)',
+            r'(\d+(?:\.\d+)?)$',
+            r'^(\d+(?:\.\d+)?)$',
+        ]
+
+    def parse_message(self, message):
+        result = {
+            'amount_cents': None, 'description': '', 'reason': '', 'location': None,
+            'category': None, 'is_valid_format': False, 'delete_id': None, 'action_type': None
+        }
+        if not message.strip().lower().startswith('@ai'):
+            return result
+        content = message.strip()[3:].strip()
+        if not content:
+            return result
+        result['is_valid_format'] = True
+        if content.lower().startswith('/del'):
+            result['action_type'] = 'delete'
+            match = re.search(r'/del\s+#(\d+)', content, re.IGNORECASE)
+            if match:
+                result['delete_id'] = int(match.group(1))
+                result['description'] = f"刪除記錄 #{result['delete_id']}"
+            return result
+        result['action_type'] = 'expense'
+        amount_cents = None
+        for pattern in self.amount_patterns:
+            match = re.search(pattern, content)
+            if match:
+                amount_cents = to_cents(match.group(1))
+                break
+        if amount_cents:
+            result['amount_cents'] = amount_cents
+            reason = content
+            for pattern in self.amount_patterns:
+                reason = re.sub(pattern, '', reason)
+            reason = ' '.join(reason.split())
+            result['reason'] = reason
+            result['description'] = reason
+        return result
+
+
+def measure(func, messages, iterations):
+    """回傳每秒處理的訊息數"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            func(message)
+    elapsed = time.perf_counter() - started
+    return iterations * len(messages) / elapsed
+
+
+def benchmark_router(iterations):
+    router = CommandRouter(COMMANDS)
+
+    mismatches = [
+        (message, legacy_classify(message), router.route(message).kind)
+        for message in CORPUS
+        if legacy_classify(message) != router.route(message).kind
+    ]
+    if mismatches:
+        for message, legacy, routed in mismatches:
+            print(f"❌ 分類不一致: {message!r} 原本={legacy} 路由={routed}")
+        raise SystemExit(1)
+
+    legacy_rate = measure(legacy_classify, CORPUS, iterations)
+    router_rate = measure(router.route, CORPUS, iterations)
+    print("🚀 指令判斷")
+    print(f"   原本逐一檢查: {legacy_rate:12,.0f} 則/秒")
+    print(f"   CommandRouter: {router_rate:12,.0f} 則/秒（{router_rate / legacy_rate:.1f}x）")
+
+
+def benchmark_parser(iterations):
+    legacy = LegacyMessageParser()
+    parser = MessageParser()
+
+    mismatches = [
+        (message, legacy.parse_message(message), parser.parse_message(message).to_dict())
+        for message in PARSER_CORPUS
+        if not same_as_legacy(parser.parse_message(message), legacy.parse_message(message))
+    ]
+    if mismatches:
+        for message, old, new in mismatches:
+            print(f"❌ 解析結果不一致: {message!r}\n   原本={old}\n   新版={new}")
+        raise SystemExit(1)
+
+    legacy_rate = measure(legacy.parse_message, PARSER_CORPUS, iterations)
+    parser_rate = measure(parser.parse_message, PARSER_CORPUS, iterations)
+    batch_started = time.perf_counter()
+    for _ in range(iterations):
+        parser.parse_many(PARSER_CORPUS)
+    batch_rate = iterations * len(PARSER_CORPUS) / (time.perf_counter() - batch_started)
+    print("🚀 記帳解析")
+    print(f"   原本 MessageParser: {legacy_rate:12,.0f} 則/秒")
+    print(f"   新版 parse_message: {parser_rate:12,.0f} 則/秒（{parser_rate / legacy_rate:.1f}x）")
+    print(f"   新版 parse_many:    {batch_rate:12,.0f} 則/秒（{batch_rate / legacy_rate:.1f}x）")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='訊息處理效能測試')
+    arg_parser.add_argument('--iterations', type=int, default=5000, help='語料重複次數')
+    args = arg_parser.parse_args()
+
+    print(f"📊 語料 {len(CORPUS)} 則 × {args.iterations} 次")
+    benchmark_router(args.iterations)
+    print(f"📊 記帳語料 {len(PARSER_CORPUS)} 則 × {args.iterations} 次")
+    benchmark_parser(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
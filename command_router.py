@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+指令路由
+
+啟動時把所有指令格式組成一個編譯好的正規表示式，每則訊息只比對一次，
+就能判斷類型並取出參數，不需要依序呼叫多個 is_xxx_command 檢查。
+
+路由類型（Route.kind）與參數（Route.args）：
+    ai_query      @ai 查詢 [N]       {'limit': int | None}
+    ai_help       @ai ? / 指令 / hi   {'topic': 'help' | 'menu' | 'welcome'}
+    delete        @ai /del #N        {'delete_id': int | None}（格式錯誤時為 None）
+    expense       @ai 其他內容        {'content': str}（金額由 MessageParser 解析）
+    number_query  查詢10（私聊）       {'limit': int}
+    command       查詢 / 本月 ...     {'name': str}（完全比對，區分大小寫）
+    chat          其他訊息            {}
+
+判斷順序與原本的 handle_message 相同：查詢 → 幫助 → 刪除 → 記帳；
+非 @ai 訊息為數字查詢 → 內建指令 → 一般聊天。群組 / 私聊的差異由呼叫端處理。
+"""
+
+import re
+
+QUERY_KEYWORDS = ('查詢', '記錄', '最近', 'list')
+
+HELP_TOPICS = {
+    'help': ('help', '幫助', '說明', '?', '？'),
+    'menu': ('指令', '功能', '選單', 'menu'),
+    'welcome': ('start', '開始', '歡迎', 'hi', 'hello'),
+}
+
+
+def _alternation(words):
+    # 長的優先，避免較短的關鍵字先吃掉前綴
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+class Route:
+    """一則訊息的路由結果"""
+    __slots__ = ('kind', 'args')
+
+    def __init__(self, kind, args=None):
+        self.kind = kind
+        self.args = args or {}
+
+    def __repr__(self):
+        return f"Route({self.kind!r}, {self.args!r})"
+
+
+class CommandRouter:
+    """以單一編譯正規表示式分類訊息"""
+
+    def __init__(self, commands=()):
+        """
+        Args:
+            commands (iterable): 私聊內建指令的關鍵字（完全比對）
+        """
+        queries = _alternation(QUERY_KEYWORDS)
+        help_groups = '|'.join(
+            f"(?P<help_{topic}>{_alternation(words)})" for topic, words in HELP_TOPICS.items()
+        )
+        branches = [
+            rf"(?P<ai_query>@ai\s*(?:{queries})\s*(?P<query_limit>\d+)?)",
+            rf"(?P<ai_help>@ai\s*(?:{help_groups}))",
+            # 與原本 re.search(r'/del\s+#(\d+)') 相同：取第一個後面接著 #數字 的 /del
+            r"(?P<delete>@ai\s*/del(?:.*?/del)*?\s+#(?P<delete_id>\d+).*)",
+            r"(?P<delete_invalid>@ai\s*/del.*)",
+            r"(?P<expense>@ai\s*(?P<content>.*))",
+            rf"(?P<number_query>(?:{queries})(?P<number_limit>\d+))",
+        ]
+        commands = list(commands)
+        if commands:
+            branches.append(rf"(?-i:(?P<command>{_alternation(commands)}))")
+
+        self.pattern = re.compile('|'.join(branches), re.IGNORECASE | re.DOTALL)
+
+    def route(self, message_text):
+        """分類訊息並取出參數，回傳 Route"""
+        match = self.pattern.fullmatch(message_text.strip())
+        if match is None:
+            return Route('chat')
+
+        # 每個分支都包在具名群組中，最外層群組最後結束，lastgroup 就是命中的分支
+        kind = match.lastgroup
+        if kind == 'ai_query':
+            limit = match.group('query_limit')
+            return Route('ai_query', {'limit': int(limit) if limit else None})
+        if kind == 'ai_help':
+            topic = next(topic for topic in HELP_TOPICS if match.group(f'help_{topic}') is not None)
+            return Route('ai_help', {'topic': topic})
+        if kind == 'delete':
+            return Route('delete', {'delete_id': int(match.group('delete_id'))})
+        if kind == 'delete_invalid':
+            return Route('delete', {'delete_id': None})
+        if kind == 'expense':
+            return Route('expense', {'content': match.group('content').strip()})
+        if kind == 'number_query':
+            return Route('number_query', {'limit': int(match.group('number_limit'))})
+        return Route('command', {'name': match.group('command')})
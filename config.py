@@ -29,4 +29,52 @@ if not DEBUG_MODE:
 
 # 資料庫設定
 DATABASE_URL = os.getenv('DATABASE_URL')  # PostgreSQL URL
-DATABASE_NAME = 'expense_tracker.db'  # SQLite fallback 
\ No newline at end of file
+DATABASE_NAME = os.getenv('DATABASE_NAME', 'expense_tracker.db')  # SQLite fallback（沒有 DATABASE_URL 時使用的檔案路徑）
+
+# 資料庫連線池設定
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # 等待可用連線的秒數
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))  # 閒置超過此秒數需先檢查
+
+# 顯示時間使用的時區（資料庫一律以 UTC 儲存）
+TIMEZONE = os.getenv('TIMEZONE', 'Asia/Taipei')
+
+# Webhook 背景處理設定
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 100))  # 等待執行的喚醒工作上限
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', 10))  # 關閉時等待佇列處理完畢的秒數
+
+# Webhook 事件收件匣（本機 SQLite，程式當掉時保留尚未處理完的事件）
+INBOX_DB_PATH = os.getenv('INBOX_DB_PATH', 'webhook_inbox.db')  # 收件匣 SQLite 檔案路徑
+INBOX_BATCH_SIZE = int(os.getenv('INBOX_BATCH_SIZE', 10))  # 工作執行緒每次認領的事件數
+INBOX_MAX_ATTEMPTS = int(os.getenv('INBOX_MAX_ATTEMPTS', 5))  # 處理失敗的最多嘗試次數
+INBOX_RETRY_DELAY = float(os.getenv('INBOX_RETRY_DELAY', 5))  # 第一次失敗後重試的等待秒數，之後每次加倍（預設共約 75 秒）
+INBOX_RETENTION_HOURS = float(os.getenv('INBOX_RETENTION_HOURS', 24))  # 已完成事件保留時數
+INBOX_MAX_PENDING = int(os.getenv('INBOX_MAX_PENDING', 1000))  # 待處理事件超過此數量時 /callback 回應 503
+
+# Webhook 事件去重（依 webhookEventId）
+WEBHOOK_DEDUPE_CACHE_SIZE = int(os.getenv('WEBHOOK_DEDUPE_CACHE_SIZE', 10000))  # 記憶體中保留的事件編號數量
+WEBHOOK_DEDUPE_TTL_HOURS = float(os.getenv('WEBHOOK_DEDUPE_TTL_HOURS', 24))  # 事件編號保存時數
+
+# LINE API 對外連線設定
+LINE_API_CONNECT_TIMEOUT = float(os.getenv('LINE_API_CONNECT_TIMEOUT', 3))  # 建立連線逾時秒數
+LINE_API_READ_TIMEOUT = float(os.getenv('LINE_API_READ_TIMEOUT', 10))  # 等待回應逾時秒數
+LINE_API_POOL_SIZE = int(os.getenv('LINE_API_POOL_SIZE', 10))  # 保留的 keep-alive 連線數
+LINE_API_MAX_RETRIES = int(os.getenv('LINE_API_MAX_RETRIES', 2))  # 連線錯誤的重試次數（GET 等冪等方法另含 5xx / 讀取逾時）
+LINE_API_RETRY_BACKOFF = float(os.getenv('LINE_API_RETRY_BACKOFF', 0.3))  # 重試退避基準秒數
+
+# 回覆期限：事件發生後超過此秒數（或 reply token 失效）改用 push 傳送
+REPLY_TOKEN_BUDGET_SECONDS = float(os.getenv('REPLY_TOKEN_BUDGET_SECONDS', 50))
+REPLY_TOKEN_MARGIN_SECONDS = float(os.getenv('REPLY_TOKEN_MARGIN_SECONDS', 2))  # 預留給 API 呼叫的時間
+
+# 管理儀表板：缺少的用戶資料以執行緒池並行向 LINE API 查詢
+ADMIN_PROFILE_FETCH_WORKERS = int(os.getenv('ADMIN_PROFILE_FETCH_WORKERS', 8))  # 同時查詢數（不超過 LINE_API_POOL_SIZE 較好）
+ADMIN_PROFILE_FETCH_LIMIT = int(os.getenv('ADMIN_PROFILE_FETCH_LIMIT', 200))  # 每次載入最多補抓的人數
+
+# 用戶資料快取：記憶體 LRU + user_profiles 資料表，過期的在背景重新查詢
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 5000))  # 記憶體保留的用戶數
+PROFILE_TTL_HOURS = float(os.getenv('PROFILE_TTL_HOURS', 24))  # 超過此時數在背景更新
+PROFILE_NEGATIVE_TTL_SECONDS = float(os.getenv('PROFILE_NEGATIVE_TTL_SECONDS', 60))  # 查詢失敗後第一次重試的間隔
+PROFILE_NEGATIVE_MAX_SECONDS = float(os.getenv('PROFILE_NEGATIVE_MAX_SECONDS', 3600))  # 重試間隔上限（指數退避）
+PROFILE_REFRESH_WORKERS = int(os.getenv('PROFILE_REFRESH_WORKERS', 2))  # 背景更新執行緒數
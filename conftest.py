@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+"""
+pytest 共用設定：測試使用暫存目錄中的 SQLite 檔案（支出資料庫與 webhook 收件匣），不寫入工作目錄
+
+需要在匯入 config 之前設定環境變數，因此放在 conftest 的模組層級。
+"""
+
+import os
+import shutil
+import tempfile
+
+TEST_DATA_DIR = tempfile.mkdtemp(prefix='expense_bot_test_')
+os.environ.setdefault('DATABASE_NAME', os.path.join(TEST_DATA_DIR, 'expense_tracker.db'))
+os.environ.setdefault('INBOX_DB_PATH', os.path.join(TEST_DATA_DIR, 'webhook_inbox.db'))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+資料庫連線池
+
+- PostgreSQL：有上限的連線池，取出閒置過久的連線時會先做健康檢查
+- SQLite：每個執行緒重用同一條連線
+
+取得的連線會包成 PooledConnection，呼叫 close() 時歸還連線池而不是真的關閉，
+所以舊有的 `conn = db.get_connection() ... conn.close()` 寫法不需要修改。
+"""
+
+import sqlite3
+import threading
+import time
+
+
+class PoolTimeoutError(Exception):
+    """等待可用連線逾時"""
+
+
+class PooledConnection:
+    """連線代理：close() 會把連線歸還給連線池"""
+
+    def __init__(self, pool, raw_connection):
+        self._pool = pool
+        self._raw = raw_connection
+        self._released = False
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self):
+        """歸還連線（重複呼叫不會有副作用）"""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            try:
+                self._raw.rollback()
+            except Exception:
+                pass
+        self.close()
+        return False
+
+
+class _PoolStats:
+    """連線池的等待時間統計"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds):
+        self.acquired += 1
+        self.total_wait += seconds
+        if seconds > self.max_wait:
+            self.max_wait = seconds
+
+    def as_dict(self):
+        return {
+            'acquired': self.acquired,
+            'created': self.created,
+            'discarded': self.discarded,
+            'timeouts': self.timeouts,
+            'total_wait_ms': round(self.total_wait * 1000, 3),
+            'avg_wait_ms': round(self.total_wait * 1000 / self.acquired, 3) if self.acquired else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+        }
+
+
+class PostgresConnectionPool:
+    """有上限的 PostgreSQL 連線池"""
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10.0, health_check_interval=30.0):
+        """
+        Args:
+            connect (callable): 建立新連線的函式
+            min_size (int): 啟動時預先建立的連線數
+            max_size (int): 連線數上限
+            timeout (float): 等待可用連線的秒數上限
+            health_check_interval (float): 閒置超過此秒數的連線，取出前先檢查
+        """
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # [(connection, 歸還時間)]
+        self._size = 0
+        self._in_use = 0
+        self._stats = _PoolStats()
+
+        for _ in range(min_size):
+            conn = self._create()
+            self._idle.append((conn, time.monotonic()))
+            self._size += 1
+
+    def _create(self):
+        conn = self._connect()
+        self._stats.created += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        self._stats.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """取得一條連線，連線池已滿時等待至多 timeout 秒"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            candidate = None
+            create_new = False
+
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats.timeouts += 1
+                        raise PoolTimeoutError(f"等待資料庫連線逾時 ({self.timeout}s)")
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    candidate = self._idle.pop()
+                else:
+                    self._size += 1
+                    create_new = True
+                self._in_use += 1
+
+            # 建立連線和健康檢查都在鎖外進行，避免卡住其他執行緒
+            if create_new:
+                try:
+                    conn = self._create()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                conn, idle_since = candidate
+                if not self._is_healthy(conn, idle_since):
+                    self._discard(conn)
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    continue
+
+            with self._cond:
+                self._stats.record_wait(time.monotonic() - started)
+            return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """歸還連線，未提交的交易會被 rollback"""
+        healthy = not conn.closed
+        if healthy:
+            try:
+                conn.rollback()
+            except Exception:
+                healthy = False
+
+        if not healthy:
+            self._discard(conn)
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+    def close_all(self):
+        """關閉所有閒置連線"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            data = {
+                'backend': 'postgresql',
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            }
+            data.update(self._stats.as_dict())
+        return data
+
+
+class SQLiteConnectionPool:
+    """SQLite 每個執行緒一條重用連線"""
+
+    def __init__(self, database, **connect_kwargs):
+        self.database = database
+        self._connect_kwargs = connect_kwargs
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}  # {thread: connection}
+        self._in_use = 0
+        self._stats = _PoolStats()
+
+    def _create(self):
+        # 已結束的執行緒不會再使用它的連線，順便清掉
+        with self._lock:
+            dead = [t for t in self._connections if not t.is_alive()]
+            stale = [self._connections.pop(t) for t in dead]
+        for conn in stale:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+        conn = sqlite3.connect(self.database, check_same_thread=False, **self._connect_kwargs)
+        with self._lock:
+            self._connections[threading.current_thread()] = conn
+            self._stats.created += 1
+        return conn
+
+    def acquire(self):
+        started = time.monotonic()
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = self._create()
+            self._local.connection = conn
+            self._local.depth = 0
+
+        self._local.depth += 1
+        with self._lock:
+            if self._local.depth == 1:
+                self._in_use += 1
+            self._stats.record_wait(time.monotonic() - started)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        # 同一執行緒可能巢狀取得連線，只有最外層歸還時才 rollback
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        with self._lock:
+            self._in_use -= 1
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), {}
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._connections)
+            data = {
+                'backend': 'sqlite',
+                'size': size,
+                'in_use': self._in_use,
+                'idle': size - self._in_use,
+            }
+            data.update(self._stats.as_dict())
+        return data
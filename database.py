@@ -1,33 +1,54 @@
 import sqlite3
 import os
-from datetime import datetime
-from config import DATABASE_NAME, DATABASE_URL
+import time
+import uuid
+from config import (
+    DATABASE_NAME, DATABASE_URL,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_HEALTH_CHECK_INTERVAL
+)
+from connection_pool import PostgresConnectionPool, SQLiteConnectionPool
+from sql_registry import SQLRegistry
+from timeutils import register_sqlite_types
+import migrations
 
 # 檢查是否有 PostgreSQL 支援
 try:
     import psycopg2
-    from psycopg2.extras import RealDictCursor
     HAS_POSTGRESQL = True
     print(f"🔧 DATABASE: psycopg2 導入成功 ✅")
 except ImportError as e:
     HAS_POSTGRESQL = False
     print(f"🔧 DATABASE: psycopg2 導入失敗 ❌ - {e}")
 
+# SQLite 讀寫時間欄位時自動轉換為帶時區的 datetime
+register_sqlite_types()
+
+class DuplicateEventError(Exception):
+    """批次寫入時有 webhook 事件已經處理過（整個交易已回滾）"""
+    
+    def __init__(self, event_ids):
+        super().__init__(f"事件已處理過: {', '.join(sorted(event_ids))}")
+        self.event_ids = set(event_ids)
+
 class ExpenseDatabase:
     def __init__(self):
         print(f"🔧 DATABASE: 初始化資料庫...")
         print(f"🔧 DATABASE: DATABASE_URL 是否存在: {'✅' if DATABASE_URL else '❌'}")
         print(f"🔧 DATABASE: PostgreSQL 支援: {'✅' if HAS_POSTGRESQL else '❌'}")
         
-        self.use_postgresql = DATABASE_URL and HAS_POSTGRESQL
+        self.use_postgresql = bool(DATABASE_URL and HAS_POSTGRESQL)
         print(f"🔧 DATABASE: 使用資料庫類型: {'PostgreSQL' if self.use_postgresql else 'SQLite'}")
         
         if self.use_postgresql:
             print(f"🔧 DATABASE: PostgreSQL 連線字串長度: {len(DATABASE_URL)}")
         
-        # 測試連線
+        # 所有查詢在啟動時依資料庫類型編譯一次
+        self.sql = SQLRegistry(self.use_postgresql)
+        
+        # 測試連線（同時建立連線池）
         try:
             print(f"🔧 DATABASE: 測試資料庫連線...")
+            self.pool = self._create_pool()
             conn = self.get_connection()
             print(f"🔧 DATABASE: 連線測試成功 ✅")
             conn.close()
@@ -38,584 +59,652 @@ class ExpenseDatabase:
         self.init_database()
         print(f"🔧 DATABASE: 資料庫初始化完成")
     
+    def _create_pool(self):
+        """建立連線池：PostgreSQL 使用有上限的連線池，SQLite 每個執行緒重用一條連線
+        
+        兩種資料庫都使用一般的 tuple cursor，查詢結果不需要再逐列轉換；
+        時間欄位一律以 UTC 讀寫，回傳帶時區的 datetime。
+        """
+        if self.use_postgresql:
+            return PostgresConnectionPool(
+                lambda: psycopg2.connect(DATABASE_URL, options='-c timezone=UTC'),
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                timeout=DB_POOL_TIMEOUT,
+                health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL
+            )
+        return SQLiteConnectionPool(
+            DATABASE_NAME,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+        )
+    
     def get_connection(self):
-        """取得資料庫連線"""
+        """從連線池取得資料庫連線
+        
+        回傳的連線呼叫 close() 時會歸還連線池；也可以用 `with` 區塊，
+        離開區塊時自動歸還（發生例外時會先 rollback）。
+        """
         try:
-            if self.use_postgresql:
-                return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-            else:
-                return sqlite3.connect(DATABASE_NAME)
+            return self.pool.acquire()
         except Exception as e:
             print(f"❌ DATABASE: 連線失敗 - {e}")
             raise e
     
+    def get_pool_stats(self):
+        """取得連線池統計（使用中、閒置、等待時間）"""
+        return self.pool.stats()
+    
+    def get_sql_stats(self):
+        """取得每個具名查詢的執行次數與耗時"""
+        return self.sql.stats()
+    
+    def close(self):
+        """關閉連線池中的所有連線"""
+        self.pool.close_all()
+    
     def init_database(self):
-        """初始化資料庫，建立必要的資料表"""
+        """初始化資料庫：套用尚未執行的結構遷移（版本已是最新時不執行任何 DDL）"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            print(f"🔧 DATABASE: 建立資料表...")
-            
-            if self.use_postgresql:
-                # PostgreSQL 語法
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS expenses (
-                        id SERIAL PRIMARY KEY,
-                        user_id TEXT NOT NULL,
-                        amount REAL NOT NULL,
-                        location TEXT,
-                        description TEXT,
-                        category TEXT,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS user_settings (
-                        user_id TEXT PRIMARY KEY,
-                        stats_reset_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # 新增用戶資料表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS user_profiles (
-                        user_id TEXT PRIMARY KEY,
-                        display_name TEXT,
-                        picture_url TEXT,
-                        status_message TEXT,
-                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                print(f"🔧 DATABASE: PostgreSQL 資料表建立完成")
-            else:
-                # SQLite 語法
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS expenses (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id TEXT NOT NULL,
-                        amount REAL NOT NULL,
-                        location TEXT,
-                        description TEXT,
-                        category TEXT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
+            with self.get_connection() as conn:
+                current = migrations.get_schema_version(conn, self.use_postgresql)
                 
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS user_settings (
-                        user_id TEXT PRIMARY KEY,
-                        stats_reset_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # 新增用戶資料表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS user_profiles (
-                        user_id TEXT PRIMARY KEY,
-                        display_name TEXT,
-                        picture_url TEXT,
-                        status_message TEXT,
-                        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
+                if current >= migrations.LATEST_VERSION:
+                    print(f"🔧 DATABASE: 資料庫結構已是最新版本 v{current}，略過遷移")
+                else:
+                    print(f"🔧 DATABASE: 資料庫結構 v{current} -> v{migrations.LATEST_VERSION}，開始遷移...")
+                    migrations.migrate(conn, self.use_postgresql)
+                    current = migrations.LATEST_VERSION
                 
-                print(f"🔧 DATABASE: SQLite 資料表建立完成")
-            
-            conn.commit()
-            conn.close()
-            
+                self.schema_version = current
+        
         except Exception as e:
             print(f"❌ DATABASE: 初始化失敗 - {e}")
             raise e
     
-    def add_expense(self, user_id, amount, location=None, description=None, category=None):
-        """新增支出記錄"""
-        conn = None
+    def add_expense(self, user_id, amount_cents, location=None, description=None, category=None):
+        """新增支出記錄（金額為整數分，見 money.to_cents）"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            if self.use_postgresql:
-                sql = '''
-                    INSERT INTO expenses (user_id, amount, location, description, category)
-                    VALUES (%s, %s, %s, %s, %s) RETURNING id
-                '''
-                params = (user_id, amount, location, description, category)
-                cursor.execute(sql, params)
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
                 
-                result = cursor.fetchone()
-                if result:
-                    # PostgreSQL psycopg2 返回的可能是 tuple 或 DictRow
-                    if isinstance(result, (list, tuple)):
-                        expense_id = result[0]
-                    else:
-                        # 如果是 DictRow 或其他類型，嘗試用 'id' 鍵
-                        expense_id = result['id'] if hasattr(result, '__getitem__') and 'id' in result else result[0]
-                else:
-                    expense_id = None
-            else:
-                sql = '''
-                    INSERT INTO expenses (user_id, amount, location, description, category)
-                    VALUES (?, ?, ?, ?, ?)
-                '''
-                params = (user_id, amount, location, description, category)
-                cursor.execute(sql, params)
-                expense_id = cursor.lastrowid
-            
-            conn.commit()
-            conn.close()
+                row = self.sql.fetchone(cursor, 'expenses.insert',
+                                        (user_id, amount_cents, location, description, category))
+                expense_id = row[0]
+                
+                # 同一個交易內更新每月彙總和當前統計
+                self.sql.execute(cursor, 'rollups.add_expense', (expense_id,))
+                self.sql.execute(cursor, 'current.add_expense', (expense_id,))
+                
+                conn.commit()
             return expense_id
-            
+        
         except Exception as e:
             print(f"❌ DATABASE: 新增支出記錄失敗 - {type(e).__name__}: {str(e)}")
-            if conn:
-                try:
-                    conn.rollback()
-                    conn.close()
-                except Exception as close_e:
-                    print(f"❌ DATABASE: 關閉連線時發生錯誤: {close_e}")
             raise e
     
-    def get_user_expenses(self, user_id, limit=10):
-        """取得用戶的支出記錄"""
-        conn = None
+    def add_expenses_bulk(self, rows):
+        """在同一個交易內批量新增支出記錄，回傳依序分配的記錄 ID
+
+        Args:
+            rows (list): 每筆為 dict，包含 user_id、amount_cents，
+                可選 location、description、category、timestamp（沒有時使用現在時間）
+
+        每月彙總與當前統計以集合運算一次更新，不逐筆累加。
+        """
+        params = [
+            (row['user_id'], row['amount_cents'], row.get('location'), row.get('description'),
+             row.get('category'), row.get('timestamp'))
+            for row in rows
+        ]
+        if not params:
+            return []
+        
+        started = time.perf_counter()
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            if self.use_postgresql:
-                cursor.execute('''
-                    SELECT id, amount, location, description, category, timestamp
-                    FROM expenses
-                    WHERE user_id = %s
-                    ORDER BY timestamp DESC
-                    LIMIT %s
-                ''', (user_id, limit))
-            else:
-                cursor.execute('''
-                    SELECT id, amount, location, description, category, timestamp
-                    FROM expenses
-                    WHERE user_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (user_id, limit))
-            
-            expenses = cursor.fetchall()
-            conn.close()
-            
-            # 轉換 PostgreSQL 結果為 list
-            if self.use_postgresql:
-                expenses = [tuple(expense.values()) for expense in expenses]
-            
-            return expenses
-            
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if not self.use_postgresql:
+                    # 先取得寫入鎖，AUTOINCREMENT 分配的 ID 在交易內是連續的
+                    cursor.execute('BEGIN IMMEDIATE')
+                expense_ids = self._insert_expenses(cursor, params)
+                conn.commit()
+        
         except Exception as e:
-            print(f"❌ DATABASE: 查詢用戶記錄失敗 - {type(e).__name__}: {str(e)}")
-            if conn:
-                try:
-                    conn.close()
-                except:
-                    pass
+            print(f"❌ DATABASE: 批量新增支出記錄失敗 - {type(e).__name__}: {str(e)}")
             raise e
+        
+        elapsed = time.perf_counter() - started
+        rate = len(expense_ids) / elapsed if elapsed > 0 else float('inf')
+        print(f"🔧 DATABASE: 批量新增 {len(expense_ids)} 筆，耗時 {elapsed * 1000:.1f} ms（{rate:,.0f} 筆/秒）")
+        return expense_ids
     
-    def get_monthly_summary(self, user_id, year, month):
-        """取得月度支出摘要"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _insert_expenses(self, cursor, params):
+        """以單一批量語句新增支出記錄並更新每月彙總與當前統計，回傳記錄 ID
         
-        start_date = f"{year}-{month:02d}-01"
-        if month == 12:
-            end_date = f"{year+1}-01-01"
-        else:
-            end_date = f"{year}-{month+1:02d}-01"
-        
-        cursor.execute('''
-            SELECT SUM(amount), COUNT(*), category
-            FROM expenses
-            WHERE user_id = %s AND timestamp >= %s AND timestamp < %s
-            GROUP BY category
-        ''' if self.use_postgresql else '''
-            SELECT SUM(amount), COUNT(*), category
-            FROM expenses
-            WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
-            GROUP BY category
-        ''', (user_id, start_date, end_date))
-        
-        summary = cursor.fetchall()
-        conn.close()
-        
-        # 轉換 PostgreSQL 結果為 list
+        SQLite 需由呼叫端先 BEGIN IMMEDIATE，ID 才會是連續的。
+        """
         if self.use_postgresql:
-            summary = [tuple(row.values()) for row in summary]
-        
-        return summary
+            result = self.sql.execute_values(cursor, 'expenses.insert_many', params, 'expenses.insert_many_row')
+            expense_ids = [row[0] for row in result]
+        else:
+            self.sql.executemany(cursor, 'expenses.insert_many', params)
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            expense_ids = list(range(last_id - len(params) + 1, last_id + 1))
+        
+        self.sql.execute(cursor, 'rollups.add_expenses', (expense_ids,))
+        self.sql.execute(cursor, 'current.init_for_expenses', (expense_ids,))
+        self.sql.execute(cursor, 'current.add_expenses', (expense_ids,))
+        return expense_ids
     
-    def delete_expense(self, expense_id, user_id):
-        """刪除支出記錄"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM expenses
-            WHERE id = %s AND user_id = %s
-        ''' if self.use_postgresql else '''
-            DELETE FROM expenses
-            WHERE id = ? AND user_id = ?
-        ''', (expense_id, user_id))
-        
-        conn.commit()
-        affected_rows = cursor.rowcount
-        conn.close()
+    def apply_expense_batch(self, inserts, deletes, event_ids=()):
+        """在同一個交易內新增與刪除多筆支出記錄（一次 commit）
+        
+        event_ids 在同一個交易內寫入 processed_events：記錄與事件編號一起 commit 或一起回滾，
+        程式在寫入後當掉、事件被重新處理時也不會重複記帳。
+        
+        Args:
+            inserts (list): 要新增的記錄，格式同 add_expenses_bulk
+            deletes (list): 要刪除的記錄 [(user_id, expense_id), ...]，只會刪除屬於該用戶的記錄
+            event_ids (list): 這批寫入來自的 webhook 事件編號
+        
+        Raises:
+            DuplicateEventError: 有事件已經處理過，整批不寫入
+        Returns:
+            tuple: (新增的記錄 ID 列表,
+                    {expense_id: 刪除前的記錄 (id, user_id, amount_cents, description, timestamp)}（不存在的不會出現）,
+                    實際刪除的記錄 ID 集合)
+        """
+        params = [
+            (row['user_id'], row['amount_cents'], row.get('location'), row.get('description'),
+             row.get('category'), row.get('timestamp'))
+            for row in inserts
+        ]
+        delete_ids = sorted({expense_id for _, expense_id in deletes})
+        if not params and not delete_ids and not event_ids:
+            return [], {}, set()
         
-        return affected_rows > 0
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if not self.use_postgresql:
+                    cursor.execute('BEGIN IMMEDIATE')
+                
+                if event_ids:
+                    marked = {row[0] for row in self.sql.fetchall(cursor, 'events.mark_processed', (list(event_ids),))}
+                    if len(marked) < len(set(event_ids)):
+                        raise DuplicateEventError(set(event_ids) - marked)
+                
+                expense_ids = self._insert_expenses(cursor, params) if params else []
+                
+                records = {}
+                deleted = set()
+                if delete_ids:
+                    records = {row[0]: row for row in self.sql.fetchall(cursor, 'expenses.get_many', (delete_ids,))}
+                    
+                    # 依用戶分組，每個用戶只刪除自己的記錄
+                    owned = {}
+                    for user_id, expense_id in deletes:
+                        record = records.get(expense_id)
+                        if record is not None and record[1] == user_id:
+                            owned.setdefault(user_id, set()).add(expense_id)
+                    
+                    for user_id, expense_id_set in owned.items():
+                        rows = self._delete_expenses(cursor, 'user_ids', (user_id, sorted(expense_id_set)),
+                                                     returning=True)
+                        deleted.update(row[0] for row in rows)
+                
+                conn.commit()
+        
+        except DuplicateEventError:
+            raise
+        except Exception as e:
+            print(f"❌ DATABASE: 批次寫入支出記錄失敗 - {type(e).__name__}: {str(e)}")
+            raise e
+        
+        return expense_ids, records, deleted
     
-    def get_monthly_total(self, user_id, year, month):
-        """取得指定月份的總支出金額"""
-        conn = None
+    def get_expense(self, expense_id):
+        """取得單筆支出記錄 (id, user_id, amount_cents, description, timestamp)，不存在時回傳 None"""
+        with self.get_connection() as conn:
+            return self.sql.fetchone(conn.cursor(), 'expenses.get', (expense_id,))
+    
+    def get_user_expenses(self, user_id, limit=10):
+        """取得用戶的支出記錄 (id, amount_cents, location, description, category, timestamp)"""
         try:
-            conn = self.get_connection()
+            with self.get_connection() as conn:
+                return self.sql.fetchall(conn.cursor(), 'expenses.recent_for_user', (user_id, limit))
+        
+        except Exception as e:
+            print(f"❌ DATABASE: 查詢用戶記錄失敗 - {type(e).__name__}: {str(e)}")
+            raise e
+    
+    def get_user_expenses_page(self, user_id, before_id=None, limit=10):
+        """以游標分頁取得用戶的支出記錄（新到舊，依記錄編號排序）
+
+        Args:
+            user_id (str): 用戶 ID
+            before_id (int): 只取編號小於此值的記錄；None 表示第一頁
+            limit (int): 每頁筆數
+
+        Returns:
+            tuple: (記錄列表, 下一頁的 before_id)，沒有下一頁時為 None
+        """
+        # 多取一筆判斷是否還有下一頁，每一頁的成本都相同
+        with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            start_date = f"{year}-{month:02d}-01"
-            if month == 12:
-                end_date = f"{year+1}-01-01"
+            if before_id is None:
+                rows = self.sql.fetchall(cursor, 'expenses.page_for_user', (user_id, limit + 1))
             else:
-                end_date = f"{year}-{month+1:02d}-01"
-            
-            if self.use_postgresql:
-                cursor.execute('''
-                    SELECT SUM(amount), COUNT(*)
-                    FROM expenses
-                    WHERE user_id = %s AND timestamp >= %s AND timestamp < %s
-                ''', (user_id, start_date, end_date))
-            else:
-                cursor.execute('''
-                    SELECT SUM(amount), COUNT(*)
-                    FROM expenses
-                    WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
-                ''', (user_id, start_date, end_date))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
+                rows = self.sql.fetchall(cursor, 'expenses.page_for_user_before', (user_id, before_id, limit + 1))
+        
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1][0]
+        return rows, None
+    
+    def browse_expenses(self, query):
+        """依 expense_browser.ExpenseQuery 取得一頁支出記錄（管理頁面使用）
+        
+        Returns:
+            tuple: ([(id, user_id, amount_cents, location, description, category, timestamp)],
+                    下一頁的游標)，沒有下一頁時游標為 None
+        """
+        name, sql, params = query.statement()
+        with self.get_connection() as conn:
+            rows = self.sql.fetchall(conn.cursor(), self.sql.ensure(name, sql), params)
+        
+        if len(rows) > query.limit:
+            rows = rows[:query.limit]
+            return rows, query.encode_cursor(rows[-1])
+        return rows, None
+    
+    def iter_expenses(self, query, batch_size=500):
+        """逐筆產生 ExpenseQuery 查到的記錄（含判斷下一頁用的多一筆），管理頁面串流輸出使用
+        
+        PostgreSQL 使用具名（伺服器端）游標，SQLite 以 fetchmany 分批讀取；
+        連線在產生器讀完或 close() 時才歸還。
+        """
+        name, sql, params = query.statement()
+        name = self.sql.ensure(name, sql)
+        with self.get_connection() as conn:
             if self.use_postgresql:
-                total_amount = result[0] if result[0] is not None else 0
-                total_count = result[1] if result[1] is not None else 0
+                cursor = conn.cursor(name=f"browse_{uuid.uuid4().hex}")
             else:
-                total_amount = result[0] if result[0] is not None else 0
-                total_count = result[1] if result[1] is not None else 0
+                cursor = conn.cursor()
+            try:
+                yield from self.sql.iterate(cursor, name, params, batch_size)
+            finally:
+                cursor.close()
+    
+    def get_max_expense_id(self):
+        """目前最大的記錄編號（沒有記錄時為 0），匯出時用來固定範圍"""
+        with self.get_connection() as conn:
+            return self.sql.fetchone(conn.cursor(), 'expenses.max_id')[0] or 0
+    
+    def get_user_total(self, user_id):
+        """取得用戶所有記錄的總金額（整數分）與筆數（讀取每月彙總表，不掃描記錄）"""
+        with self.get_connection() as conn:
+            total_cents, total_count = self.sql.fetchone(conn.cursor(), 'rollups.user_total', (user_id,))
+        return total_cents or 0, total_count or 0
+    
+    def get_user_summaries(self):
+        """取得每個用戶的記錄統計，最近有記錄的用戶在前
+        
+        Returns:
+            list: [(user_id, count, total_cents, last_record,
+                    display_name, picture_url, status_message, last_updated)]，
+                  沒有用戶資料時後四個欄位為 None
+        """
+        with self.get_connection() as conn:
+            return self.sql.fetchall(conn.cursor(), 'expenses.user_summaries')
+    
+    def get_monthly_summary(self, user_id, year, month):
+        """取得月度支出摘要（依分類，讀取每月彙總表）"""
+        with self.get_connection() as conn:
+            return self.sql.fetchall(conn.cursor(), 'rollups.month_by_category',
+                                     (user_id, f"{year}-{month:02d}"))
+    
+    def delete_expense(self, expense_id, user_id):
+        """刪除支出記錄（同時更新每月彙總）"""
+        with self.get_connection() as conn:
+            affected_rows = self._delete_expenses(conn.cursor(), 'one', (expense_id, user_id))
+            conn.commit()
+        
+        return affected_rows > 0
+    
+    def delete_user_expenses(self, user_id, expense_ids):
+        """在同一個交易內刪除用戶的多筆支出記錄（只會刪除屬於該用戶的）
+        
+        Returns:
+            list: 實際刪除的記錄 (id, user_id, amount_cents, description, timestamp)，依 ID 排序
+        """
+        if not expense_ids:
+            return []
+        
+        try:
+            with self.get_connection() as conn:
+                rows = self._delete_expenses(conn.cursor(), 'user_ids', (user_id, sorted(set(expense_ids))),
+                                             returning=True)
+                conn.commit()
+        
+        except Exception as e:
+            print(f"❌ DATABASE: 批量刪除支出記錄失敗 - {type(e).__name__}: {str(e)}")
+            raise e
+        
+        return sorted(rows)
+    
+    def delete_expenses_by_ids(self, expense_ids):
+        """依 ID 批量刪除支出記錄（管理員使用，不檢查擁有者），回傳刪除筆數"""
+        if not expense_ids:
+            return 0
+        
+        with self.get_connection() as conn:
+            deleted_count = self._delete_expenses(conn.cursor(), 'ids', (list(expense_ids),))
+            conn.commit()
+        
+        return deleted_count
+    
+    def get_monthly_total(self, user_id, year, month):
+        """取得指定月份的總支出金額（整數分）與筆數（讀取每月彙總表）"""
+        try:
+            with self.get_connection() as conn:
+                result = self.sql.fetchone(conn.cursor(), 'rollups.month_total',
+                                           (user_id, f"{year}-{month:02d}"))
             
-            return total_amount, total_count
+            total_cents = result[0] if result[0] is not None else 0
+            total_count = result[1] if result[1] is not None else 0
             
+            return total_cents, total_count
+        
         except Exception as e:
             print(f"❌ DATABASE: 查詢月度總計失敗 - {type(e).__name__}: {str(e)}")
-            if conn:
-                try:
-                    conn.close()
-                except:
-                    pass
             raise e
     
+    def get_monthly_totals(self, user_id, start_month, end_month):
+        """一次查詢取得區間內每個月的總金額與筆數（包含沒有記錄的月份）
+        
+        Args:
+            user_id (str): 用戶 ID；None 表示所有用戶
+            start_month (str): 起始月份 'YYYY-MM'（含）
+            end_month (str): 結束月份 'YYYY-MM'（含）
+        
+        Returns:
+            list: [(year, month, total_cents, total_count)]，由舊到新
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if user_id is None:
+                rows = self.sql.fetchall(cursor, 'rollups.range_all', (start_month, end_month))
+            else:
+                rows = self.sql.fetchall(cursor, 'rollups.range_for_user', (user_id, start_month, end_month))
+        
+        totals = {month: (cents or 0, count or 0) for month, cents, count in rows}
+        
+        result = []
+        year, month = (int(part) for part in start_month.split('-'))
+        end_year, end_month_number = (int(part) for part in end_month.split('-'))
+        while (year, month) <= (end_year, end_month_number):
+            cents, count = totals.get(f"{year}-{month:02d}", (0, 0))
+            result.append((year, month, cents, count))
+            month += 1
+            if month > 12:
+                month = 1
+                year += 1
+        
+        return result
+    
     def get_all_time_stats(self, user_id):
-        """取得用戶的總統計資料"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 總金額和總筆數
-        cursor.execute('''
-            SELECT SUM(amount), COUNT(*), MIN(timestamp), MAX(timestamp)
-            FROM expenses
-            WHERE user_id = %s
-        ''' if self.use_postgresql else '''
-            SELECT SUM(amount), COUNT(*), MIN(timestamp), MAX(timestamp)
-            FROM expenses
-            WHERE user_id = ?
-        ''', (user_id,))
-        
-        total_result = cursor.fetchone()
-        
-        # 每月統計
-        if self.use_postgresql:
-            cursor.execute('''
-                SELECT to_char(timestamp, 'YYYY-MM') as month, SUM(amount), COUNT(*)
-                FROM expenses
-                WHERE user_id = %s
-                GROUP BY to_char(timestamp, 'YYYY-MM')
-                ORDER BY month DESC
-                LIMIT 12
-            ''', (user_id,))
-        else:
-            cursor.execute('''
-                SELECT strftime('%Y-%m', timestamp) as month, SUM(amount), COUNT(*)
-                FROM expenses
-                WHERE user_id = ?
-                GROUP BY strftime('%Y-%m', timestamp)
-                ORDER BY month DESC
-                LIMIT 12
-            ''', (user_id,))
-        
-        monthly_stats = cursor.fetchall()
-        conn.close()
-        
-        if self.use_postgresql:
-            total_amount = total_result[0] or 0
-            total_count = total_result[1] or 0
-            first_record = total_result[2]
-            last_record = total_result[3]
-            monthly_stats = [tuple(row.values()) for row in monthly_stats]
-        else:
-            total_amount = total_result[0] or 0
-            total_count = total_result[1] or 0
-            first_record = total_result[2]
-            last_record = total_result[3]
+        """取得用戶的總統計資料（金額與筆數讀取每月彙總表）"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 總金額和總筆數
+            total_result = self.sql.fetchone(cursor, 'rollups.total_for_user', (user_id,))
+            
+            # 第一筆和最後一筆的時間，走 (user_id, timestamp) 索引
+            range_result = self.sql.fetchone(cursor, 'expenses.time_range_for_user', (user_id,))
+            
+            # 每月統計
+            monthly_stats = self.sql.fetchall(cursor, 'rollups.recent_months_for_user', (user_id, 12))
         
         return {
-            'total_amount': total_amount,
-            'total_count': total_count,
-            'first_record': first_record,
-            'last_record': last_record,
+            'total_cents': total_result[0] or 0,
+            'total_count': total_result[1] or 0,
+            'first_record': range_result[0],
+            'last_record': range_result[1],
             'monthly_stats': monthly_stats
         }
     
     def clear_all_expenses(self, user_id):
         """清空用戶的所有支出記錄"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 先取得記錄數量
-        cursor.execute('''
-            SELECT COUNT(*) FROM expenses WHERE user_id = %s
-        ''' if self.use_postgresql else '''
-            SELECT COUNT(*) FROM expenses WHERE user_id = ?
-        ''', (user_id,))
-        
-        count_before = cursor.fetchone()[0]
-        
-        # 刪除所有記錄
-        cursor.execute('''
-            DELETE FROM expenses WHERE user_id = %s
-        ''' if self.use_postgresql else '''
-            DELETE FROM expenses WHERE user_id = ?
-        ''', (user_id,))
-        
-        conn.commit()
-        affected_rows = cursor.rowcount
-        conn.close()
-        
-        return count_before, affected_rows
-    
-    def get_current_stats(self, user_id):
-        """取得當前統計金額（從重置日期開始計算）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 取得重置日期
-        cursor.execute('''
-            SELECT stats_reset_date FROM user_settings WHERE user_id = %s
-        ''' if self.use_postgresql else '''
-            SELECT stats_reset_date FROM user_settings WHERE user_id = ?
-        ''', (user_id,))
-        
-        reset_result = cursor.fetchone()
-        
-        if reset_result:
-            # 處理 PostgreSQL DictRow 和 SQLite tuple 的差異
-            if self.use_postgresql:
-                reset_date = reset_result['stats_reset_date'] if hasattr(reset_result, '__getitem__') and 'stats_reset_date' in reset_result else reset_result[0]
-            else:
-                reset_date = reset_result[0]
-        else:
-            # 如果沒有設定，創建設定並使用第一筆記錄的時間
-            cursor.execute('''
-                SELECT MIN(timestamp) FROM expenses WHERE user_id = %s
-            ''' if self.use_postgresql else '''
-                SELECT MIN(timestamp) FROM expenses WHERE user_id = ?
-            ''', (user_id,))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
             
-            first_record = cursor.fetchone()
+            # 先取得記錄數量
+            count_before = self.sql.fetchone(cursor, 'expenses.count_for_user', (user_id,))[0]
             
-            # 處理 first_record 的類型差異
-            if first_record:
-                if self.use_postgresql:
-                    reset_date = first_record['min'] if hasattr(first_record, '__getitem__') and 'min' in first_record else first_record[0]
-                else:
-                    reset_date = first_record[0]
-            else:
-                reset_date = None
-            
-            if not reset_date:
-                reset_date = datetime.now().isoformat()
+            # 刪除所有記錄及每月彙總
+            affected_rows = self.sql.execute(cursor, 'expenses.delete_for_user', (user_id,)).rowcount
+            self.sql.execute(cursor, 'rollups.delete_for_user', (user_id,))
+            self.sql.execute(cursor, 'current.clear_for_user', (user_id,))
             
-            # 創建用戶設定
-            if self.use_postgresql:
-                cursor.execute('''
-                    INSERT INTO user_settings (user_id, stats_reset_date)
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id) DO UPDATE SET stats_reset_date = EXCLUDED.stats_reset_date
-                ''', (user_id, reset_date))
-            else:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO user_settings (user_id, stats_reset_date)
-                    VALUES (?, ?)
-                ''', (user_id, reset_date))
             conn.commit()
         
-        # 計算重置日期之後的統計
-        cursor.execute('''
-            SELECT SUM(amount), COUNT(*), MIN(timestamp), MAX(timestamp)
-            FROM expenses
-            WHERE user_id = %s AND timestamp >= %s
-        ''' if self.use_postgresql else '''
-            SELECT SUM(amount), COUNT(*), MIN(timestamp), MAX(timestamp)
-            FROM expenses
-            WHERE user_id = ? AND timestamp >= ?
-        ''', (user_id, reset_date))
+        return count_before, affected_rows
+    
+    def _delete_expenses(self, cursor, scope, params, returning=False):
+        """刪除符合範圍的支出記錄，並在同一個交易內扣除每月彙總和當前統計，回傳刪除筆數
+        
+        scope 對應 sql_registry.DELETE_SCOPES（'one': 指定用戶的單筆、'ids': 依 ID 清單、
+        'user_ids': 指定用戶的 ID 清單）。returning=True 時以 DELETE ... RETURNING
+        回傳刪除的記錄 (id, user_id, amount_cents, description, timestamp) 列表。
+        """
+        affected_users = [row[0] for row in self.sql.fetchall(cursor, f'expenses.affected_users.{scope}', params)]
+        if not affected_users:
+            return [] if returning else 0
+        
+        self.sql.execute(cursor, f'rollups.subtract.{scope}', params)
+        self.sql.execute(cursor, f'current.subtract.{scope}', params)
+        if returning:
+            result = self.sql.fetchall(cursor, f'expenses.delete_returning.{scope}', params)
+        else:
+            result = self.sql.execute(cursor, f'expenses.delete.{scope}', params).rowcount
+        self.sql.execute(cursor, 'rollups.purge_empty')
         
-        result = cursor.fetchone()
-        conn.close()
+        # 刪除的可能是第一筆或最後一筆，走 (user_id, timestamp) 索引重新取得
+        self.sql.execute(cursor, 'current.refresh_bounds', (affected_users,))
         
-        if self.use_postgresql:
-            # 處理 PostgreSQL DictRow
-            if hasattr(result, 'keys'):
-                # 如果是 DictRow，使用欄位名稱
-                total_amount = result.get('sum', 0) or 0
-                total_count = result.get('count', 0) or 0
-                first_record = result.get('min')
-                last_record = result.get('max')
-            else:
-                # 如果是 tuple，使用索引
-                total_amount = result[0] or 0
-                total_count = result[1] or 0
-                first_record = result[2]
-                last_record = result[3]
-        else:
-            total_amount = result[0] or 0
-            total_count = result[1] or 0
-            first_record = result[2]
-            last_record = result[3]
+        return result
+    
+    def check_monthly_rollups(self):
+        """比對每月彙總表與 expenses 重新計算的結果，回傳不一致的項目"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            stored_rows = self.sql.fetchall(cursor, 'rollups.stored')
+            expected_rows = self.sql.fetchall(cursor, 'rollups.expected')
+        
+        stored = {tuple(row[:3]): (row[3], row[4]) for row in stored_rows}
+        expected = {tuple(row[:3]): (row[3], row[4]) for row in expected_rows}
+        
+        mismatches = []
+        for key in sorted(set(stored) | set(expected)):
+            stored_sum, stored_count = stored.get(key, (0, 0))
+            expected_sum, expected_count = expected.get(key, (0, 0))
+            if (stored_sum, stored_count) != (expected_sum, expected_count):
+                mismatches.append({
+                    'user_id': key[0],
+                    'month': key[1],
+                    'category': key[2],
+                    'stored': (stored_sum, stored_count),
+                    'expected': (expected_sum, expected_count)
+                })
+        return mismatches
+    
+    def rebuild_monthly_rollups(self):
+        """從 expenses 重新計算整張每月彙總表，回傳重建後的列數"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            self.sql.execute(cursor, 'rollups.delete_all')
+            row_count = self.sql.execute(cursor, 'rollups.rebuild').rowcount
+            conn.commit()
         
+        return row_count
+    
+    def get_current_stats(self, user_id):
+        """取得當前統計金額（從重置日期開始累計，單一主鍵查詢）"""
+        with self.get_connection() as conn:
+            result = self.sql.fetchone(conn.cursor(), 'current.get', (user_id,))
+        
+        if result is None:
+            # 還沒有任何記錄
+            return {
+                'total_cents': 0,
+                'total_count': 0,
+                'first_record': None,
+                'last_record': None,
+                'reset_date': None
+            }
+        
+        reset_date, total_cents, total_count, first_record, last_record = result
         return {
-            'total_amount': total_amount,
-            'total_count': total_count,
+            'total_cents': total_cents or 0,
+            'total_count': total_count or 0,
             'first_record': first_record,
             'last_record': last_record,
             'reset_date': reset_date
         }
     
     def reset_current_stats(self, user_id):
-        """重置當前統計（更新重置日期為現在）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 取得重置前的統計
-        current_stats = self.get_current_stats(user_id)
-        
-        # 更新重置日期為現在
-        reset_date = datetime.now().isoformat()
-        
-        if self.use_postgresql:
-            cursor.execute('''
-                INSERT INTO user_settings (user_id, stats_reset_date)
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) DO UPDATE SET stats_reset_date = EXCLUDED.stats_reset_date
-            ''', (user_id, reset_date))
-        else:
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_settings (user_id, stats_reset_date)
-                VALUES (?, ?)
-            ''', (user_id, reset_date))
-        
-        conn.commit()
-        conn.close()
-        
-        return current_stats
-    
-    def save_user_profile(self, user_id, display_name, picture_url, status_message):
-        """儲存或更新用戶資料"""
-        conn = None
-        try:
-            conn = self.get_connection()
+        """重置當前統計（重置日期改為現在、累計歸零），回傳重置前的統計"""
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             
             if self.use_postgresql:
-                cursor.execute('''
-                    INSERT INTO user_profiles (user_id, display_name, picture_url, status_message)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (user_id) DO UPDATE SET
-                        display_name = EXCLUDED.display_name,
-                        picture_url = EXCLUDED.picture_url,
-                        status_message = EXCLUDED.status_message,
-                        last_updated = CURRENT_TIMESTAMP
-                ''', (user_id, display_name, picture_url, status_message))
+                old = self.sql.fetchone(cursor, 'current.reset', (user_id,))
             else:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO user_profiles (user_id, display_name, picture_url, status_message)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, display_name, picture_url, status_message))
+                # SQLite 的 RETURNING 只能取得新值，改用 BEGIN IMMEDIATE 取得寫入鎖後讀舊值再更新
+                cursor.execute('BEGIN IMMEDIATE')
+                old = self.sql.fetchone(cursor, 'current.get', (user_id,))
+                self.sql.execute(cursor, 'current.reset', (user_id,))
             
-            conn.commit()
-            conn.close()
+            if old is None:
+                # 沒有設定的用戶：建立一筆從現在開始統計的設定
+                self.sql.execute(cursor, 'current.create_if_missing', (user_id,))
+                old = (None, 0, 0, None, None)
             
+            conn.commit()
+        
+        reset_date, total_cents, total_count, first_record, last_record = old
+        return {
+            'total_cents': total_cents or 0,
+            'total_count': total_count or 0,
+            'first_record': first_record,
+            'last_record': last_record,
+            'reset_date': reset_date
+        }
+    
+    def save_user_profile(self, user_id, display_name, picture_url, status_message):
+        """儲存或更新用戶資料"""
+        try:
+            with self.get_connection() as conn:
+                self.sql.execute(conn.cursor(), 'profiles.upsert',
+                                 (user_id, display_name, picture_url, status_message))
+                conn.commit()
+        
         except Exception as e:
             print(f"❌ DATABASE: 儲存用戶資料失敗 - {e}")
-            if conn:
-                try:
-                    conn.close()
-                except:
-                    pass
             raise e
     
+    def save_user_profiles(self, profiles):
+        """以一個批量 upsert 儲存多位用戶的資料
+        
+        Args:
+            profiles (dict): {user_id: {'display_name', 'picture_url', 'status_message'}}
+        """
+        rows = [
+            (user_id, profile['display_name'], profile['picture_url'], profile['status_message'])
+            for user_id, profile in profiles.items()
+        ]
+        if not rows:
+            return
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if self.use_postgresql:
+                    self.sql.execute_values(cursor, 'profiles.upsert_many', rows, 'profiles.upsert_many_row')
+                else:
+                    self.sql.executemany(cursor, 'profiles.upsert_many', rows)
+                conn.commit()
+        
+        except Exception as e:
+            print(f"❌ DATABASE: 批量儲存用戶資料失敗 - {e}")
+            raise e
+    
+    def get_user_profiles(self, user_ids):
+        """一次查詢取得多位用戶的資料
+        
+        Returns:
+            dict: {user_id: ({'display_name', 'picture_url', 'status_message'}, last_updated)}，
+                  沒有資料的用戶不會出現
+        """
+        if not user_ids:
+            return {}
+        
+        with self.get_connection() as conn:
+            rows = self.sql.fetchall(conn.cursor(), 'profiles.get_many', (list(user_ids),))
+        
+        return {
+            user_id: ({'display_name': display_name, 'picture_url': picture_url,
+                       'status_message': status_message}, last_updated)
+            for user_id, display_name, picture_url, status_message, last_updated in rows
+        }
+    
     def get_user_profile(self, user_id):
         """從資料庫取得用戶資料"""
-        conn = None
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            if self.use_postgresql:
-                cursor.execute('''
-                    SELECT display_name, picture_url, status_message, last_updated
-                    FROM user_profiles
-                    WHERE user_id = %s
-                ''', (user_id,))
-            else:
-                cursor.execute('''
-                    SELECT display_name, picture_url, status_message, last_updated
-                    FROM user_profiles
-                    WHERE user_id = ?
-                ''', (user_id,))
-            
-            result = cursor.fetchone()
-            conn.close()
+            with self.get_connection() as conn:
+                result = self.sql.fetchone(conn.cursor(), 'profiles.get', (user_id,))
             
             if result:
-                if self.use_postgresql:
-                    return {
-                        'display_name': result['display_name'],
-                        'picture_url': result['picture_url'],
-                        'status_message': result['status_message'],
-                        'last_updated': result['last_updated']
-                    }
-                else:
-                    return {
-                        'display_name': result[0],
-                        'picture_url': result[1],
-                        'status_message': result[2],
-                        'last_updated': result[3]
-                    }
+                return {
+                    'display_name': result[0],
+                    'picture_url': result[1],
+                    'status_message': result[2],
+                    'last_updated': result[3]
+                }
             else:
                 return None
-                
+        
         except Exception as e:
             print(f"❌ DATABASE: 查詢用戶資料失敗 - {e}")
-            if conn:
-                try:
-                    conn.close()
-                except:
-                    pass
-            return None 
\ No newline at end of file
+            return None
+    
+    def mark_events_processed(self, event_ids):
+        """記錄 webhook 事件編號，回傳這次新記錄的編號集合（不在集合中的就是重送的事件）"""
+        if not event_ids:
+            return set()
+        
+        with self.get_connection() as conn:
+            rows = self.sql.fetchall(conn.cursor(), 'events.mark_processed', (list(event_ids),))
+            conn.commit()
+        
+        return {row[0] for row in rows}
+    
+    def get_processed_events(self, event_ids):
+        """回傳 event_ids 中已經處理過的事件編號集合"""
+        if not event_ids:
+            return set()
+        
+        with self.get_connection() as conn:
+            rows = self.sql.fetchall(conn.cursor(), 'events.get_processed', (list(event_ids),))
+        
+        return {row[0] for row in rows}
+    
+    def purge_processed_events(self, before):
+        """刪除 before（datetime）之前記錄的事件編號，回傳刪除筆數"""
+        with self.get_connection() as conn:
+            deleted = self.sql.execute(conn.cursor(), 'events.purge', (before,)).rowcount
+            conn.commit()
+        
+        return deleted
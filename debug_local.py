@@ -16,6 +16,8 @@ os.environ['DEBUG_MODE'] = 'true'
 # 確保可以導入模組
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from money import format_amount
+
 def test_database_connection():
     """測試資料庫連線"""
     print("🔍 測試資料庫連線...")
@@ -78,12 +80,12 @@ def test_add_expense(db, parser):
         parsed = parser.parse_message(msg)
         print(f"  解析結果: {parsed}")
         
-        if parsed['amount'] and parsed['amount'] > 0:
+        if parsed['amount_cents'] and parsed['amount_cents'] > 0:
             try:
                 # 新增到資料庫
                 expense_id = db.add_expense(
                     user_id=test_user_id,
-                    amount=parsed['amount'],
+                    amount_cents=parsed['amount_cents'],
                     location=parsed.get('reason', ''),  # 使用 reason 作為 location
                     description=parsed['description'],
                     category=None
@@ -107,7 +109,7 @@ def test_query_expenses(db):
         print(f"✅ 查詢到 {len(expenses)} 筆記錄:")
         
         for i, expense in enumerate(expenses, 1):
-            print(f"  {i}. ID: {expense[0]}, 金額: {expense[1]}, 地點: {expense[2]}, 描述: {expense[3]}, 時間: {expense[5]}")
+            print(f"  {i}. ID: {expense[0]}, 金額: {format_amount(expense[1])}, 地點: {expense[2]}, 描述: {expense[3]}, 時間: {expense[5]}")
             
     except Exception as e:
         print(f"❌ 查詢記錄失敗: {e}")
@@ -137,7 +139,7 @@ def interactive_mode(db, parser):
                     expenses = db.get_user_expenses(test_user_id, limit=5)
                     print(f"\n📋 最近 {len(expenses)} 筆記錄:")
                     for i, expense in enumerate(expenses, 1):
-                        print(f"  {i}. {expense[1]}元 - {expense[3]} ({expense[2]}) - {expense[5]}")
+                        print(f"  {i}. {format_amount(expense[1])}元 - {expense[3]} ({expense[2]}) - {expense[5]}")
                 except Exception as e:
                     print(f"❌ 查詢失敗: {e}")
                 continue
@@ -149,11 +151,11 @@ def interactive_mode(db, parser):
             parsed = parser.parse_message(msg)
             print(f"🔍 解析結果: {parsed}")
             
-            if parsed['amount'] and parsed['amount'] > 0:
+            if parsed['amount_cents'] and parsed['amount_cents'] > 0:
                 try:
                     expense_id = db.add_expense(
                         user_id=test_user_id,
-                        amount=parsed['amount'],
+                        amount_cents=parsed['amount_cents'],
                         location=parsed.get('reason', ''),  # 使用 reason 作為 location
                         description=parsed['description'],
                         category=None
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 事件去重
+
+LINE 在沒收到回應或逾時時會重送同一個事件（webhookEventId 相同）。
+
+- /callback 只查記憶體中的 LRU（有數量上限），擋下短時間內的重送，不增加資料庫延遲
+- 工作執行緒處理前以 processed_events 判斷事件是否已處理過；
+  記帳 / 刪除的事件編號與支出記錄在同一個交易內寫入（ExpenseDatabase.apply_expense_batch），
+  事件只有在寫入成功後才算處理過，程式當掉時不會遺失，也不會重複記帳
+- 記錄超過保存時間後過期，資料表定期清理，不會無限成長
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+
+class EventDeduplicator:
+    """以 webhookEventId 判斷事件是否已收過"""
+
+    def __init__(self, db, max_size=10000, ttl_seconds=86400, purge_interval=3600):
+        """
+        Args:
+            db (ExpenseDatabase): 存放 processed_events 的資料庫
+            max_size (int): 記憶體 LRU 保留的事件編號數量上限
+            ttl_seconds (float): 事件編號的保存秒數，超過後視為新事件
+            purge_interval (float): 清理資料表過期記錄的間隔秒數
+        """
+        self.db = db
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()  # {event_id: 記錄時間}
+        self._last_purge = time.monotonic()
+
+        self._accepted = 0
+        self._memory_hits = 0
+        self._db_hits = 0
+        self._purged = 0
+
+    def _remember(self, event_ids, now):
+        # 呼叫端需持有 self._lock
+        for event_id in event_ids:
+            self._seen[event_id] = now
+            self._seen.move_to_end(event_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    def filter_new(self, events):
+        """過濾掉記憶體中最近收過的事件（原始 JSON dict），回傳新的事件（不查資料庫）
+
+        沒有 webhookEventId 的事件無法判斷，一律視為新事件。
+        """
+        now = time.monotonic()
+        accepted = []
+        with self._lock:
+            for event in events:
+                event_id = event.get('webhookEventId')
+                if not event_id:
+                    accepted.append(event)
+                    continue
+                seen_at = self._seen.get(event_id)
+                if seen_at is not None and now - seen_at < self.ttl_seconds:
+                    # 同一個 body 內重複的編號也在這裡擋下
+                    self._memory_hits += 1
+                    self._seen.move_to_end(event_id)
+                    continue
+                self._remember([event_id], now)
+                accepted.append(event)
+            self._accepted += len(accepted)
+        return accepted
+
+    def forget(self, events):
+        """撤銷記憶體中的事件記錄（事件未能寫入收件匣，需要讓 LINE 重送時使用）"""
+        with self._lock:
+            for event in events:
+                self._seen.pop(event.get('webhookEventId'), None)
+
+    def processed(self, event_ids):
+        """回傳 event_ids 中已經處理過（記錄在 processed_events）的事件編號集合"""
+        processed = self.db.get_processed_events(list(event_ids)) if event_ids else set()
+        with self._lock:
+            self._db_hits += len(processed)
+        self._maybe_purge()
+        return processed
+
+    def mark_processed(self, event_ids):
+        """記錄已處理完的非寫入事件（查詢、postback）
+
+        記帳 / 刪除的事件已在寫入交易中記錄，重複記錄會被忽略。
+        記錄失敗只會讓重送的事件多回覆一次，因此不拋出錯誤。
+        """
+        if event_ids:
+            try:
+                self.db.mark_events_processed(list(event_ids))
+            except Exception as e:
+                print(f"❌ DEDUPE: 記錄已處理事件失敗 - {type(e).__name__}: {e}")
+        self._maybe_purge()
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < self.purge_interval:
+                return
+            self._last_purge = now
+        self.purge()
+
+    def purge(self):
+        """刪除過期的事件編號記錄，回傳刪除筆數"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+        try:
+            deleted = self.db.purge_processed_events(cutoff)
+        except Exception as e:
+            print(f"❌ DEDUPE: 清理過期事件記錄失敗 - {type(e).__name__}: {e}")
+            return 0
+        with self._lock:
+            self._purged += deleted
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cache_size': len(self._seen),
+                'max_cache_size': self.max_size,
+                'accepted': self._accepted,
+                'duplicates_in_memory': self._memory_hits,
+                'duplicates_in_db': self._db_hits,
+                'purged': self._purged,
+            }
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 事件收件匣（本機 SQLite）
+
+/callback 驗證簽章後先把事件原始 JSON 寫進收件匣（一次交易），再回應 LINE；
+工作執行緒批次認領（claim）事件、處理完後標記完成。
+程式在處理途中當掉時，事件仍留在收件匣，下次啟動時 recover() 會把它們放回待處理。
+
+狀態：pending（待處理）→ claimed（處理中）→ done（完成）/ failed（超過重試次數）
+處理失敗（例如資料庫暫時無法連線）的事件放回待處理，等待時間每次加倍（available_at）後才會再被認領。
+"""
+
+import json
+import os
+import time
+
+from connection_pool import SQLiteConnectionPool
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS webhook_inbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id TEXT,
+        payload TEXT NOT NULL,
+        received_at REAL NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        claimed_pid INTEGER,
+        claimed_by TEXT,
+        claimed_at REAL,
+        finished_at REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        available_at REAL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_webhook_inbox_status ON webhook_inbox(status, id)',
+]
+
+# 舊版收件匣檔案缺少的欄位
+COLUMNS = {
+    'available_at': 'ALTER TABLE webhook_inbox ADD COLUMN available_at REAL',
+}
+
+
+def _pid_alive(pid):
+    """檢查行程是否仍在執行"""
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class EventInbox:
+    """以 SQLite 檔案保存尚未處理完的 webhook 事件"""
+
+    def __init__(self, path, max_attempts=3, retention_hours=24, retry_delay=0):
+        """
+        Args:
+            path (str): SQLite 檔案路徑
+            max_attempts (int): 處理失敗時的最多嘗試次數，超過後標記為 failed
+            retention_hours (float): 已完成事件保留的時數
+            retry_delay (float): 第一次失敗後重試前的等待秒數，之後每次失敗加倍
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention_seconds = retention_hours * 3600
+        # autocommit：每個 UPDATE 各自是一個原子操作，需要多筆一起寫入時再明確 BEGIN
+        self.pool = SQLiteConnectionPool(path, timeout=30, isolation_level=None)
+
+        with self.pool.acquire() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(webhook_inbox)').fetchall()}
+            for column, statement in COLUMNS.items():
+                if column not in existing:
+                    conn.execute(statement)
+
+    def append(self, events):
+        """寫入一個 webhook 的所有事件（原始 JSON dict），回傳收件匣編號"""
+        now = time.time()
+        ids = []
+        with self.pool.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                for event in events:
+                    cursor.execute(
+                        'INSERT INTO webhook_inbox (event_id, payload, received_at) VALUES (?, ?, ?)',
+                        (event.get('webhookEventId'), json.dumps(event, ensure_ascii=False), now)
+                    )
+                    ids.append(cursor.lastrowid)
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+        return ids
+
+    def claim(self, worker, limit=10):
+        """認領最多 limit 筆待處理事件，回傳 [(inbox_id, event_dict, attempts), ...]（依收到順序）
+
+        等待重試中（available_at 未到）的事件不會被認領。
+        """
+        now = time.time()
+        with self.pool.acquire() as conn:
+            rows = conn.execute(
+                '''
+                UPDATE webhook_inbox
+                SET status = ?, claimed_pid = ?, claimed_by = ?, claimed_at = ?, attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM webhook_inbox
+                    WHERE status = ? AND (available_at IS NULL OR available_at <= ?)
+                    ORDER BY id LIMIT ?
+                )
+                RETURNING id, payload, attempts
+                ''',
+                (CLAIMED, os.getpid(), worker, now, PENDING, now, limit)
+            ).fetchall()
+        return [(row[0], json.loads(row[1]), row[2]) for row in sorted(rows)]
+
+    def complete(self, ids):
+        """標記事件處理完成"""
+        if not ids:
+            return
+        with self.pool.acquire() as conn:
+            conn.execute(
+                '''
+                UPDATE webhook_inbox SET status = ?, finished_at = ?, last_error = NULL
+                WHERE id IN (SELECT value FROM json_each(?))
+                ''',
+                (DONE, time.time(), json.dumps(list(ids)))
+            )
+
+    def fail(self, inbox_id, error):
+        """記錄處理失敗；未超過嘗試次數時放回待處理，否則標記為 failed
+
+        放回待處理的事件要等 retry_delay × 2^(attempts-1) 秒後才會再被認領。
+
+        Returns:
+            bool: 事件是否還會重試
+        """
+        now = time.time()
+        with self.pool.acquire() as conn:
+            row = conn.execute(
+                '''
+                UPDATE webhook_inbox
+                SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    finished_at = ?, last_error = ?, available_at = ? + ? * (1 << (attempts - 1))
+                WHERE id = ?
+                RETURNING status
+                ''',
+                (self.max_attempts, FAILED, PENDING, now, f"{type(error).__name__}: {error}",
+                 now, self.retry_delay, inbox_id)
+            ).fetchone()
+        return row is not None and row[0] == PENDING
+
+    def next_retry_in(self):
+        """距離下一筆等待重試的事件可以認領的秒數；沒有等待中的事件時回傳 None"""
+        now = time.time()
+        with self.pool.acquire() as conn:
+            available_at = conn.execute(
+                'SELECT MIN(available_at) FROM webhook_inbox WHERE status = ? AND available_at > ?',
+                (PENDING, now)
+            ).fetchone()[0]
+        return available_at - now if available_at else None
+
+    def recover(self):
+        """啟動時把已結束行程認領但未完成的事件放回待處理，並清除過期的完成記錄
+
+        Returns:
+            int: 目前待處理的事件數
+        """
+        with self.pool.acquire() as conn:
+            pids = [row[0] for row in conn.execute(
+                'SELECT DISTINCT claimed_pid FROM webhook_inbox WHERE status = ?', (CLAIMED,)
+            ).fetchall()]
+            current = os.getpid()
+            dead = [pid for pid in pids if pid == current or not _pid_alive(pid)]
+
+            recovered = 0
+            for pid in dead:
+                recovered += conn.execute(
+                    '''
+                    UPDATE webhook_inbox SET status = ?, claimed_pid = NULL, claimed_by = NULL, claimed_at = NULL
+                    WHERE status = ? AND claimed_pid IS ?
+                    ''',
+                    (PENDING, CLAIMED, pid)
+                ).rowcount
+            if recovered:
+                print(f"🔧 INBOX: 找回 {recovered} 筆處理中斷的事件")
+
+        self.purge()
+        pending = self.stats()['pending']
+        if pending:
+            print(f"🔧 INBOX: 有 {pending} 筆待處理事件，將重新處理")
+        return pending
+
+    def purge(self):
+        """刪除超過保留時間的已完成事件（failed 保留供檢查）"""
+        with self.pool.acquire() as conn:
+            return conn.execute(
+                'DELETE FROM webhook_inbox WHERE status = ? AND finished_at < ?',
+                (DONE, time.time() - self.retention_seconds)
+            ).rowcount
+
+    def pending_count(self, limit=None):
+        """待處理（含等待重試）的事件數；指定 limit 時最多數到 limit 筆即停止"""
+        with self.pool.acquire() as conn:
+            if limit is None:
+                return conn.execute('SELECT COUNT(*) FROM webhook_inbox WHERE status = ?', (PENDING,)).fetchone()[0]
+            return conn.execute(
+                'SELECT COUNT(*) FROM (SELECT 1 FROM webhook_inbox WHERE status = ? LIMIT ?)', (PENDING, limit)
+            ).fetchone()[0]
+
+    def stats(self):
+        """各狀態的事件數與最舊待處理事件的等待秒數"""
+        with self.pool.acquire() as conn:
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM webhook_inbox GROUP BY status'
+            ).fetchall())
+            oldest = conn.execute(
+                'SELECT MIN(received_at) FROM webhook_inbox WHERE status = ?', (PENDING,)
+            ).fetchone()[0]
+        return {
+            'pending': counts.get(PENDING, 0),
+            'claimed': counts.get(CLAIMED, 0),
+            'done': counts.get(DONE, 0),
+            'failed': counts.get(FAILED, 0),
+            'oldest_pending_seconds': round(time.time() - oldest, 3) if oldest else 0.0,
+        }
+
+    def close(self):
+        self.pool.close_all()
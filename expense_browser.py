@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+管理頁面的支出記錄瀏覽
+
+以 keyset（游標）分頁：依「排序欄位, id」的索引從上一頁最後一筆往後取，
+不用 OFFSET 也不計算總筆數，每一頁的成本只和每頁筆數有關，與資料表大小無關。
+
+篩選條件：用戶、日期區間（當地日期，含頭尾）、金額區間、描述關鍵字（不分大小寫）
+排序：時間 / 金額 / 編號，遞增或遞減
+
+對應索引見 migrations v9：(timestamp, id)、(amount_cents, id)、
+(user_id, timestamp, id)、(user_id, amount_cents, id)；依編號排序走主鍵與 (user_id, id)。
+描述關鍵字無法使用索引，是在索引掃描時一併過濾。
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+
+from money import to_cents
+from timeutils import from_local, to_utc
+
+# 網址參數 sort 對應的欄位
+SORT_COLUMNS = {'time': 'timestamp', 'amount': 'amount_cents', 'id': 'id'}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_STREAM_PAGE_SIZE = 5000  # JSON 串流輸出時每頁筆數上限
+
+COLUMNS = 'id, user_id, amount_cents, location, description, category, timestamp'
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"{name}格式錯誤，請使用 YYYY-MM-DD")
+
+
+def _parse_amount(value, name):
+    try:
+        return to_cents(value)
+    except ValueError:
+        raise ValueError(f"{name}格式錯誤")
+
+
+class ExpenseQuery:
+    """一頁支出記錄的查詢條件"""
+    __slots__ = ('user_id', 'date_from', 'date_to', 'min_cents', 'max_cents', 'keyword',
+                 'sort', 'descending', 'limit', 'cursor', 'max_id')
+
+    def __init__(self, user_id=None, date_from=None, date_to=None, min_cents=None, max_cents=None,
+                 keyword=None, sort='time', descending=True, limit=DEFAULT_PAGE_SIZE, cursor=None,
+                 max_limit=MAX_PAGE_SIZE, max_id=None):
+        """
+        Args:
+            user_id (str): 只看這個用戶
+            date_from (date): 起始日期（當地時間，含）
+            date_to (date): 結束日期（當地時間，含）
+            min_cents / max_cents (int): 金額區間（整數分，含）
+            keyword (str): 描述包含的文字
+            sort (str): 'time' / 'amount' / 'id'
+            descending (bool): 是否遞減
+            limit (int): 每頁筆數；None 表示不分頁（匯出使用）
+            cursor (str): 上一頁回傳的游標；None 表示第一頁
+            max_limit (int): 每頁筆數上限，超過時以上限為準
+            max_id (int): 只取編號不大於此值的記錄（匯出時固定範圍）
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"不支援的排序欄位: {sort}")
+        self.user_id = user_id or None
+        self.date_from = date_from
+        self.date_to = date_to
+        self.min_cents = min_cents
+        self.max_cents = max_cents
+        self.keyword = keyword or None
+        self.sort = sort
+        self.descending = descending
+        self.limit = None if limit is None else max(1, min(int(limit), max_limit))
+        self.cursor = cursor or None
+        self.max_id = max_id
+
+    @classmethod
+    def from_args(cls, args, user_id=None, max_limit=MAX_PAGE_SIZE):
+        """從網址參數（request.args）建立查詢，格式錯誤時拋出 ValueError（訊息可直接顯示）
+
+        參數：user、from、to、min、max、q、sort、order（asc / desc）、limit、cursor；
+        user_id 有指定時（單一用戶頁面）忽略 user 參數。
+        """
+        date_from = args.get('from', '').strip()
+        date_to = args.get('to', '').strip()
+        min_amount = args.get('min', '').strip()
+        max_amount = args.get('max', '').strip()
+        limit = args.get('limit', '').strip()
+        if limit and not limit.isdigit():
+            raise ValueError("每頁筆數格式錯誤")
+
+        return cls(
+            user_id=user_id or args.get('user', '').strip(),
+            date_from=_parse_date(date_from, '起始日期').date() if date_from else None,
+            date_to=_parse_date(date_to, '結束日期').date() if date_to else None,
+            min_cents=_parse_amount(min_amount, '最低金額') if min_amount else None,
+            max_cents=_parse_amount(max_amount, '最高金額') if max_amount else None,
+            keyword=args.get('q', '').strip(),
+            sort=args.get('sort', 'time'),
+            descending=args.get('order', 'desc') != 'asc',
+            limit=int(limit) if limit else DEFAULT_PAGE_SIZE,
+            cursor=args.get('cursor', '').strip(),
+            max_limit=max_limit,
+        )
+
+    def to_args(self, **overrides):
+        """轉回網址參數（省略預設值），用於下一頁與排序連結"""
+        args = {
+            'user': self.user_id,
+            'from': self.date_from.isoformat() if self.date_from else None,
+            'to': self.date_to.isoformat() if self.date_to else None,
+            'min': f"{self.min_cents / 100:g}" if self.min_cents is not None else None,
+            'max': f"{self.max_cents / 100:g}" if self.max_cents is not None else None,
+            'q': self.keyword,
+            'sort': self.sort if self.sort != 'time' else None,
+            'order': None if self.descending else 'asc',
+            'limit': self.limit if self.limit != DEFAULT_PAGE_SIZE else None,
+            'cursor': self.cursor,
+        }
+        args.update(overrides)
+        return {key: value for key, value in args.items() if value is not None}
+
+    def for_export(self, after_id=None, until_id=None):
+        """相同篩選條件的匯出查詢：依編號遞增、不分頁，取 after_id 之後到 until_id（含）的記錄"""
+        query = ExpenseQuery(self.user_id, self.date_from, self.date_to, self.min_cents, self.max_cents,
+                             self.keyword, sort='id', descending=False, limit=None, max_id=until_id)
+        if after_id:
+            query.cursor = query.encode_cursor((after_id,))
+        return query
+
+    def encode_cursor(self, row):
+        """以一頁最後一筆記錄產生下一頁的游標"""
+        value = row[0] if self.sort == 'id' else (row[2] if self.sort == 'amount' else row[6].isoformat())
+        raw = json.dumps([self.sort, self.descending, value, row[0]], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def _decode_cursor(self):
+        try:
+            raw = base64.urlsafe_b64decode(self.cursor + '=' * (-len(self.cursor) % 4))
+            sort, descending, value, last_id = json.loads(raw)
+            if sort == 'time':
+                value = to_utc(datetime.fromisoformat(value))
+            elif not isinstance(value, int):
+                raise ValueError(value)
+            if not isinstance(last_id, int):
+                raise ValueError(last_id)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValueError("分頁游標格式錯誤，請回到第一頁")
+        if (sort, descending) != (self.sort, self.descending):
+            raise ValueError("分頁游標與排序不符，請回到第一頁")
+        return value, last_id
+
+    def statement(self):
+        """組出這一頁的查詢，回傳 (語句名稱, SQL, 參數)
+
+        名稱依條件組合而定（例如 expenses.browse.time.desc.user+from+after），
+        同一種組合只會編譯一次，執行統計也分開記錄。多取一筆用來判斷是否有下一頁；
+        不分頁的查詢名稱以 expenses.export 開頭。
+        """
+        conditions, params, shape = [], [], []
+
+        def where(name, condition, *values):
+            shape.append(name)
+            conditions.append(condition)
+            params.extend(values)
+
+        if self.user_id:
+            where('user', 'user_id = ?', self.user_id)
+        if self.date_from:
+            where('from', 'timestamp >= ?', from_local(datetime.combine(self.date_from, datetime.min.time())))
+        if self.date_to:
+            end = datetime.combine(self.date_to + timedelta(days=1), datetime.min.time())
+            where('to', 'timestamp < ?', from_local(end))
+        if self.min_cents is not None:
+            where('min', 'amount_cents >= ?', self.min_cents)
+        if self.max_cents is not None:
+            where('max', 'amount_cents <= ?', self.max_cents)
+        if self.keyword:
+            where('q', "description {ilike} ? ESCAPE '\\'", f"%{_escape_like(self.keyword)}%")
+        if self.max_id is not None:
+            where('until', 'id <= ?', self.max_id)
+
+        column = SORT_COLUMNS[self.sort]
+        op = '<' if self.descending else '>'
+        if self.cursor:
+            value, last_id = self._decode_cursor()
+            if self.sort == 'id':
+                where('after', f'id {op} ?', last_id)
+            else:
+                where('after', f'({column}, id) {op} (?, ?)', value, last_id)
+
+        order = 'DESC' if self.descending else 'ASC'
+        order_by = 'id ' + order if self.sort == 'id' else f'{column} {order}, id {order}'
+        sql = f"SELECT {COLUMNS} FROM expenses"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order_by}"
+        if self.limit is not None:
+            sql += " LIMIT ?"
+            params.append(self.limit + 1)
+
+        prefix = 'expenses.browse' if self.limit is not None else 'expenses.export'
+        name = f"{prefix}.{self.sort}.{order.lower()}"
+        if shape:
+            name += '.' + '+'.join(shape)
+        return name, sql, tuple(params)
+
+
+class ExpensePage:
+    """串流輸出的一頁記錄
+
+    包裝 ExpenseDatabase.iter_expenses 的產生器：逐筆產生最多 query.limit 筆，
+    讀完之後 count、total_cents、next_cursor 才確定。建立時先讀第一筆，
+    bool(page) 可以在輸出前判斷這一頁有沒有資料。
+    """
+
+    def __init__(self, query, rows):
+        self.query = query
+        self.count = 0
+        self.total_cents = 0
+        self.next_cursor = None
+        self._rows = rows
+        try:
+            self._first = next(rows, None)
+        except Exception:
+            self.close()
+            raise
+
+    def __bool__(self):
+        return self._first is not None or self.count > 0
+
+    def __iter__(self):
+        row, self._first = self._first, None
+        try:
+            while row is not None:
+                if self.count == self.query.limit:
+                    # 多取的一筆只用來判斷有沒有下一頁
+                    self.next_cursor = self.query.encode_cursor(last)
+                    break
+                last = row
+                self.count += 1
+                self.total_cents += row[2]
+                yield row
+                row = next(self._rows, None)
+        finally:
+            self.close()
+
+    def close(self):
+        """結束查詢並歸還連線（提前中斷輸出時也要呼叫）"""
+        close = getattr(self._rows, 'close', None)
+        if close is not None:
+            close()
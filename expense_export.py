@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+支出記錄匯出（CSV / JSONL / XLSX）
+
+以伺服器端游標（PostgreSQL 具名游標 / SQLite fetchmany）逐筆讀取，邊讀邊轉換成檔案內容，
+CSV 與 JSONL 可以同時 gzip 壓縮；記憶體用量與筆數無關。
+管理頁面 /admin/export 與 manage.py export 共用。
+
+匯出依記錄編號遞增排序，並以開始時的最大編號為上限（until_id）。
+中斷後以 after_id（已收到的最後一筆編號）和同樣的 until_id 接續，兩段合起來與一次匯出相同。
+
+CSV 欄位與 manage.py import-expenses 相同（另外多一個 id 欄位），匯出的檔案可以直接匯入。
+"""
+
+import csv
+import io
+import json
+import re
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+from money import format_amount
+from timeutils import to_local
+
+# 格式 -> (Content-Type, 副檔名)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+HEADER = ('id', 'user_id', 'amount', 'description', 'location', 'category', 'timestamp')
+CHUNK_SIZE = 64 * 1024       # 累積到這個大小（字元）才送出一段
+XLSX_SHEET_ROWS = 1048575    # Excel 每個工作表最多 1048576 列（含標題列），超過時換下一個工作表
+
+# XML 不允許的控制字元
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _record(row):
+    """資料庫的一列轉換為匯出欄位（金額以元表示，時間為當地時間 ISO 格式）"""
+    expense_id, user_id, amount_cents, location, description, category, timestamp = row
+    return (expense_id, user_id, format_amount(amount_cents), description or '', location or '',
+            category or '', to_local(timestamp).isoformat() if timestamp else '')
+
+
+class _Lines:
+    """csv.writer 的輸出目標，收集寫入的文字"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+
+class _ZipOutput(io.RawIOBase):
+    """zipfile 的輸出目標：不可 seek，寫入的資料暫存到下次 drain() 取出"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class ExpenseExport:
+    """一次匯出：逐段產生檔案內容（bytes）
+
+    讀完之後 count 為匯出筆數，last_id 為最後一筆的編號（接續匯出時作為 after_id）。
+    """
+
+    def __init__(self, db, query, fmt='csv', compress=False, header=True, batch_size=1000):
+        """
+        Args:
+            db (ExpenseDatabase): 提供 iter_expenses
+            query (ExpenseQuery): 匯出條件，請使用 ExpenseQuery.for_export() 建立
+            fmt (str): 'csv' / 'jsonl' / 'xlsx'
+            compress (bool): 以 gzip 壓縮（XLSX 本身已壓縮，忽略此參數）
+            header (bool): CSV 是否輸出 BOM 與標題列（接續匯出時不需要）
+            batch_size (int): 每次向資料庫讀取的筆數
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不支援的匯出格式: {fmt}")
+        self.db = db
+        self.query = query
+        self.format = fmt
+        self.compress = compress and fmt != 'xlsx'
+        self.header = header
+        self.batch_size = batch_size
+        self.count = 0
+        self.last_id = None
+
+    @property
+    def mimetype(self):
+        return 'application/gzip' if self.compress else FORMATS[self.format][0]
+
+    @property
+    def extension(self):
+        extension = FORMATS[self.format][1]
+        return extension + '.gz' if self.compress else extension
+
+    def __iter__(self):
+        rows = self.db.iter_expenses(self.query, self.batch_size)
+        try:
+            if self.format == 'xlsx':
+                chunks = self._xlsx(self._records(rows))
+            else:
+                chunks = self._text(self._records(rows))
+            if self.compress:
+                chunks = self._gzip(chunks)
+            yield from chunks
+        finally:
+            rows.close()
+
+    def _records(self, rows):
+        for row in rows:
+            self.count += 1
+            self.last_id = row[0]
+            yield _record(row)
+
+    def _text(self, records):
+        """CSV / JSONL：累積到 CHUNK_SIZE 再編碼送出"""
+        lines = _Lines()
+        if self.format == 'csv':
+            writer = csv.writer(lines)  # 記錄以 \r\n 結尾，描述中的換行保持 \n
+            if self.header:
+                lines.write('\ufeff')
+                writer.writerow(HEADER)
+            write = writer.writerow
+        else:
+            def write(record):
+                lines.write(json.dumps(dict(zip(HEADER, record)), ensure_ascii=False) + '\n')
+
+        size = 0
+        for record in records:
+            write(record)
+            size += len(lines.parts[-1])
+            if size >= CHUNK_SIZE:
+                yield ''.join(lines.parts).encode('utf-8')
+                lines.parts.clear()
+                size = 0
+        if lines.parts:
+            yield ''.join(lines.parts).encode('utf-8')
+
+    @staticmethod
+    def _gzip(chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31：gzip 格式
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def _xlsx(self, records, sheet_rows=XLSX_SHEET_ROWS):
+        """XLSX：工作表 XML 直接寫入 zip 串流（不需要 openpyxl），活頁簿描述最後才寫"""
+        output = _ZipOutput()
+        archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+        sheets = 0
+        records = iter(records)
+        pending = next(records, None)
+        while sheets == 0 or pending is not None:
+            sheets += 1
+            with archive.open(f'xl/worksheets/sheet{sheets}.xml', 'w', force_zip64=True) as sheet:
+                sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                            b'<sheetData>')
+                sheet.write(_xlsx_row(1, HEADER))
+                parts, size, number = [], 0, 1
+                while pending is not None and number <= sheet_rows:
+                    number += 1
+                    parts.append(_xlsx_row(number, pending))
+                    size += len(parts[-1])
+                    pending = next(records, None)
+                    if size >= CHUNK_SIZE:
+                        sheet.write(b''.join(parts))
+                        parts, size = [], 0
+                        yield output.drain()
+                sheet.write(b''.join(parts) + b'</sheetData></worksheet>')
+            yield output.drain()
+
+        for name, content in _xlsx_package(sheets).items():
+            archive.writestr(name, content)
+        archive.close()
+        yield output.drain()
+
+
+_COLUMNS = 'ABCDEFG'
+_NUMERIC_COLUMNS = 'AC'  # 編號、金額以數字儲存
+
+
+def _xlsx_cell(reference, value, numeric):
+    if numeric:
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    text = escape(_XML_INVALID.sub('', str(value)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(number, record):
+    numeric = number > 1
+    cells = ''.join(_xlsx_cell(f'{column}{number}', value, numeric and column in _NUMERIC_COLUMNS)
+                    for column, value in zip(_COLUMNS, record))
+    return f'<row r="{number}">{cells}</row>'.encode('utf-8')
+
+
+def _xlsx_package(sheets):
+    """活頁簿的其餘檔案（內容型別、關聯、工作表清單）"""
+    sheet_ids = range(1, sheets + 1)
+    overrides = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in sheet_ids)
+    sheet_list = ''.join(f'<sheet name="expenses{i if i > 1 else ""}" sheetId="{i}" r:id="rId{i}"/>' for i in sheet_ids)
+    sheet_rels = ''.join(
+        f'<Relationship Id="rId{i}" '
+        f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{i}.xml"/>'
+        for i in sheet_ids)
+    return {
+        '[Content_Types].xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f'{overrides}</Types>'),
+        '_rels/.rels': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'),
+        'xl/workbook.xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets>{sheet_list}</sheets></workbook>'),
+        'xl/_rels/workbook.xml.rels': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{sheet_rels}</Relationships>'),
+    }
+
+
+def _last_csv_record(f):
+    """找出 CSV 最後一筆完整記錄的位置，回傳 (開始, 結束)；沒有完整記錄時回傳 (0, 0)
+
+    欄位內可以有 \r\n（描述中的換行），只從結尾往前找無法分辨，
+    因此從頭讀一次：引號成對出現（欄位內的引號寫成兩個），\r\n 前的引號數為偶數時才是記錄結尾。
+    """
+    in_quotes = False
+    offset = 0                 # buffer 在檔案中的起點
+    record_start = 0           # 目前記錄的開始位置
+    last = (0, 0)
+    buffer = b''
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return last
+        buffer += chunk
+        pos = 0
+        while True:
+            end = buffer.find(b'\r\n', pos)
+            if end < 0:
+                break
+            if buffer.count(b'"', pos, end) % 2:
+                in_quotes = not in_quotes
+            pos = end + 2
+            if not in_quotes:
+                last = (record_start, offset + pos)
+                record_start = offset + pos
+        # 還沒遇到結尾符號的部分（可能是被切開的 \r\n）留到下一段一起判斷
+        buffer = buffer[pos:]
+        offset += pos
+
+
+def last_exported_id(path, fmt):
+    """讀取未完成的 CSV / JSONL 匯出檔，回傳最後一筆完整記錄的編號，並截掉不完整的最後一筆
+
+    JSONL 的換行一定是記錄結尾，從檔案結尾往前讀即可；
+    CSV 的欄位內可能有換行，需要從頭讀一次判斷記錄邊界，最後一筆再以 csv 模組解析。
+    只有標題列（或空檔案）時回傳 None。
+    """
+    if fmt == 'csv':
+        with open(path, 'r+b') as f:
+            start, end = _last_csv_record(f)
+            f.seek(start)
+            record = f.read(end - start)
+            f.truncate(end)
+        if not record:
+            return None
+        row = next(csv.reader(io.StringIO(record.decode('utf-8-sig'), newline='')))
+        return int(row[0]) if row and row[0].isdigit() else None
+
+    with open(path, 'r+b') as f:
+        end = f.seek(0, io.SEEK_END)
+        block = 4096
+        while True:
+            start = max(0, end - block)
+            f.seek(start)
+            tail = f.read(end - start)
+            # 最後一個換行之後是不完整的記錄
+            cut = tail.rfind(b'\n')
+            previous = tail.rfind(b'\n', 0, cut) if cut >= 0 else -1
+            if previous >= 0 or start == 0:
+                break
+            block *= 2
+
+        f.truncate(start + cut + 1 if cut >= 0 else 0)
+        if cut < 0:
+            return None
+        record = tail[previous + 1:cut]
+    return json.loads(record)['id']
@@ -1,18 +1,49 @@
 import sys
-from flask import Flask, request, abort
+from flask import Flask, request, abort, Response, stream_with_context
 from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
 from linebot.models import (
-    MessageEvent, TextMessage, TextSendMessage,
-    QuickReply, QuickReplyButton, MessageAction
+    MessageEvent, TextMessage, TextSendMessage, PostbackEvent,
+    QuickReply, QuickReplyButton, MessageAction, PostbackAction
 )
 from datetime import datetime
+from functools import partial
+from html import escape
+from urllib.parse import parse_qs, urlencode
+import atexit
+import base64
+import json
 import logging
-import re
-
-from config import LINE_CHANNEL_ACCESS_TOKEN, LINE_CHANNEL_SECRET, PORT, DATABASE_URL
-from database import ExpenseDatabase
-from message_parser import MessageParser
+import os
+import signal
+import threading
+import time
+
+from config import (
+    LINE_CHANNEL_ACCESS_TOKEN, LINE_CHANNEL_SECRET, PORT, DATABASE_URL,
+    WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_DRAIN_TIMEOUT,
+    INBOX_DB_PATH, INBOX_BATCH_SIZE, INBOX_MAX_ATTEMPTS, INBOX_RETRY_DELAY, INBOX_RETENTION_HOURS,
+    INBOX_MAX_PENDING,
+    WEBHOOK_DEDUPE_CACHE_SIZE, WEBHOOK_DEDUPE_TTL_HOURS,
+    LINE_API_CONNECT_TIMEOUT, LINE_API_READ_TIMEOUT, LINE_API_POOL_SIZE,
+    LINE_API_MAX_RETRIES, LINE_API_RETRY_BACKOFF,
+    REPLY_TOKEN_BUDGET_SECONDS, REPLY_TOKEN_MARGIN_SECONDS,
+    ADMIN_PROFILE_FETCH_WORKERS, ADMIN_PROFILE_FETCH_LIMIT,
+    PROFILE_CACHE_SIZE, PROFILE_TTL_HOURS, PROFILE_NEGATIVE_TTL_SECONDS,
+    PROFILE_NEGATIVE_MAX_SECONDS, PROFILE_REFRESH_WORKERS
+)
+from database import ExpenseDatabase, DuplicateEventError
+from expense_browser import ExpenseQuery, ExpensePage, MAX_STREAM_PAGE_SIZE
+from expense_export import ExpenseExport, FORMATS as EXPORT_FORMATS
+from event_inbox import EventInbox
+from event_dedupe import EventDeduplicator
+from line_http import PooledHttpClient
+from profile_cache import ProfileCache
+from reply_sender import ReplySender
+from webhook_worker import WebhookWorkerPool
+from message_parser import MessageParser, MAX_DELETE_IDS
+from command_router import CommandRouter
+from timeutils import format_local
+from money import format_amount, format_average
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
@@ -22,13 +53,56 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 # 初始化 LINE Bot API
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+line_bot_api = LineBotApi(
+    LINE_CHANNEL_ACCESS_TOKEN,
+    timeout=(LINE_API_CONNECT_TIMEOUT, LINE_API_READ_TIMEOUT),
+    http_client=partial(PooledHttpClient, pool_size=LINE_API_POOL_SIZE,
+                        max_retries=LINE_API_MAX_RETRIES, backoff_factor=LINE_API_RETRY_BACKOFF)
+)
+reply_sender = ReplySender(line_bot_api, budget_seconds=REPLY_TOKEN_BUDGET_SECONDS, margin_seconds=REPLY_TOKEN_MARGIN_SECONDS)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
 # 初始化資料庫和訊息解析器
 db = ExpenseDatabase()
 parser = MessageParser()
 
+def recent_month_range(now, months):
+    """回傳包含本月在內最近 months 個月的 (起始月份, 結束月份)，格式 'YYYY-MM'"""
+    start_month = now.month - (months - 1)
+    start_year = now.year
+    while start_month <= 0:
+        start_month += 12
+        start_year -= 1
+    return f"{start_year}-{start_month:02d}", f"{now.year}-{now.month:02d}"
+
+def encode_page_cursor(before_id, limit):
+    """把下一頁的位置編碼成放在 postback data 裡的游標字串"""
+    raw = f"{before_id}:{limit}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_page_cursor(cursor):
+    """解析游標字串，回傳 (before_id, limit)；格式錯誤時回傳 None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        before_id, limit = (int(part) for part in raw.split(':'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if before_id < 1 or not 1 <= limit <= 50:
+        return None
+    return before_id, limit
+
+class BatchWriteError(Exception):
+    """批次處理中有寫入失敗
+    
+    failed_from 之前的訊息已經完成（寫入已 commit 或查詢已處理），replies 中對應的回覆可以送出；
+    failed_from 起的訊息都沒有完成，需要重試。
+    """
+    
+    def __init__(self, replies, failed_from, error):
+        super().__init__(f"第 {failed_from + 1} 則訊息起寫入失敗: {error}")
+        self.replies = replies
+        self.failed_from = failed_from
+
 class ExpenseBot:
     def __init__(self):
         self.commands = {
@@ -66,93 +140,221 @@ class ExpenseBot:
             '這個月': self.show_monthly_summary,
             '當月': self.show_monthly_summary,
         }
+        self.router = CommandRouter(self.commands)
     
     def handle_message(self, user_id, message_text, is_group=False):
         """處理用戶訊息"""
+        return self.handle_route(user_id, message_text, self.router.route(message_text), is_group)
+    
+    def handle_route(self, user_id, message_text, route, is_group=False):
+        """依路由結果處理訊息（route 由 self.router.route 取得）"""
+        kind = route.kind
+        
         # 群組模式：只處理 @ai 開頭的訊息
-        if is_group and not message_text.strip().lower().startswith('@ai'):
+        if is_group and kind in ('number_query', 'command', 'chat'):
             return None  # 不回應，避免打斷群組對話
         
-        # 檢查是否為 @ai 指令
-        if message_text.strip().lower().startswith('@ai'):
-            # 優先檢查特定指令格式，避免被記帳解析誤判
-            
-            # 檢查是否為 @ai 查詢指令（優先檢查）
-            if self.is_ai_query_command(message_text):
-                return self.handle_ai_query_command(user_id, message_text, is_group)
-            
-            # 檢查是否為 @ai 內建指令
-            elif self.is_ai_help_command(message_text):
-                return self.handle_ai_help_command(user_id, message_text, is_group)
-            
-            # 然後才解析訊息進行記帳和刪除檢查
-            else:
-                parsed_data = parser.parse_message(message_text)
-                
-                # 檢查是否為有效的刪除指令
-                if parser.is_valid_delete(parsed_data):
-                    return self.delete_expense(user_id, parsed_data)
-                
-                # 檢查是否為有效的記帳
-                elif parser.is_valid_expense(parsed_data):
-                    return self.add_expense(user_id, parsed_data)
-                
+        # @ai 查詢指令（優先於記帳，避免「@ai 查詢 30」被誤判為記帳）
+        if kind == 'ai_query':
+            limit = route.args['limit']
+            return self.show_requested_expenses(user_id, 5 if limit is None else limit, is_group)
+        
+        # @ai 內建指令
+        if kind == 'ai_help':
+            return self.show_ai_help_topic(user_id, route.args['topic'], is_group)
+        
+        # 記帳和刪除
+        if kind in ('delete', 'expense'):
+            command = self.parse_write_command(message_text, route)
+            if command is None:
                 # 無效的 @ai 格式
-                else:
-                    return self.suggest_ai_format(message_text, is_group)
+                return self.suggest_ai_format(message_text, is_group)
+            action, parsed_data = command
+            if action == 'delete':
+                return self.delete_expense(user_id, parsed_data)
+            return self.add_expense(user_id, parsed_data)
         
-        # 私聊模式：檢查是否為數字查詢指令
-        elif not is_group and self.is_number_query_command(message_text):
-            return self.handle_number_query_command(user_id, message_text)
+        # 私聊模式：數字查詢指令
+        if kind == 'number_query':
+            return self.show_requested_expenses(user_id, route.args['limit'], False)
         
-        # 私聊模式：檢查是否為其他指令
-        elif not is_group and message_text.strip() in self.commands:
-            return self.commands[message_text.strip()](user_id)
+        # 私聊模式：其他指令
+        if kind == 'command':
+            return self.commands[route.args['name']](user_id)
         
         # 私聊模式：提示使用 @ai 格式
-        elif not is_group:
-            return self.suggest_ai_usage()
+        return self.suggest_ai_usage()
+    
+    def parse_write_command(self, message_text, route=None):
+        """判斷訊息是否為記帳或刪除指令，回傳 ('add' / 'delete', parsed_data)，其他訊息回傳 None"""
+        if route is None:
+            route = self.router.route(message_text)
+        
+        if route.kind == 'delete':
+            if route.args['delete_id'] is not None:
+                # 可能是多筆或範圍（/del #1 #2 #5-#9），交給 parser 展開
+                parsed_data = parser.parse_message(message_text)
+                if parser.is_valid_delete(parsed_data):
+                    return 'delete', parsed_data
+        elif route.kind == 'expense':
+            parsed_data = parser.parse_message(message_text)
+            if parser.is_valid_expense(parsed_data) and parsed_data.get('amount_cents'):
+                return 'add', parsed_data
+        return None
+    
+    def handle_messages(self, messages, event_ids=None):
+        """批次處理多則訊息，回傳與 messages 對應的回覆列表
         
-        # 群組模式的非 @ai 訊息不回應
-        else:
+        連續的記帳 / 刪除指令合併在同一個交易內寫入（一次 commit），
+        遇到其他訊息（例如查詢）前會先寫入，查詢結果包含前面的記帳。
+        
+        Args:
+            messages (list): [(user_id, message_text, is_group), ...]
+            event_ids (list): 與 messages 對應的 webhookEventId（沒有時為 None）；
+                記帳 / 刪除的事件編號與記錄在同一個交易內寫入，已處理過的事件不會再寫入
+        
+        Raises:
+            BatchWriteError: 寫入失敗；帶有失敗之前已完成的訊息的回覆
+        """
+        event_ids = event_ids or [None] * len(messages)
+        replies = [None] * len(messages)
+        pending = []  # [(index, user_id, kind, parsed_data)]
+        
+        for index, (user_id, message_text, is_group) in enumerate(messages):
+            route = self.router.route(message_text)
+            command = self.parse_write_command(message_text, route)
+            if command is not None:
+                pending.append((index, user_id) + command)
+                continue
+            
+            self._flush_writes(pending, replies, event_ids)
+            pending = []
+            replies[index] = self.handle_route(user_id, message_text, route, is_group)
+        
+        self._flush_writes(pending, replies, event_ids)
+        return replies
+    
+    def _flush_writes(self, pending, replies, event_ids):
+        """把累積的記帳 / 刪除指令一次寫入，並填入對應的回覆"""
+        if not pending:
+            return
+        
+        inserts = [
+            {'user_id': user_id, 'amount_cents': amount_cents, 'description': reason}
+            for _, user_id, kind, parsed_data in pending if kind == 'add'
+            for reason, amount_cents in parsed_data.expense_items()
+        ]
+        deletes = [
+            (user_id, delete_id)
+            for _, user_id, kind, parsed_data in pending if kind == 'delete'
+            for delete_id in parsed_data.target_ids()
+        ]
+        
+        pending_events = sorted({event_ids[index] for index, *_ in pending if event_ids[index]})
+        try:
+            expense_ids, records, deleted = db.apply_expense_batch(inserts, deletes, pending_events)
+        except DuplicateEventError as e:
+            # 已處理過的事件先前已寫入並回覆，不再寫入也不回覆；其餘重新寫入
+            logger.info(f"略過已處理過的事件: {e}")
+            self._flush_writes([item for item in pending if event_ids[item[0]] not in e.event_ids],
+                               replies, event_ids)
+            return
+        except Exception as e:
+            # 記錄與事件編號已一起回滾，交給收件匣稍後重試，不回覆失敗；
+            # 這一組之前的訊息已經完成（前面的寫入已 commit），由呼叫端先回覆
+            logger.error(f"批次寫入支出記錄時發生錯誤: {e}")
+            raise BatchWriteError(replies, pending[0][0], e) from e
+        
+        new_ids = iter(expense_ids)
+        reported = set()
+        for index, user_id, kind, parsed_data in pending:
+            if kind == 'add':
+                ids = [next(new_ids) for _ in parsed_data.expense_items()]
+                replies[index] = self.format_added_expense(parsed_data, ids[0] if len(ids) == 1 else ids)
+                continue
+            
+            if parsed_data.delete_ids:
+                done = [
+                    records[delete_id] for delete_id in parsed_data.delete_ids
+                    if delete_id in deleted and delete_id not in reported and records[delete_id][1] == user_id
+                ]
+                reported.update(record[0] for record in done)
+                replies[index] = self.format_deleted_expenses(user_id, parsed_data.delete_ids, done)
+                continue
+            
+            delete_id = parsed_data['delete_id']
+            record = records.get(delete_id)
+            if record is None:
+                replies[index] = TextSendMessage(text=f"❌ 找不到記錄 #{delete_id}，請檢查編號是否正確。")
+            elif record[1] != user_id:
+                replies[index] = TextSendMessage(text=f"❌ 記錄 #{delete_id} 不屬於您，無法刪除。")
+            else:
+                # 同一批內重複刪除同一筆，只有第一則回覆刪除成功
+                done = delete_id in deleted and delete_id not in reported
+                reported.add(delete_id)
+                replies[index] = self.format_deleted_expense(user_id, delete_id, record if done else None)
+    
+    def error_reply(self, message_text, is_group=False):
+        """訊息處理失敗且不再重試時的回覆（群組中本來就不回應的訊息回傳 None）"""
+        if is_group and self.router.route(message_text).kind in ('number_query', 'command', 'chat'):
             return None
+        return TextSendMessage(text="❌ 系統發生錯誤，請稍後再試。")
     
     def add_expense(self, user_id, parsed_data):
         """新增支出記錄"""
         try:
             # 檢查解析資料是否有效
-            if not parsed_data.get('amount'):
+            if not parsed_data.get('amount_cents'):
                 return TextSendMessage(text="❌ 無法識別金額，請重新輸入。")
             
+            if parsed_data.get('items'):
+                # 一則訊息多筆記帳：一次批量新增、一次 commit
+                expense_ids = db.add_expenses_bulk([
+                    {'user_id': user_id, 'amount_cents': amount_cents, 'description': reason}
+                    for reason, amount_cents in parsed_data['items']
+                ])
+                return self.format_added_expense(parsed_data, expense_ids)
+            
             expense_id = db.add_expense(
                 user_id=user_id,
-                amount=parsed_data['amount'],
+                amount_cents=parsed_data['amount_cents'],
                 description=parsed_data['reason'] or parsed_data['description'],
                 location=None,  # 不再使用地點
                 category=None   # 不再使用分類
             )
             
-            if expense_id is None or expense_id == 0:
-                return TextSendMessage(text="❌ 記帳失敗：無法取得記錄ID。")
-            
-            summary = parser.format_expense_summary(parsed_data)
-            
-            response = f"✅ 記帳成功！\n\n{summary}\n\n記錄編號: #{expense_id}"
-            
-            # 添加快速回覆選項
-            quick_reply = QuickReply(items=[
-                QuickReplyButton(action=MessageAction(label="📊 當前統計", text="當前統計")),
-                QuickReplyButton(action=MessageAction(label="📋 查詢記錄", text="查詢")),
-                QuickReplyButton(action=MessageAction(label="📅 本月統計", text="本月")),
-                QuickReplyButton(action=MessageAction(label="⚙️ 更多功能", text="指令"))
-            ])
-            
-            return TextSendMessage(text=response, quick_reply=quick_reply)
+            return self.format_added_expense(parsed_data, expense_id)
             
         except Exception as e:
             logger.error(f"新增支出記錄時發生錯誤: {e}")
             return TextSendMessage(text="❌ 記帳失敗，請稍後再試。")
     
+    def format_added_expense(self, parsed_data, expense_id):
+        """記帳成功的回覆訊息；多筆記帳時 expense_id 為記錄 ID 列表，合併成一則回覆"""
+        if not expense_id:
+            return TextSendMessage(text="❌ 記帳失敗：無法取得記錄ID。")
+        
+        if isinstance(expense_id, list):
+            lines = [
+                f"📝 {reason} {format_amount(amount_cents)} 元（#{item_id}）"
+                for (reason, amount_cents), item_id in zip(parsed_data['items'], expense_id)
+            ]
+            response = (f"✅ 記帳成功！共 {len(lines)} 筆\n\n" + "\n".join(lines)
+                        + f"\n\n💰 合計: {format_amount(parsed_data['amount_cents'])} 元")
+        else:
+            summary = parser.format_expense_summary(parsed_data)
+            response = f"✅ 記帳成功！\n\n{summary}\n\n記錄編號: #{expense_id}"
+        
+        # 添加快速回覆選項
+        quick_reply = QuickReply(items=[
+            QuickReplyButton(action=MessageAction(label="📊 當前統計", text="當前統計")),
+            QuickReplyButton(action=MessageAction(label="📋 查詢記錄", text="查詢")),
+            QuickReplyButton(action=MessageAction(label="📅 本月統計", text="本月")),
+            QuickReplyButton(action=MessageAction(label="⚙️ 更多功能", text="指令"))
+        ])
+        
+        return TextSendMessage(text=response, quick_reply=quick_reply)
+    
     def show_recent_expenses(self, user_id):
         """顯示最近的支出記錄"""
         try:
@@ -165,39 +367,16 @@ class ExpenseBot:
             total = 0
             
             for expense in expenses:
-                expense_id, amount, location, description, category, timestamp = expense
-                total += amount
+                expense_id, amount_cents, location, description, category, timestamp = expense
+                total += amount_cents
                 
-                # 格式化時間 - 添加錯誤處理
-                try:
-                    if timestamp:
-                        # 處理不同的時間格式
-                        if isinstance(timestamp, str):
-                            # 移除 Z 並替換為 +00:00，或直接使用原格式
-                            if 'Z' in timestamp:
-                                timestamp_clean = timestamp.replace('Z', '+00:00')
-                            elif '+' in timestamp or 'T' in timestamp:
-                                timestamp_clean = timestamp
-                            else:
-                                # 如果是 YYYY-MM-DD HH:MM:SS 格式，直接解析
-                                timestamp_clean = timestamp
-                            
-                            dt = datetime.fromisoformat(timestamp_clean)
-                        else:
-                            # 如果是 datetime 對象
-                            dt = timestamp
-                        
-                        time_str = dt.strftime('%m/%d %H:%M')
-                    else:
-                        time_str = '時間未知'
-                except Exception as time_error:
-                    print(f"❌ 時間格式化錯誤: {time_error}, timestamp: {timestamp}, type: {type(timestamp)}")
-                    time_str = '時間格式錯誤'
+                # 資料庫回傳帶時區的 UTC 時間，轉為當地時間顯示
+                time_str = format_local(timestamp)
                 
                 response += f"#{expense_id} - {time_str}\n"
-                response += f"📝 {description} - 💰 {amount:.0f} 元\n\n"
+                response += f"📝 {description} - 💰 {format_amount(amount_cents)} 元\n\n"
             
-            response += f"總計: {total:.0f} 元"
+            response += f"總計: {format_amount(total)} 元"
             
             return TextSendMessage(text=response)
             
@@ -214,19 +393,18 @@ class ExpenseBot:
         try:
             now = datetime.now()
             print(f"🔍 DEBUG: 正在查詢用戶 {user_id} 的 {now.year}年{now.month}月 資料")
-            total_amount, total_count = db.get_monthly_total(user_id, now.year, now.month)
-            print(f"🔍 DEBUG: 查詢結果 - 金額:{total_amount}, 筆數:{total_count}")
+            total_cents, total_count = db.get_monthly_total(user_id, now.year, now.month)
+            print(f"🔍 DEBUG: 查詢結果 - 金額:{format_amount(total_cents)}, 筆數:{total_count}")
             
             if total_count == 0:
                 return TextSendMessage(text=f"📊 {now.year}年{now.month}月目前沒有支出記錄。")
             
             response = f"📊 {now.year}年{now.month}月支出摘要:\n\n"
-            response += f"💳 總支出: {total_amount:.0f} 元\n"
+            response += f"💳 總支出: {format_amount(total_cents)} 元\n"
             response += f"📝 總筆數: {total_count} 筆\n"
             
             if total_count > 0:
-                avg = total_amount / total_count
-                response += f"📈 平均: {avg:.1f} 元/筆"
+                response += f"📈 平均: {format_average(total_cents, total_count)} 元/筆"
             
             return TextSendMessage(text=response)
             
@@ -240,33 +418,24 @@ class ExpenseBot:
         try:
             now = datetime.now()
             
-            # 獲取最近12個月的資料
-            monthly_data = []
-            for i in range(12):
-                # 計算月份
-                month = now.month - i
-                year = now.year
-                if month <= 0:
-                    month += 12
-                    year -= 1
-                
-                total_amount, total_count = db.get_monthly_total(user_id, year, month)
-                if total_count > 0:
-                    monthly_data.append((year, month, total_amount, total_count))
+            # 獲取最近12個月的資料（單一查詢）
+            start_month, end_month = recent_month_range(now, 12)
+            monthly_totals = db.get_monthly_totals(user_id, start_month, end_month)
+            monthly_data = [row for row in reversed(monthly_totals) if row[3] > 0]
             
             if not monthly_data:
                 return TextSendMessage(text="📊 目前沒有任何支出記錄。")
             
             response = "📊 每月總金額統計:\n\n"
             
-            for year, month, amount, count in monthly_data[:6]:  # 顯示最近6個月
-                response += f"📅 {year}年{month}月: {amount:.0f} 元 ({count} 筆)\n"
+            for year, month, cents, count in monthly_data[:6]:  # 顯示最近6個月
+                response += f"📅 {year}年{month}月: {format_amount(cents)} 元 ({count} 筆)\n"
             
             # 計算總計
-            total_all = sum(amount for _, _, amount, _ in monthly_data)
+            total_all = sum(cents for _, _, cents, _ in monthly_data)
             count_all = sum(count for _, _, _, count in monthly_data)
             
-            response += f"\n💰 總計: {total_all:.0f} 元"
+            response += f"\n💰 總計: {format_amount(total_all)} 元"
             response += f"\n📊 總筆數: {count_all} 筆"
             
             return TextSendMessage(text=response)
@@ -284,41 +453,19 @@ class ExpenseBot:
                 return TextSendMessage(text="📊 當前統計期間內沒有任何記錄。")
             
             response = "📊 當前統計金額:\n\n"
-            response += f"💰 當前總支出: {current_stats['total_amount']:.0f} 元\n"
+            response += f"💰 當前總支出: {format_amount(current_stats['total_cents'])} 元\n"
             response += f"📝 當前筆數: {current_stats['total_count']} 筆\n"
             
             if current_stats['total_count'] > 0:
-                avg = current_stats['total_amount'] / current_stats['total_count']
-                response += f"📈 平均: {avg:.1f} 元/筆\n"
+                avg = format_average(current_stats['total_cents'], current_stats['total_count'])
+                response += f"📈 平均: {avg} 元/筆\n"
             
             # 顯示統計期間 - 添加錯誤處理
             if current_stats['reset_date']:
-                try:
-                    reset_date_str = current_stats['reset_date']
-                    if isinstance(reset_date_str, str):
-                        if 'Z' in reset_date_str:
-                            reset_date_str = reset_date_str.replace('Z', '+00:00')
-                        reset_dt = datetime.fromisoformat(reset_date_str)
-                    else:
-                        reset_dt = reset_date_str
-                    response += f"\n📅 統計開始: {reset_dt.strftime('%Y/%m/%d %H:%M')}\n"
-                except Exception as e:
-                    print(f"❌ 重置日期格式化錯誤: {e}, reset_date: {current_stats['reset_date']}")
-                    response += f"\n📅 統計開始: 日期格式錯誤\n"
+                response += f"\n📅 統計開始: {format_local(current_stats['reset_date'], '%Y/%m/%d %H:%M')}\n"
             
             if current_stats['last_record']:
-                try:
-                    last_record_str = current_stats['last_record']
-                    if isinstance(last_record_str, str):
-                        if 'Z' in last_record_str:
-                            last_record_str = last_record_str.replace('Z', '+00:00')
-                        last_dt = datetime.fromisoformat(last_record_str)
-                    else:
-                        last_dt = last_record_str
-                    response += f"📅 最近記錄: {last_dt.strftime('%Y/%m/%d %H:%M')}\n"
-                except Exception as e:
-                    print(f"❌ 最近記錄日期格式化錯誤: {e}, last_record: {current_stats['last_record']}")
-                    response += f"📅 最近記錄: 日期格式錯誤\n"
+                response += f"📅 最近記錄: {format_local(current_stats['last_record'], '%Y/%m/%d %H:%M')}\n"
             
             response += f"\n💡 提示: 使用「重新統計」可重置當前統計金額"
             
@@ -337,50 +484,29 @@ class ExpenseBot:
                 return TextSendMessage(text="📊 目前沒有任何支出記錄。")
             
             response = "📊 歷史總統計報告:\n\n"
-            response += f"💰 歷史總支出: {stats['total_amount']:.0f} 元\n"
+            response += f"💰 歷史總支出: {format_amount(stats['total_cents'])} 元\n"
             response += f"📝 歷史總筆數: {stats['total_count']} 筆\n"
             
             if stats['total_count'] > 0:
-                avg = stats['total_amount'] / stats['total_count']
-                response += f"📈 歷史平均: {avg:.1f} 元/筆\n"
+                avg = format_average(stats['total_cents'], stats['total_count'])
+                response += f"📈 歷史平均: {avg} 元/筆\n"
             
-            # 顯示記錄期間 - 添加錯誤處理
+            # 顯示記錄期間
             if stats['first_record'] and stats['last_record']:
-                try:
-                    first_record_str = stats['first_record']
-                    last_record_str = stats['last_record']
-                    
-                    if isinstance(first_record_str, str):
-                        if 'Z' in first_record_str:
-                            first_record_str = first_record_str.replace('Z', '+00:00')
-                        first_dt = datetime.fromisoformat(first_record_str)
-                    else:
-                        first_dt = first_record_str
-                    
-                    if isinstance(last_record_str, str):
-                        if 'Z' in last_record_str:
-                            last_record_str = last_record_str.replace('Z', '+00:00')
-                        last_dt = datetime.fromisoformat(last_record_str)
-                    else:
-                        last_dt = last_record_str
-                    
-                    response += f"\n📅 記錄期間:\n"
-                    response += f"   開始: {first_dt.strftime('%Y/%m/%d')}\n"
-                    response += f"   最近: {last_dt.strftime('%Y/%m/%d')}\n"
-                except Exception as e:
-                    print(f"❌ 記錄期間日期格式化錯誤: {e}")
-                    response += f"\n📅 記錄期間: 日期格式錯誤\n"
+                response += f"\n📅 記錄期間:\n"
+                response += f"   開始: {format_local(stats['first_record'], '%Y/%m/%d')}\n"
+                response += f"   最近: {format_local(stats['last_record'], '%Y/%m/%d')}\n"
             
             # 顯示最近幾個月的統計
             if stats['monthly_stats']:
                 response += f"\n📊 最近月份統計:\n"
-                for month_str, amount, count in stats['monthly_stats'][:5]:
+                for month_str, cents, count in stats['monthly_stats'][:5]:
                     try:
                         year, month = month_str.split('-')
-                        response += f"   {year}年{int(month)}月: {amount:.0f} 元 ({count} 筆)\n"
+                        response += f"   {year}年{int(month)}月: {format_amount(cents)} 元 ({count} 筆)\n"
                     except Exception as e:
                         print(f"❌ 月份統計格式化錯誤: {e}, month_str: {month_str}")
-                        response += f"   日期格式錯誤: {amount:.0f} 元 ({count} 筆)\n"
+                        response += f"   日期格式錯誤: {format_amount(cents)} 元 ({count} 筆)\n"
             
             response += f"\n💡 「當前統計」顯示重置後的累積金額"
             
@@ -461,7 +587,7 @@ class ExpenseBot:
 
 🗑️ 刪除：@ai /del #記錄編號
 • @ai /del #23
-• @ai /del #156
+• @ai /del #1 #2 #5-#9（一次最多 {MAX_DELETE_IDS} 筆）
 
 ❓ 求助：@ai 指令
 • @ai ? - 快速幫助
@@ -538,7 +664,7 @@ class ExpenseBot:
 您即將重置「當前統計金額」！
 
 📊 當前統計:
-💰 當前總支出: {current_stats['total_amount']:.0f} 元
+💰 當前總支出: {format_amount(current_stats['total_cents'])} 元
 📝 當前筆數: {current_stats['total_count']} 筆
 
 ✅ 保留內容:
@@ -571,7 +697,7 @@ class ExpenseBot:
             success_text = f"""✅ 重新統計完成！
 
 📊 重置結果:
-🔄 重置前金額: {old_stats['total_amount']:.0f} 元
+🔄 重置前金額: {format_amount(old_stats['total_cents'])} 元
 🔄 重置前筆數: {old_stats['total_count']} 筆
 💰 當前統計金額: 0 元
 
@@ -600,78 +726,84 @@ class ExpenseBot:
     def delete_expense(self, user_id, parsed_data):
         """刪除支出記錄"""
         try:
+            if parsed_data.get('delete_ids'):
+                # 多筆刪除：一個 DELETE ... WHERE user_id = ? AND id IN (...) RETURNING，只會刪除自己的記錄
+                rows = db.delete_user_expenses(user_id, parsed_data['delete_ids'])
+                return self.format_deleted_expenses(user_id, parsed_data['delete_ids'], rows)
+            
             delete_id = parsed_data['delete_id']
             
             # 先檢查記錄是否存在且屬於該用戶
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            if db.use_postgresql:
-                cursor.execute('SELECT user_id, amount, description, timestamp FROM expenses WHERE id = %s', (delete_id,))
-            else:
-                cursor.execute('SELECT user_id, amount, description, timestamp FROM expenses WHERE id = ?', (delete_id,))
-            
-            record = cursor.fetchone()
+            record = db.get_expense(delete_id)
             
             if not record:
-                conn.close()
                 return TextSendMessage(text=f"❌ 找不到記錄 #{delete_id}，請檢查編號是否正確。")
             
             # 檢查記錄是否屬於該用戶
-            record_user_id = record[0] if isinstance(record, (list, tuple)) else record['user_id']
-            record_amount = record[1] if isinstance(record, (list, tuple)) else record['amount']
-            record_description = record[2] if isinstance(record, (list, tuple)) else record['description']
-            record_timestamp = record[3] if isinstance(record, (list, tuple)) else record['timestamp']
-            
-            if record_user_id != user_id:
-                conn.close()
+            if record[1] != user_id:
                 return TextSendMessage(text=f"❌ 記錄 #{delete_id} 不屬於您，無法刪除。")
             
-            # 執行刪除
-            if db.use_postgresql:
-                cursor.execute('DELETE FROM expenses WHERE id = %s', (delete_id,))
-            else:
-                cursor.execute('DELETE FROM expenses WHERE id = ?', (delete_id,))
-            
-            deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
-            
-            if deleted_count > 0:
-                # 格式化時間顯示
-                try:
-                    if isinstance(record_timestamp, str):
-                        if 'Z' in record_timestamp:
-                            record_timestamp = record_timestamp.replace('Z', '+00:00')
-                        dt = datetime.fromisoformat(record_timestamp)
-                        time_str = dt.strftime('%m/%d %H:%M')
-                    else:
-                        time_str = record_timestamp.strftime('%m/%d %H:%M') if record_timestamp else '時間未知'
-                except Exception:
-                    time_str = '時間格式錯誤'
-                
-                response = f"✅ 成功刪除記錄 #{delete_id}\n\n"
-                response += f"📝 原因: {record_description}\n"
-                response += f"💰 金額: {record_amount:.0f} 元\n"
-                response += f"🕐 時間: {time_str}\n\n"
-                response += f"⚠️ 此操作無法復原"
-                
-                logger.info(f"用戶刪除記錄: 用戶={user_id}, 記錄ID={delete_id}")
-                
-                # 添加快速回覆選項
-                quick_reply = QuickReply(items=[
-                    QuickReplyButton(action=MessageAction(label="📋 查詢記錄", text="查詢")),
-                    QuickReplyButton(action=MessageAction(label="📊 當前統計", text="當前統計")),
-                    QuickReplyButton(action=MessageAction(label="📅 本月統計", text="本月"))
-                ])
-                
-                return TextSendMessage(text=response, quick_reply=quick_reply)
-            else:
-                return TextSendMessage(text=f"❌ 刪除失敗，記錄 #{delete_id} 可能已被刪除。")
+            # 執行刪除（同時更新每月彙總）
+            deleted = db.delete_expense(delete_id, user_id)
+            
+            return self.format_deleted_expense(user_id, delete_id, record if deleted else None)
                 
         except Exception as e:
             logger.error(f"刪除記錄時發生錯誤: {e}")
             return TextSendMessage(text="❌ 刪除失敗，請稍後再試。")
+    
+    def format_deleted_expense(self, user_id, delete_id, record):
+        """刪除結果的回覆訊息；record 為刪除前的記錄，None 表示沒有刪除任何記錄"""
+        if record is None:
+            return TextSendMessage(text=f"❌ 刪除失敗，記錄 #{delete_id} 可能已被刪除。")
+        
+        _, record_user_id, record_cents, record_description, record_timestamp = record
+        
+        # 格式化時間顯示
+        time_str = format_local(record_timestamp)
+        
+        response = f"✅ 成功刪除記錄 #{delete_id}\n\n"
+        response += f"📝 原因: {record_description}\n"
+        response += f"💰 金額: {format_amount(record_cents)} 元\n"
+        response += f"🕐 時間: {time_str}\n\n"
+        response += f"⚠️ 此操作無法復原"
+        
+        logger.info(f"用戶刪除記錄: 用戶={user_id}, 記錄ID={delete_id}")
+        
+        # 添加快速回覆選項
+        quick_reply = QuickReply(items=[
+            QuickReplyButton(action=MessageAction(label="📋 查詢記錄", text="查詢")),
+            QuickReplyButton(action=MessageAction(label="📊 當前統計", text="當前統計")),
+            QuickReplyButton(action=MessageAction(label="📅 本月統計", text="本月"))
+        ])
+        
+        return TextSendMessage(text=response, quick_reply=quick_reply)
+
+    def format_deleted_expenses(self, user_id, delete_ids, records):
+        """多筆刪除的回覆訊息；records 為實際刪除的記錄，其他編號為不存在或不屬於該用戶"""
+        removed_ids = {record[0] for record in records}
+        skipped = [delete_id for delete_id in delete_ids if delete_id not in removed_ids]
+        
+        if not records:
+            return TextSendMessage(text=f"❌ 沒有刪除任何記錄，{len(delete_ids)} 筆記錄都不存在或不屬於您。")
+        
+        response = f"✅ 成功刪除 {len(records)} 筆記錄\n\n"
+        for record_id, _, record_cents, record_description, record_timestamp in records:
+            response += f"#{record_id} {record_description} {format_amount(record_cents)} 元（{format_local(record_timestamp)}）\n"
+        response += f"\n💰 合計: {format_amount(sum(record[2] for record in records))} 元\n"
+        if skipped:
+            response += f"⚠️ 找不到或不屬於您：{'、'.join(f'#{delete_id}' for delete_id in skipped)}\n"
+        response += "⚠️ 此操作無法復原"
+        
+        logger.info(f"用戶批量刪除記錄: 用戶={user_id}, 記錄ID={sorted(removed_ids)}")
+        
+        quick_reply = QuickReply(items=[
+            QuickReplyButton(action=MessageAction(label="📋 查詢記錄", text="查詢")),
+            QuickReplyButton(action=MessageAction(label="📊 當前統計", text="當前統計")),
+            QuickReplyButton(action=MessageAction(label="📅 本月統計", text="本月"))
+        ])
+        
+        return TextSendMessage(text=response, quick_reply=quick_reply)
 
     def show_welcome_message(self, user_id):
         """顯示歡迎訊息"""
@@ -745,25 +877,19 @@ class ExpenseBot:
 
     def is_ai_help_command(self, message_text):
         """檢查是否為 @ai 內建幫助指令"""
-        content = message_text.strip()[3:].strip().lower()  # 移除 @ai 前綴
-        
-        help_keywords = [
-            'help', '幫助', '說明', '指令', '功能', '選單', 'menu',
-            '?', '？', 'start', '開始', '歡迎', 'hi', 'hello'
-        ]
-        
-        return content in help_keywords
+        return self.router.route(message_text).kind == 'ai_help'
     
     def handle_ai_help_command(self, user_id, message_text, is_group=False):
         """處理 @ai 內建幫助指令"""
-        content = message_text.strip()[3:].strip().lower()  # 移除 @ai 前綴
-        
-        # 根據不同的幫助關鍵字返回不同內容
-        if content in ['help', '幫助', '說明', '?', '？']:
-            return self.show_ai_help(user_id, is_group)
-        elif content in ['指令', '功能', '選單', 'menu']:
+        route = self.router.route(message_text)
+        topic = route.args['topic'] if route.kind == 'ai_help' else 'help'
+        return self.show_ai_help_topic(user_id, topic, is_group)
+    
+    def show_ai_help_topic(self, user_id, topic, is_group=False):
+        """根據不同的幫助關鍵字返回不同內容（topic 見 command_router.HELP_TOPICS）"""
+        if topic == 'menu':
             return self.show_ai_commands(user_id, is_group)
-        elif content in ['start', '開始', '歡迎', 'hi', 'hello']:
+        elif topic == 'welcome':
             return self.show_ai_welcome(user_id, is_group)
         else:
             return self.show_ai_help(user_id, is_group)
@@ -911,128 +1037,64 @@ class ExpenseBot:
         return TextSendMessage(text=help_text, quick_reply=quick_reply)
 
     def is_ai_query_command(self, message_text):
-        """檢查是否為 @ai 查詢指令"""
-        import re
-        content = message_text.strip()[3:].strip()  # 移除 @ai 前綴
-        
-        # 匹配 "查詢", "查詢 數字", "list", "list 數字" 等
-        query_patterns = [
-            r'^查詢\s*(\d+)?$',
-            r'^記錄\s*(\d+)?$', 
-            r'^最近\s*(\d+)?$',
-            r'^list\s*(\d+)?$'
-        ]
-        
-        for pattern in query_patterns:
-            if re.match(pattern, content, re.IGNORECASE):
-                return True
-        
-        return False
+        """檢查是否為 @ai 查詢指令（查詢 / 記錄 / 最近 / list，可加數字）"""
+        return self.router.route(message_text).kind == 'ai_query'
     
     def handle_ai_query_command(self, user_id, message_text, is_group=False):
         """處理 @ai 查詢指令"""
-        import re
-        content = message_text.strip()[3:].strip()  # 移除 @ai 前綴
-        
-        # 提取數字
-        number_match = re.search(r'(\d+)', content)
-        limit = int(number_match.group(1)) if number_match else 5
-        
-        # 限制範圍
-        if limit > 50:
-            limit = 50
-            warning = f"\n⚠️ 最多只能查詢 50 筆，已調整為 50 筆"
-        elif limit < 1:
-            limit = 5
-            warning = f"\n⚠️ 數量不能小於 1，已調整為 5 筆"
-        else:
-            warning = ""
-        
-        return self.show_recent_expenses_with_limit(user_id, limit, is_group, warning)
+        limit = self.router.route(message_text).args.get('limit')
+        return self.show_requested_expenses(user_id, 5 if limit is None else limit, is_group)
     
     def is_number_query_command(self, message_text):
-        """檢查是否為數字查詢指令（私聊專用）"""
-        import re
-        
-        # 匹配 "查詢10", "記錄20", "最近15", "list30" 等
-        number_patterns = [
-            r'^查詢\d+$',
-            r'^記錄\d+$',
-            r'^最近\d+$',
-            r'^list\d+$'
-        ]
-        
-        for pattern in number_patterns:
-            if re.match(pattern, message_text.strip(), re.IGNORECASE):
-                return True
-        
-        return False
+        """檢查是否為數字查詢指令（私聊專用，例如 查詢10、list30）"""
+        return self.router.route(message_text).kind == 'number_query'
     
     def handle_number_query_command(self, user_id, message_text):
         """處理數字查詢指令（私聊專用）"""
-        import re
-        
-        # 提取數字
-        number_match = re.search(r'(\d+)', message_text.strip())
-        limit = int(number_match.group(1)) if number_match else 5
-        
+        limit = self.router.route(message_text).args.get('limit')
+        return self.show_requested_expenses(user_id, 5 if limit is None else limit, False)
+    
+    def show_requested_expenses(self, user_id, limit, is_group=False):
+        """依用戶指定的筆數顯示最近記錄，超出範圍時調整並附上提示"""
         # 限制範圍
         if limit > 50:
             limit = 50
-            warning = f"\n⚠️ 最多只能查詢 50 筆，已調整為 50 筆"
+            warning = f"\n⚠️ 每頁最多 50 筆，已調整為 50 筆，可點「下一頁」繼續查看"
         elif limit < 1:
             limit = 5
             warning = f"\n⚠️ 數量不能小於 1，已調整為 5 筆"
         else:
             warning = ""
         
-        return self.show_recent_expenses_with_limit(user_id, limit, False, warning)
+        return self.show_recent_expenses_with_limit(user_id, limit, is_group, warning)
     
-    def show_recent_expenses_with_limit(self, user_id, limit=5, is_group=False, warning=""):
-        """顯示指定筆數的最近支出記錄"""
+    def show_recent_expenses_with_limit(self, user_id, limit=5, is_group=False, warning="", before_id=None):
+        """顯示指定筆數的最近支出記錄（before_id 有值時顯示更早的一頁）"""
         try:
-            expenses = db.get_user_expenses(user_id, limit=limit)
+            expenses, next_before_id = db.get_user_expenses_page(user_id, before_id=before_id, limit=limit)
             
             if not expenses:
+                if before_id is not None:
+                    return TextSendMessage(text="📋 沒有更早的支出記錄了。")
                 return TextSendMessage(text="📋 目前沒有支出記錄。")
             
-            response = f"📋 最近 {len(expenses)} 筆支出記錄:\n\n"
+            if before_id is None:
+                response = f"📋 最近 {len(expenses)} 筆支出記錄:\n\n"
+            else:
+                response = f"📋 更早的 {len(expenses)} 筆支出記錄:\n\n"
             total = 0
             
             for expense in expenses:
-                expense_id, amount, location, description, category, timestamp = expense
-                total += amount
+                expense_id, amount_cents, location, description, category, timestamp = expense
+                total += amount_cents
                 
-                # 格式化時間 - 添加錯誤處理
-                try:
-                    if timestamp:
-                        # 處理不同的時間格式
-                        if isinstance(timestamp, str):
-                            # 移除 Z 並替換為 +00:00，或直接使用原格式
-                            if 'Z' in timestamp:
-                                timestamp_clean = timestamp.replace('Z', '+00:00')
-                            elif '+' in timestamp or 'T' in timestamp:
-                                timestamp_clean = timestamp
-                            else:
-                                # 如果是 YYYY-MM-DD HH:MM:SS 格式，直接解析
-                                timestamp_clean = timestamp
-                            
-                            dt = datetime.fromisoformat(timestamp_clean)
-                        else:
-                            # 如果是 datetime 對象
-                            dt = timestamp
-                        
-                        time_str = dt.strftime('%m/%d %H:%M')
-                    else:
-                        time_str = '時間未知'
-                except Exception as time_error:
-                    print(f"❌ 時間格式化錯誤: {time_error}, timestamp: {timestamp}, type: {type(timestamp)}")
-                    time_str = '時間格式錯誤'
+                # 資料庫回傳帶時區的 UTC 時間，轉為當地時間顯示
+                time_str = format_local(timestamp)
                 
                 response += f"#{expense_id} - {time_str}\n"
-                response += f"📝 {description} - 💰 {amount:.0f} 元\n\n"
+                response += f"📝 {description} - 💰 {format_amount(amount_cents)} 元\n\n"
             
-            response += f"總計: {total:.0f} 元"
+            response += f"總計: {format_amount(total)} 元"
             
             # 添加警告訊息
             if warning:
@@ -1053,6 +1115,14 @@ class ExpenseBot:
                     QuickReplyButton(action=MessageAction(label="📊 當前統計", text="當前統計"))
                 ])
             
+            # 還有更早的記錄時，附上帶游標的「下一頁」按鈕
+            if next_before_id is not None:
+                quick_reply.items.insert(0, QuickReplyButton(action=PostbackAction(
+                    label="⏭️ 下一頁",
+                    data=f"action=expenses_page&cursor={encode_page_cursor(next_before_id, limit)}",
+                    display_text="下一頁"
+                )))
+            
             return TextSendMessage(text=response, quick_reply=quick_reply)
             
         except Exception as e:
@@ -1062,13 +1132,28 @@ class ExpenseBot:
             traceback.print_exc()
             logger.error(f"查詢支出記錄時發生錯誤: {e}")
             return TextSendMessage(text="❌ 查詢失敗，請稍後再試。")
+    
+    def handle_postback(self, user_id, data, is_group=False):
+        """處理快速回覆按鈕的 postback（目前只有記錄分頁）"""
+        params = parse_qs(data)
+        action = params.get('action', [None])[0]
+        
+        if action == 'expenses_page':
+            page = decode_page_cursor(params.get('cursor', [''])[0])
+            if page is None:
+                return TextSendMessage(text="❌ 分頁資訊無效，請重新查詢。")
+            before_id, limit = page
+            # 游標只記錄位置，查詢的一律是按下按鈕的用戶自己的記錄
+            return self.show_recent_expenses_with_limit(user_id, limit, is_group, before_id=before_id)
+        
+        return None
 
 # 初始化機器人
 bot = ExpenseBot()
 
 @app.route("/callback", methods=['POST'])
 def callback():
-    """LINE Webhook 回調函數"""
+    """LINE Webhook 回調函數：驗證簽章、寫入收件匣後立即回應，由背景工作執行緒處理"""
     # 取得 X-Line-Signature header value
     signature = request.headers['X-Line-Signature']
 
@@ -1076,53 +1161,200 @@ def callback():
     body = request.get_data(as_text=True)
     app.logger.info("Request body: " + body)
 
-    # 處理 webhook body
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
+    # 驗證簽章
+    if not handler.parser.signature_validator.validate(body, signature):
         app.logger.error("Invalid signature. Please check your channel access token/channel secret.")
         abort(400)
 
+    events = json.loads(body).get('events', [])
+
+    # 背壓：收件匣積壓過多（工作執行緒跟不上或資料庫持續失敗）時回應 503，讓 LINE 稍後重送，
+    # 不讓收件匣無限成長
+    if events and inbox.pending_count(INBOX_MAX_PENDING) >= INBOX_MAX_PENDING:
+        app.logger.warning(f"收件匣待處理事件已達 {INBOX_MAX_PENDING} 筆，暫時拒絕 webhook")
+        abort(503)
+
+    # 只以記憶體過濾最近收過的重送事件，不查資料庫；
+    # 確定的去重在工作執行緒處理時進行（見 process_inbox、ExpenseBot.handle_messages）
+    if events:
+        new_events = event_dedupe.filter_new(events)
+        if len(new_events) < len(events):
+            app.logger.info(f"略過 {len(events) - len(new_events)} 個重送事件")
+        events = new_events
+
+    if events:
+        # 先寫入收件匣，程式當掉時事件也不會遺失
+        try:
+            inbox.append(events)
+        except Exception as e:
+            app.logger.error(f"寫入事件收件匣失敗: {e}")
+            # 讓 LINE 重送的事件不會被當成重複而丟棄
+            event_dedupe.forget(events)
+            abort(503)
+
+        # 通知工作執行緒；佇列已滿代表已有待執行的工作，它們會一併處理收件匣中的事件
+        webhook_workers.submit(None)
+
     return 'OK'
 
+# 收件匣只保存會處理的事件類型，其餘事件直接標記完成
+EVENT_TYPES = {
+    'message': MessageEvent,
+    'postback': PostbackEvent,
+}
+
+def is_text_message(event):
+    return isinstance(event, MessageEvent) and isinstance(event.message, TextMessage)
+
+def process_inbox(_job=None):
+    """背景工作執行緒：批次認領收件匣中的事件並處理，直到沒有待處理事件
+    
+    同一批中連續的文字訊息一起交給 handle_message_events，記帳 / 刪除只 commit 一次。
+    已處理過（記錄在 processed_events）的重送事件直接標記完成。
+    處理失敗（例如資料庫錯誤）的事件放回收件匣，等待一段時間後重試；不再重試時才回覆錯誤訊息。
+    """
+    worker = threading.current_thread().name
+    while True:
+        batch = inbox.claim(worker, INBOX_BATCH_SIZE)
+        if not batch:
+            schedule_inbox_retry()
+            return
+
+        try:
+            processed = event_dedupe.processed(
+                [payload['webhookEventId'] for _, payload, _ in batch if payload.get('webhookEventId')])
+        except Exception as e:
+            for inbox_id, _, attempts in batch:
+                logger.error(f"處理事件 #{inbox_id} 時發生錯誤（第 {attempts} 次）: {e}")
+                inbox.fail(inbox_id, e)
+            continue
+
+        done = []
+        messages = []  # 累積中的連續文字訊息 [(inbox_id, attempts, event)]
+
+        def flush_messages():
+            if not messages:
+                return
+            try:
+                handle_message_events([event for _, _, event in messages])
+                done.extend(inbox_id for inbox_id, _, _ in messages)
+            except Exception as e:
+                failed = messages
+                if isinstance(e, BatchWriteError):
+                    # 只重試還沒完成的訊息
+                    done.extend(inbox_id for inbox_id, _, _ in messages[:e.failed_from])
+                    failed = messages[e.failed_from:]
+                for inbox_id, attempts, event in failed:
+                    logger.error(f"處理事件 #{inbox_id} 時發生錯誤（第 {attempts} 次）: {e}")
+                    if not inbox.fail(inbox_id, e):
+                        is_group = hasattr(event.source, 'type') and event.source.type in ['group', 'room']
+                        send_reply(event, bot.error_reply(event.message.text, is_group))
+            messages.clear()
+
+        for inbox_id, payload, attempts in batch:
+            if payload.get('webhookEventId') in processed:
+                logger.info(f"略過已處理過的事件 #{inbox_id}")
+                done.append(inbox_id)
+                continue
+            try:
+                event_class = EVENT_TYPES.get(payload.get('type'))
+                event = event_class.new_from_json_dict(payload) if event_class is not None else None
+                if is_text_message(event):
+                    messages.append((inbox_id, attempts, event))
+                    continue
+
+                flush_messages()
+                if isinstance(event, PostbackEvent):
+                    handle_postback(event)
+                    mark_events_processed([event])
+                done.append(inbox_id)
+            except Exception as e:
+                logger.error(f"處理事件 #{inbox_id} 時發生錯誤（第 {attempts} 次）: {e}")
+                inbox.fail(inbox_id, e)
+
+        flush_messages()
+        inbox.complete(done)
+
+retry_timer = None
+retry_timer_lock = threading.Lock()
+
+def schedule_inbox_retry():
+    """收件匣有等待重試的事件時，設定計時器在可以認領時喚醒工作執行緒"""
+    global retry_timer
+    delay = inbox.next_retry_in()
+    if delay is None:
+        return
+    due = time.monotonic() + delay
+    with retry_timer_lock:
+        if retry_timer is not None and retry_timer.is_alive() and retry_timer.due <= due:
+            return
+        if retry_timer is not None:
+            retry_timer.cancel()
+        retry_timer = threading.Timer(delay, webhook_workers.submit, (None,))
+        retry_timer.due = due
+        retry_timer.daemon = True
+        retry_timer.start()
+
+def send_reply(event, reply_message):
+    """回覆單一事件；接近 reply token 期限或 token 已失效時改用 push，不拋出錯誤"""
+    reply_sender.send(event, reply_message)
+
+def handle_message_events(events):
+    """批次處理多則文字訊息：記帳 / 刪除在同一個交易內寫入，再逐一回覆"""
+    messages = []
+    event_ids = []
+    for event in events:
+        user_id = event.source.user_id
+        message_text = event.message.text
+        
+        # 檢測是否在群組中
+        is_group = hasattr(event.source, 'type') and event.source.type in ['group', 'room']
+        
+        logger.info(f"收到用戶 {user_id} 的訊息: {message_text} ({'群組' if is_group else '私聊'})")
+        messages.append((user_id, message_text, is_group))
+        event_ids.append(getattr(event, 'webhook_event_id', None))
+    
+    # 使用機器人處理訊息，傳入群組資訊；錯誤交給呼叫端（收件匣會稍後重試）
+    try:
+        replies = bot.handle_messages(messages, event_ids)
+    except BatchWriteError as e:
+        # 失敗之前的寫入已經 commit，重試時會被當成已處理而略過，現在就要回覆
+        for event, reply_message in zip(events[:e.failed_from], e.replies):
+            send_reply(event, reply_message)
+        mark_events_processed(events[:e.failed_from])
+        raise
+    
+    # 沒有回應的（群組中的非 @ai 訊息）會被 send_reply 略過
+    for event, reply_message in zip(events, replies):
+        send_reply(event, reply_message)
+    mark_events_processed(events)
+
+def mark_events_processed(events):
+    """回覆送出後才記錄事件已處理（查詢等非寫入事件；記帳 / 刪除已在寫入交易中記錄，重複記錄會被忽略）
+    
+    在回覆前當掉時，重新處理的事件仍會被回覆。
+    """
+    event_dedupe.mark_processed([event.webhook_event_id for event in events if event.webhook_event_id])
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     """處理文字訊息"""
+    handle_message_events([event])
+
+@handler.add(PostbackEvent)
+def handle_postback(event):
+    """處理快速回覆按鈕的 postback"""
     user_id = event.source.user_id
-    message_text = event.message.text
-    
-    # 檢測是否在群組中
     is_group = hasattr(event.source, 'type') and event.source.type in ['group', 'room']
     
-    logger.info(f"收到用戶 {user_id} 的訊息: {message_text} ({'群組' if is_group else '私聊'})")
+    logger.info(f"收到用戶 {user_id} 的 postback: {event.postback.data}")
     
     try:
-        # 使用機器人處理訊息，傳入群組資訊
-        reply_message = bot.handle_message(user_id, message_text, is_group)
-        
-        # 如果沒有回應（群組中的非 @ai 訊息），直接返回
-        if reply_message is None:
-            return
-        
-        # 回覆訊息 - 加入更好的錯誤處理
-        try:
-            line_bot_api.reply_message(event.reply_token, reply_message)
-        except Exception as reply_error:
-            # 如果是 reply token 問題，不要拋出錯誤（避免 500 錯誤）
-            if "Invalid reply token" in str(reply_error):
-                logger.info("Reply token 已過期或重複使用，這是正常的重送請求")
-            else:
-                raise reply_error
-        
+        reply_message = bot.handle_postback(user_id, event.postback.data, is_group)
     except Exception as e:
-        logger.error(f"處理訊息時發生錯誤: {e}")
-        
-        # 只有在 reply token 有效時才嘗試回覆錯誤訊息
-        try:
-            error_message = TextSendMessage(text="❌ 系統發生錯誤，請稍後再試。")
-            line_bot_api.reply_message(event.reply_token, error_message)
-        except:
-            logger.info("無法發送錯誤訊息，可能是 reply token 問題")
+        logger.error(f"處理 postback 時發生錯誤: {e}")
+        return
+    send_reply(event, reply_message)
 
 @app.route("/")
 def index():
@@ -1216,80 +1448,56 @@ def version_info():
     except Exception as e:
         return f"版本檢查錯誤: {str(e)}"
 
+def fallback_profile(user_id):
+    """查不到用戶資料時顯示的內容"""
+    return {
+        'display_name': f'用戶 {user_id[:8]}...',
+        'picture_url': None,
+        'status_message': None
+    }
+
+def fetch_line_profile(user_id):
+    """向 LINE API 查詢用戶資料（失敗時拋出例外，由 profile_cache 記錄負快取）"""
+    profile = line_bot_api.get_profile(user_id)
+    return {
+        'display_name': profile.display_name,
+        'picture_url': profile.picture_url,
+        'status_message': profile.status_message
+    }
+
+# 用戶資料快取：記憶體 LRU → user_profiles → LINE API，過期的在背景更新
+profile_cache = ProfileCache(
+    db, fetch_line_profile,
+    max_size=PROFILE_CACHE_SIZE,
+    ttl_seconds=PROFILE_TTL_HOURS * 3600,
+    negative_ttl_seconds=PROFILE_NEGATIVE_TTL_SECONDS,
+    negative_max_seconds=PROFILE_NEGATIVE_MAX_SECONDS,
+    fetch_workers=ADMIN_PROFILE_FETCH_WORKERS,
+    refresh_workers=PROFILE_REFRESH_WORKERS
+)
+
 def get_user_profile(user_id):
-    """獲取 LINE 用戶資料，優先從資料庫查詢"""
+    """獲取 LINE 用戶資料（經過 profile_cache），查不到時回傳預設顯示內容"""
     try:
-        # 先從資料庫查詢
-        profile_data = db.get_user_profile(user_id)
-        
-        if profile_data:
-            # 如果資料庫有資料，直接使用
-            return profile_data
-        else:
-            # 如果資料庫沒有，從 LINE API 查詢
-            try:
-                profile = line_bot_api.get_profile(user_id)
-                profile_data = {
-                    'display_name': profile.display_name,
-                    'picture_url': profile.picture_url,
-                    'status_message': profile.status_message
-                }
-                
-                # 儲存到資料庫供下次使用
-                db.save_user_profile(
-                    user_id, 
-                    profile.display_name, 
-                    profile.picture_url, 
-                    profile.status_message
-                )
-                
-                return profile_data
-                
-            except Exception as api_error:
-                logger.error(f"LINE API 查詢失敗: {api_error}")
-                return {
-                    'display_name': f'用戶 {user_id[:8]}...',
-                    'picture_url': None,
-                    'status_message': None
-                }
-                
+        return profile_cache.get(user_id) or fallback_profile(user_id)
     except Exception as e:
         logger.error(f"獲取用戶資料失敗: {e}")
-        return {
-            'display_name': f'用戶 {user_id[:8]}...',
-            'picture_url': None,
-            'status_message': None
-        }
+        return fallback_profile(user_id)
 
 @app.route("/admin")
 def admin_dashboard():
     """管理員儀表板"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # 取得所有用戶的記錄統計
-        if db.use_postgresql:
-            cursor.execute('''
-                SELECT user_id, COUNT(*) as count, SUM(amount) as total, MAX(timestamp) as last_record
-                FROM expenses
-                GROUP BY user_id
-                ORDER BY last_record DESC
-            ''')
-        else:
-            cursor.execute('''
-                SELECT user_id, COUNT(*) as count, SUM(amount) as total, MAX(timestamp) as last_record
-                FROM expenses
-                GROUP BY user_id
-                ORDER BY last_record DESC
-            ''')
-        
-        users = cursor.fetchall()
-        conn.close()
-        
-        # 轉換 PostgreSQL 結果
-        if db.use_postgresql:
-            users = [tuple(user.values()) for user in users]
+        # 取得所有用戶的記錄統計（同一個查詢帶出已儲存的用戶資料）
+        users = db.get_user_summaries()
+        
+        # 已儲存的資料交給快取判斷是否過期；沒有資料的並行向 LINE API 補抓
+        stored = {
+            user_id: ({'display_name': display_name, 'picture_url': picture_url, 'status_message': status_message}
+                      if display_name is not None else None, last_updated)
+            for user_id, _, _, _, display_name, picture_url, status_message, last_updated in users
+        }
+        profiles = profile_cache.get_many(list(stored), stored=stored, fetch_limit=ADMIN_PROFILE_FETCH_LIMIT)
         
         html = f"""
         <!DOCTYPE html>
@@ -1332,9 +1540,8 @@ def admin_dashboard():
                 </tr>
         """
         
-        for user_id, count, total, last_record in users:
-            # 獲取用戶資料
-            user_profile = get_user_profile(user_id)
+        for user_id, count, total_cents, last_record, *_ in users:
+            user_profile = profiles.get(user_id) or fallback_profile(user_id)
             display_name = user_profile['display_name']
             picture_url = user_profile['picture_url']
             
@@ -1353,8 +1560,8 @@ def admin_dashboard():
                         </div>
                     </td>
                     <td>{count}</td>
-                    <td>${total:.0f}</td>
-                    <td>{last_record}</td>
+                    <td>${format_amount(total_cents)}</td>
+                    <td>{format_local(last_record, '%Y-%m-%d %H:%M:%S')}</td>
                     <td><a href="/admin/user/{user_id}">查看詳細</a></td>
                 </tr>
             """
@@ -1376,6 +1583,103 @@ def admin_dashboard():
     except Exception as e:
         return f"錯誤: {str(e)}"
 
+def render_expense_filters(query, action, show_user=True, error=None):
+    """管理頁面的篩選表單（GET），目前的條件會帶入欄位"""
+    args = query.to_args()
+    
+    def field(name, label, input_type='text', size=12):
+        value = escape(str(args.get(name, '')))
+        return f'<label>{label} <input type="{input_type}" name="{name}" value="{value}" size="{size}"></label> '
+    
+    html = f'<form class="filters" method="get" action="{action}">'
+    if show_user:
+        html += field('user', '用戶ID', size=20)
+    html += field('from', '從', 'date') + field('to', '到', 'date')
+    html += field('min', '金額 ≥', size=6) + field('max', '≤', size=6)
+    html += field('q', '描述包含', size=12)
+    html += f'<input type="hidden" name="sort" value="{query.sort}">'
+    html += f'<input type="hidden" name="order" value="{"desc" if query.descending else "asc"}">'
+    html += field('limit', '每頁', 'number', size=4)
+    html += f'<button type="submit">篩選</button> <a href="{action}">清除</a></form>'
+    if error:
+        html += f'<p class="error">❌ {escape(error)}</p>'
+    return html
+
+def sort_link(query, action, sort, label):
+    """可排序的表頭：點同一欄切換遞增 / 遞減，換欄位時從第一頁開始"""
+    descending = not query.descending if query.sort == sort else True
+    args = query.to_args(sort=sort if sort != 'time' else None, order=None if descending else 'asc', cursor=None)
+    arrow = (' ▼' if query.descending else ' ▲') if query.sort == sort else ''
+    return f'<a href="{action}?{escape(urlencode(args))}">{label}{arrow}</a>'
+
+def render_pagination(query, action, next_cursor, row_count):
+    """分頁連結：keyset 分頁只提供「第一頁」與「下一頁」"""
+    links = [f'本頁 {row_count} 筆']
+    if query.cursor:
+        links.append(f'<a href="{action}?{escape(urlencode(query.to_args(cursor=None)))}">⏮ 第一頁</a>')
+    if next_cursor:
+        links.append(f'<a href="{action}?{escape(urlencode(query.to_args(cursor=next_cursor)))}">下一頁 ▶</a>')
+    return '<div class="pagination">' + ' ｜ '.join(links) + '</div>'
+
+def chunked(parts, size=50):
+    """把逐筆產生的 HTML 片段每 size 筆合併成一段送出，減少串流回應的小封包"""
+    buffer = []
+    for part in parts:
+        buffer.append(part)
+        if len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer.clear()
+    if buffer:
+        yield ''.join(buffer)
+
+def render_user_expense_row(expense):
+    """用戶詳情頁面的一列記錄"""
+    expense_id, _, amount_cents, location, description, category, timestamp = expense
+    return f"""
+                <tr>
+                    <td><input type="checkbox" name="selected_ids" value="{expense_id}" onchange="updateBatchDeleteButton()"></td>
+                    <td>#{expense_id}</td>
+                    <td>${format_amount(amount_cents)}</td>
+                    <td>{location or '-'}</td>
+                    <td>{description}</td>
+                    <td>{category or '-'}</td>
+                    <td>{format_local(timestamp, '%Y-%m-%d %H:%M:%S')}</td>
+                    <td>
+                        <button class="delete-btn" onclick="deleteRecord({expense_id}, '{description}')">
+                            🗑️ 刪除
+                        </button>
+                    </td>
+                </tr>
+                """
+
+def render_expense_row(expense, action):
+    """所有記錄頁面的一列記錄（含用戶連結）"""
+    expense_id, user_id, amount_cents, location, description, category, timestamp = expense
+    return f"""
+                <tr>
+                    <td><input type="checkbox" name="selected_ids" value="{expense_id}" onchange="updateBatchDeleteButton()"></td>
+                    <td>#{expense_id}</td>
+                    <td><a href="{action}?{escape(urlencode({'user': user_id}))}">{user_id[:15]}...</a></td>
+                    <td>${format_amount(amount_cents)}</td>
+                    <td>{location or '-'}</td>
+                    <td>{description}</td>
+                    <td>{category or '-'}</td>
+                    <td>{format_local(timestamp, '%Y-%m-%d %H:%M:%S')}</td>
+                    <td>
+                        <button class="delete-btn" onclick="deleteRecord({expense_id}, '{description}')">
+                            🗑️ 刪除
+                        </button>
+                    </td>
+                </tr>
+            """
+
+def parse_expense_query(user_id=None):
+    """從網址參數建立 ExpenseQuery，格式錯誤時改用預設條件並回傳錯誤訊息"""
+    try:
+        return ExpenseQuery.from_args(request.args, user_id=user_id), None
+    except ValueError as e:
+        return ExpenseQuery(user_id=user_id), str(e)
+
 @app.route("/admin/user/<user_id>")
 def admin_user_detail(user_id):
     """查看特定用戶的詳細記錄"""
@@ -1383,33 +1687,11 @@ def admin_user_detail(user_id):
         # 獲取用戶資料
         user_profile = get_user_profile(user_id)
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        if db.use_postgresql:
-            cursor.execute('''
-                SELECT id, amount, location, description, category, timestamp
-                FROM expenses
-                WHERE user_id = %s
-                ORDER BY timestamp DESC
-            ''', (user_id,))
-        else:
-            cursor.execute('''
-                SELECT id, amount, location, description, category, timestamp
-                FROM expenses
-                WHERE user_id = ?
-                ORDER BY timestamp DESC
-            ''', (user_id,))
-        
-        expenses = cursor.fetchall()
-        conn.close()
-        
-        # 轉換 PostgreSQL 結果
-        if db.use_postgresql:
-            expenses = [tuple(expense.values()) for expense in expenses]
-        
-        # 計算統計
-        total = sum(expense[1] for expense in expenses)
+        # 只取一頁（keyset 分頁），統計數字讀取每月彙總表
+        query, error = parse_expense_query(user_id)
+        total, total_count = db.get_user_total(user_id)
+        page = ExpensePage(query, db.iter_expenses(query))
+        action = f"/admin/user/{user_id}"
         
         html = f"""
         <!DOCTYPE html>
@@ -1435,6 +1717,11 @@ def admin_user_detail(user_id):
                 .batch-delete-btn:hover {{ background-color: #da190b; }}
                 .clear-all-btn {{ background-color: #ff5722; color: white; padding: 8px 16px; border: none; border-radius: 5px; cursor: pointer; margin-left: 10px; }}
                 .clear-all-btn:hover {{ background-color: #d84315; }}
+                .filters {{ margin: 15px 0; padding: 10px; background-color: #f5f5f5; border-radius: 5px; }}
+                .filters label {{ margin-right: 8px; }}
+                .pagination {{ margin: 15px 0; }}
+                .error {{ color: #d32f2f; }}
+                th a {{ color: inherit; text-decoration: none; }}
             </style>
             <script>
                 function deleteRecord(id, description) {{
@@ -1510,7 +1797,7 @@ def admin_user_detail(user_id):
                     const userId = '{user_id}';
                     const userName = '{user_profile.get("displayName", "用戶")}';
                     
-                    if (confirm(`⚠️ 危險操作 ⚠️\\n\\n確定要刪除用戶 "${{userName}}" 的所有記錄嗎？\\n\\n這將刪除該用戶的所有 {len(expenses)} 筆記錄！\\n此操作無法撤銷！\\n\\n請再次確認！`)) {{
+                    if (confirm(`⚠️ 危險操作 ⚠️\\n\\n確定要刪除用戶 "${{userName}}" 的所有記錄嗎？\\n\\n這將刪除該用戶的所有 {total_count} 筆記錄！\\n此操作無法撤銷！\\n\\n請再次確認！`)) {{
                         if (confirm(`最後確認：真的要刪除用戶 "${{userName}}" 的所有記錄嗎？`)) {{
                             fetch('/admin/clear-user/' + userId, {{
                                 method: 'POST',
@@ -1559,7 +1846,9 @@ def admin_user_detail(user_id):
             </div>
         """
         
-        if expenses:
+        html += render_expense_filters(query, action, show_user=False, error=error)
+        
+        if page:
             html += f"""
             <div class="batch-actions">
                 <h3>🔧 批量操作</h3>
@@ -1577,83 +1866,72 @@ def admin_user_detail(user_id):
             <table>
                 <tr>
                     <th>選擇</th>
-                    <th>ID</th>
-                    <th>金額</th>
+                    <th>{sort_link(query, action, 'id', 'ID')}</th>
+                    <th>{sort_link(query, action, 'amount', '金額')}</th>
                     <th>地點</th>
                     <th>描述</th>
                     <th>分類</th>
-                    <th>時間</th>
+                    <th>{sort_link(query, action, 'time', '時間')}</th>
                     <th>操作</th>
                 </tr>
             """
             
-            for expense in expenses:
-                expense_id, amount, location, description, category, timestamp = expense
-                html += f"""
-                <tr>
-                    <td><input type="checkbox" name="selected_ids" value="{expense_id}" onchange="updateBatchDeleteButton()"></td>
-                    <td>#{expense_id}</td>
-                    <td>${amount:.0f}</td>
-                    <td>{location or '-'}</td>
-                    <td>{description}</td>
-                    <td>{category or '-'}</td>
-                    <td>{timestamp}</td>
-                    <td>
-                        <button class="delete-btn" onclick="deleteRecord({expense_id}, '{description}')">
-                            🗑️ 刪除
-                        </button>
-                    </td>
-                </tr>
+        def generate():
+            # 頁首先送出，記錄邊讀邊送，瀏覽器不用等整頁組好
+            yield html
+            try:
+                if page:
+                    yield from chunked(render_user_expense_row(expense) for expense in page)
+                    yield "</table>" + render_pagination(query, action, page.next_cursor, page.count)
+                elif total_count:
+                    yield "<p>沒有符合條件的記錄</p>"
+                else:
+                    yield "<p>該用戶暫無記錄</p>"
+                
+                # 最近 12 個月統計（單一查詢）
+                start_month, end_month = recent_month_range(datetime.now(), 12)
+                monthly_totals = db.get_monthly_totals(user_id, start_month, end_month)
+                
+                tail = """
+                <div class="stats">
+                    <h3>📅 最近 12 個月</h3>
+                    <table>
+                        <tr><th>月份</th><th>記錄筆數</th><th>總金額</th></tr>
                 """
-            
-            html += "</table>"
-        else:
-            html += "<p>該用戶暫無記錄</p>"
-        
-        html += f"""
-            <div class="stats">
-                <h3>📊 統計摘要</h3>
-                <p>記錄數量: {len(expenses)}</p>
-                <p>總支出: ${total:.0f}</p>
-                <p>平均支出: ${total/len(expenses):.0f if expenses else 0}</p>
-            </div>
-        </body>
-        </html>
-        """
+                for year, month, cents, count in reversed(monthly_totals):
+                    tail += f"<tr><td>{year}年{month}月</td><td>{count}</td><td>${format_amount(cents)}</td></tr>"
+                tail += f"""
+                    </table>
+                </div>
+                
+                <div class="stats">
+                    <h3>📊 統計摘要</h3>
+                    <p>記錄數量: {total_count}</p>
+                    <p>總支出: ${format_amount(total)}</p>
+                    <p>平均支出: ${format_average(total, total_count)}</p>
+                </div>
+                """
+                yield tail
+            except Exception as e:
+                # 回應已經開始傳送，無法改狀態碼，把錯誤顯示在頁面上
+                logger.error(f"產生用戶詳情頁面時發生錯誤: {e}")
+                yield f"<p class=\"error\">❌ 錯誤: {escape(str(e))}</p>"
+            finally:
+                page.close()
+            yield "</body></html>"
         
-        return html
+        return Response(stream_with_context(generate()), mimetype='text/html')
         
     except Exception as e:
         return f"錯誤: {str(e)}"
 
 @app.route("/admin/expenses")
 def admin_all_expenses():
-    """查看所有記錄"""
+    """查看所有記錄（可篩選、排序，keyset 分頁）"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        if db.use_postgresql:
-            cursor.execute('''
-                SELECT id, user_id, amount, location, description, category, timestamp
-                FROM expenses
-                ORDER BY timestamp DESC
-                LIMIT 100
-            ''')
-        else:
-            cursor.execute('''
-                SELECT id, user_id, amount, location, description, category, timestamp
-                FROM expenses
-                ORDER BY timestamp DESC
-                LIMIT 100
-            ''')
-        
-        expenses = cursor.fetchall()
-        conn.close()
-        
-        # 轉換 PostgreSQL 結果
-        if db.use_postgresql:
-            expenses = [tuple(expense.values()) for expense in expenses]
+        query, error = parse_expense_query()
+        page = ExpensePage(query, db.iter_expenses(query))
+        action = "/admin/expenses"
         
         html = f"""
         <!DOCTYPE html>
@@ -1675,6 +1953,11 @@ def admin_all_expenses():
                 .batch-delete-btn {{ background-color: #f44336; color: white; padding: 8px 16px; border: none; border-radius: 5px; cursor: pointer; }}
                 .batch-delete-btn:hover {{ background-color: #da190b; }}
                 .stats {{ background-color: #e3f2fd; padding: 15px; margin: 20px 0; border-radius: 5px; }}
+                .filters {{ margin: 15px 0; padding: 10px; background-color: #f5f5f5; border-radius: 5px; }}
+                .filters label {{ margin-right: 8px; }}
+                .pagination {{ margin: 15px 0; }}
+                .error {{ color: #d32f2f; }}
+                th a {{ color: inherit; text-decoration: none; }}
             </style>
             <script>
                 function deleteRecord(id, description) {{
@@ -1750,13 +2033,15 @@ def admin_all_expenses():
         <body>
             <div class="header">
                 <h1>📋 所有記錄管理</h1>
-                <p>最近 100 筆記錄 (可刪除)</p>
+                <p>依條件篩選與排序，每頁 {query.limit} 筆 (可刪除)</p>
             </div>
             
             <div class="back">
                 <a href="/admin">← 返回管理首頁</a>
             </div>
             
+            {render_expense_filters(query, action, error=error)}
+            
             <div class="batch-actions">
                 <h3>🔧 批量操作</h3>
                 <label class="select-all">
@@ -1770,86 +2055,141 @@ def admin_all_expenses():
             <table>
                 <tr>
                     <th>選擇</th>
-                    <th>ID</th>
+                    <th>{sort_link(query, action, 'id', 'ID')}</th>
                     <th>用戶ID</th>
-                    <th>金額</th>
+                    <th>{sort_link(query, action, 'amount', '金額')}</th>
                     <th>地點</th>
                     <th>描述</th>
                     <th>分類</th>
-                    <th>時間</th>
+                    <th>{sort_link(query, action, 'time', '時間')}</th>
                     <th>操作</th>
                 </tr>
         """
         
-        total = 0
-        for expense in expenses:
-            expense_id, user_id, amount, location, description, category, timestamp = expense
-            total += amount
-            html += f"""
-                <tr>
-                    <td><input type="checkbox" name="selected_ids" value="{expense_id}" onchange="updateBatchDeleteButton()"></td>
-                    <td>#{expense_id}</td>
-                    <td>{user_id[:15]}...</td>
-                    <td>${amount:.0f}</td>
-                    <td>{location or '-'}</td>
-                    <td>{description}</td>
-                    <td>{category or '-'}</td>
-                    <td>{timestamp}</td>
-                    <td>
-                        <button class="delete-btn" onclick="deleteRecord({expense_id}, '{description}')">
-                            🗑️ 刪除
-                        </button>
-                    </td>
-                </tr>
-            """
-        
-        html += f"""
+        def generate():
+            # 頁首先送出，記錄邊讀邊送，瀏覽器不用等整頁組好
+            yield html
+            try:
+                yield from chunked(render_expense_row(expense, action) for expense in page)
+                yield f"""
             </table>
+            {render_pagination(query, action, page.next_cursor, page.count)}
             
             <div class="stats">
                 <h3>📊 統計摘要</h3>
-                <p>顯示記錄數: {len(expenses)}</p>
-                <p>顯示總金額: ${total:.0f}</p>
+                <p>顯示記錄數: {page.count}</p>
+                <p>顯示總金額: ${format_amount(page.total_cents)}</p>
             </div>
-        </body>
-        </html>
-        """
+                """
+            except Exception as e:
+                # 回應已經開始傳送，無法改狀態碼，把錯誤顯示在頁面上
+                logger.error(f"產生記錄頁面時發生錯誤: {e}")
+                yield f"</table><p class=\"error\">❌ 錯誤: {escape(str(e))}</p>"
+            finally:
+                page.close()
+            yield "</body></html>"
         
-        return html
+        return Response(stream_with_context(generate()), mimetype='text/html')
         
     except Exception as e:
         return f"錯誤: {str(e)}"
 
+@app.route("/admin/api/expenses")
+def admin_api_expenses():
+    """支出記錄 JSON（參數同 /admin/expenses，每頁最多 MAX_STREAM_PAGE_SIZE 筆），邊查詢邊輸出"""
+    try:
+        query = ExpenseQuery.from_args(request.args, max_limit=MAX_STREAM_PAGE_SIZE)
+        page = ExpensePage(query, db.iter_expenses(query))
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    except Exception as e:
+        logger.error(f"查詢記錄失敗: {e}")
+        return {"success": False, "error": str(e)}, 500
+    
+    def generate():
+        yield '{"expenses":['
+        separator = ''
+        try:
+            for expense_id, user_id, amount_cents, location, description, category, timestamp in page:
+                yield separator + json.dumps({
+                    "id": expense_id,
+                    "user_id": user_id,
+                    "amount": format_amount(amount_cents),
+                    "amount_cents": amount_cents,
+                    "location": location,
+                    "description": description,
+                    "category": category,
+                    "timestamp": timestamp.isoformat() if timestamp else None
+                }, ensure_ascii=False)
+                separator = ','
+        except Exception as e:
+            # 已經開始輸出，改以 error 欄位回報
+            logger.error(f"輸出記錄 JSON 時發生錯誤: {e}")
+            yield '],"error":' + json.dumps(str(e), ensure_ascii=False) + '}'
+            return
+        finally:
+            page.close()
+        yield '],"count":%d,"next_cursor":%s}' % (page.count, json.dumps(page.next_cursor))
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route("/admin/export")
+def admin_export():
+    """匯出支出記錄（CSV / JSONL / XLSX），邊查詢邊輸出
+    
+    參數：format（csv / jsonl / xlsx）、gzip=1、user、from、to 及其他 /admin/expenses 的篩選條件；
+    中斷後以 after_id（已收到的最後一筆編號）與回應標頭 X-Export-Until-Id 的 until_id 接續。
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return {"success": False, "error": f"不支援的匯出格式: {fmt}"}, 400
+    try:
+        after_id = parse_id_arg('after_id')
+        until_id = parse_id_arg('until_id')
+        filters = ExpenseQuery.from_args(request.args)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    
+    try:
+        if until_id is None:
+            until_id = db.get_max_expense_id()
+        export = ExpenseExport(db, filters.for_export(after_id, until_id), fmt,
+                               compress=request.args.get('gzip') == '1', header=after_id is None)
+    except Exception as e:
+        logger.error(f"匯出記錄失敗: {e}")
+        return {"success": False, "error": str(e)}, 500
+    
+    filename = f"expenses_{until_id}"
+    if after_id:
+        filename += f"_after_{after_id}"
+    response = Response(stream_with_context(iter(export)), mimetype=export.mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{export.extension}"'
+    response.headers['X-Export-Until-Id'] = str(until_id)
+    return response
+
+def parse_id_arg(name):
+    """讀取網址中的記錄編號參數，沒有時回傳 None"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"{name} 格式錯誤")
+    return int(value)
+
 @app.route("/admin/delete/<int:expense_id>", methods=['POST'])
 def admin_delete_expense(expense_id):
     """刪除單筆記錄"""
     try:
         # 先獲取記錄詳情用於記錄
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        if db.use_postgresql:
-            cursor.execute('SELECT user_id, amount, description FROM expenses WHERE id = %s', (expense_id,))
-        else:
-            cursor.execute('SELECT user_id, amount, description FROM expenses WHERE id = ?', (expense_id,))
-        
-        record = cursor.fetchone()
+        record = db.get_expense(expense_id)
         if not record:
-            conn.close()
             return {"success": False, "error": "記錄不存在"}
         
-        # 執行刪除
-        if db.use_postgresql:
-            cursor.execute('DELETE FROM expenses WHERE id = %s', (expense_id,))
-        else:
-            cursor.execute('DELETE FROM expenses WHERE id = ?', (expense_id,))
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        # 執行刪除（同時更新每月彙總）
+        deleted_count = db.delete_expenses_by_ids([expense_id])
         
         if deleted_count > 0:
-            logger.info(f"管理員刪除記錄: ID={expense_id}, 用戶={record[0] if db.use_postgresql else record[0]}")
+            logger.info(f"管理員刪除記錄: ID={expense_id}, 用戶={record[1]}")
             return {"success": True, "message": "刪除成功"}
         else:
             return {"success": False, "error": "記錄不存在或已被刪除"}
@@ -1868,20 +2208,8 @@ def admin_batch_delete():
         if not ids:
             return {"success": False, "error": "沒有選擇要刪除的記錄"}
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # 構建批量刪除 SQL
-        if db.use_postgresql:
-            placeholders = ','.join(['%s'] * len(ids))
-            cursor.execute(f'DELETE FROM expenses WHERE id IN ({placeholders})', ids)
-        else:
-            placeholders = ','.join(['?'] * len(ids))
-            cursor.execute(f'DELETE FROM expenses WHERE id IN ({placeholders})', ids)
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        # 批量刪除（同時更新每月彙總）
+        deleted_count = db.delete_expenses_by_ids([int(expense_id) for expense_id in ids])
         
         logger.info(f"管理員批量刪除: {deleted_count} 筆記錄, IDs={ids}")
         return {"success": True, "deleted_count": deleted_count, "message": f"成功刪除 {deleted_count} 筆記錄"}
@@ -1894,32 +2222,12 @@ def admin_batch_delete():
 def admin_clear_user_records(user_id):
     """清空特定用戶的所有記錄"""
     try:
-        # 先檢查用戶是否存在記錄
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        if db.use_postgresql:
-            cursor.execute('SELECT COUNT(*) FROM expenses WHERE user_id = %s', (user_id,))
-        else:
-            cursor.execute('SELECT COUNT(*) FROM expenses WHERE user_id = ?', (user_id,))
-        
-        count_result = cursor.fetchone()
-        record_count = count_result[0] if isinstance(count_result, (list, tuple)) else count_result['count']
+        # 清空記錄及每月彙總
+        record_count, deleted_count = db.clear_all_expenses(user_id)
         
         if record_count == 0:
-            conn.close()
             return {"success": False, "error": "該用戶沒有記錄可刪除"}
         
-        # 執行刪除
-        if db.use_postgresql:
-            cursor.execute('DELETE FROM expenses WHERE user_id = %s', (user_id,))
-        else:
-            cursor.execute('DELETE FROM expenses WHERE user_id = ?', (user_id,))
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
-        
         logger.info(f"管理員清空用戶記錄: 用戶={user_id}, 刪除數量={deleted_count}")
         return {"success": True, "deleted_count": deleted_count, "message": f"成功清空用戶所有記錄"}
         
@@ -1927,5 +2235,137 @@ def admin_clear_user_records(user_id):
         logger.error(f"清空用戶記錄失敗: {e}")
         return {"success": False, "error": str(e)}
 
+@app.route("/admin/stats")
+def admin_stats():
+    """所有用戶的每月統計（最近 12 個月）"""
+    try:
+        start_month, end_month = recent_month_range(datetime.now(), 12)
+        monthly_totals = db.get_monthly_totals(None, start_month, end_month)
+        
+        html = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>詳細統計 - LINE 記帳機器人</title>
+            <meta charset="UTF-8">
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; }}
+                table {{ border-collapse: collapse; width: 100%; }}
+                th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+                th {{ background-color: #f2f2f2; }}
+                .header {{ background-color: #2196F3; color: white; padding: 20px; text-align: center; }}
+                .back {{ margin: 20px 0; }}
+                .stats {{ background-color: #f9f9f9; padding: 15px; margin: 20px 0; }}
+            </style>
+        </head>
+        <body>
+            <div class="header">
+                <h1>📊 詳細統計</h1>
+                <p>所有用戶最近 12 個月支出</p>
+            </div>
+            
+            <div class="back">
+                <a href="/admin">← 返回管理首頁</a>
+            </div>
+            
+            <table>
+                <tr>
+                    <th>月份</th>
+                    <th>記錄筆數</th>
+                    <th>總金額</th>
+                    <th>平均每筆</th>
+                </tr>
+        """
+        
+        for year, month, cents, count in reversed(monthly_totals):
+            average = f"${format_average(cents, count)}" if count else "-"
+            html += f"""
+                <tr>
+                    <td>{year}年{month}月</td>
+                    <td>{count}</td>
+                    <td>${format_amount(cents)}</td>
+                    <td>{average}</td>
+                </tr>
+            """
+        
+        total_cents = sum(row[2] for row in monthly_totals)
+        total_count = sum(row[3] for row in monthly_totals)
+        
+        html += f"""
+            </table>
+            
+            <div class="stats">
+                <h3>📊 12 個月合計</h3>
+                <p>記錄數量: {total_count}</p>
+                <p>總支出: ${format_amount(total_cents)}</p>
+            </div>
+        </body>
+        </html>
+        """
+        
+        return html
+        
+    except Exception as e:
+        return f"錯誤: {str(e)}"
+
+@app.route("/admin/metrics")
+def admin_metrics():
+    """系統運行指標（JSON）"""
+    return {
+        "db_pool": db.get_pool_stats(),
+        "sql": db.get_sql_stats(),
+        "webhook": webhook_workers.stats(),
+        "inbox": inbox.stats(),
+        "dedupe": event_dedupe.stats(),
+        "line_api": line_bot_api.http_client.stats(),
+        "replies": reply_sender.stats(),
+        "profiles": profile_cache.stats()
+    }
+
+# 背景處理 webhook 事件：收件匣與工作執行緒在第一次收到請求（或以 python line_bot.py 啟動）時才建立，
+# 匯入模組（例如測試、manage.py）不會開啟收件匣或啟動執行緒
+event_dedupe = EventDeduplicator(db, max_size=WEBHOOK_DEDUPE_CACHE_SIZE, ttl_seconds=WEBHOOK_DEDUPE_TTL_HOURS * 3600)
+inbox = None
+webhook_workers = None
+webhook_runtime_lock = threading.Lock()
+
+def start_webhook_runtime():
+    """開啟收件匣、找回上次未處理完的事件並啟動工作執行緒（只會執行一次）"""
+    global inbox, webhook_workers
+    with webhook_runtime_lock:
+        if webhook_workers is not None:
+            return
+        inbox = EventInbox(INBOX_DB_PATH, max_attempts=INBOX_MAX_ATTEMPTS, retention_hours=INBOX_RETENTION_HOURS,
+                           retry_delay=INBOX_RETRY_DELAY)
+        pending_events = inbox.recover()
+        webhook_workers = WebhookWorkerPool(process_inbox, num_workers=WEBHOOK_WORKERS,
+                                            max_queue_size=WEBHOOK_QUEUE_SIZE)
+        if pending_events:
+            webhook_workers.submit(None)
+
+        atexit.register(shutdown_webhook_workers)
+        try:
+            signal.signal(signal.SIGTERM, shutdown_webhook_workers)
+        except ValueError:
+            # 只有主執行緒可以註冊 signal handler（在請求處理執行緒中啟動時略過）
+            pass
+
+@app.before_request
+def ensure_webhook_runtime():
+    if webhook_workers is None:
+        start_webhook_runtime()
+
+def shutdown_webhook_workers(signum=None, frame=None):
+    """停止接收 webhook，等待處理中的事件完成（未處理的留在收件匣，下次啟動再處理）"""
+    if retry_timer is not None:
+        retry_timer.cancel()
+    webhook_workers.shutdown(WEBHOOK_DRAIN_TIMEOUT)
+    profile_cache.shutdown(wait=False)
+    if signum is not None:
+        sys.exit(0)
+
 if __name__ == "__main__":
+    # debug 模式由 reloader 子行程提供服務，只在該行程啟動背景工作，不必等第一個請求才找回未處理的事件
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_webhook_runtime()
     app.run(host='0.0.0.0', port=PORT, debug=True) 
\ No newline at end of file
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+LINE API 對外 HTTP 連線
+
+SDK 預設每次呼叫都用 requests.post / requests.get，沒有重用連線，
+每次回覆都要重新做 TLS 握手。這裡改用共用的 requests.Session：
+
+- keep-alive 連線池，工作執行緒共用
+- 連線 / 讀取逾時分開設定
+- 連線錯誤自動重試；讀取逾時與 5xx 只重試冪等的方法（GET / PUT / DELETE）。
+  POST（回覆、推播）可能已經送達只是回應太慢，重送會讓用戶收到兩次。
+  退避時間加上隨機抖動（full jitter），避免同時重試
+- 依端點記錄延遲分佈，可以看出延遲有多少來自 LINE 本身
+
+使用方式：LineBotApi(token, timeout=(connect, read), http_client=PooledHttpClient)
+"""
+
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.retry import Retry
+from linebot.http_client import HttpClient, RequestsHttpResponse
+
+# 延遲分佈的區間上限（毫秒），最後一格為超過 5 秒
+LATENCY_BUCKETS_MS = (25, 50, 100, 200, 400, 800, 1600, 3200, 5000)
+
+# 路徑中的用戶 / 群組 ID 與數字編號換成佔位符，同一種 API 歸在同一個端點
+_ID_SEGMENT = re.compile(r'/(?:[UCR][0-9a-f]{32}|\d+)(?=/|$)')
+
+
+def endpoint_key(method, url):
+    """把請求歸類為端點名稱，例如 'GET /v2/bot/profile/{id}'"""
+    path = url.split('://', 1)[-1]
+    path = path[path.find('/'):] if '/' in path else '/'
+    path = path.split('?', 1)[0]
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def is_connect_error(error):
+    """是否在建立連線時就失敗（請求沒有送出，可以安全地改用其他方式重送）"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, ConnectTimeoutError)  # 包含 NewConnectionError（無法連線、DNS 失敗）
+    return False
+
+
+class JitterRetry(Retry):
+    """退避時間在 0 ~ 指數退避值之間隨機取值"""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class LatencyHistogram:
+    """單一端點的延遲分佈"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms, error=False):
+        index = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if error:
+            self.errors += 1
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def percentile(self, ratio):
+        """以區間上限估計百分位數（毫秒）"""
+        if not self.count:
+            return 0.0
+        target = ratio * self.count
+        seen = 0
+        for i, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= target:
+                return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def as_dict(self):
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max_ms, 3),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class PooledHttpClient(HttpClient):
+    """以共用 requests.Session 實作的 LINE SDK HttpClient"""
+
+    def __init__(self, timeout=HttpClient.DEFAULT_TIMEOUT, pool_size=10, max_retries=2, backoff_factor=0.3):
+        """
+        Args:
+            timeout (float | tuple): 逾時秒數，或 (連線逾時, 讀取逾時)
+            pool_size (int): 保留的 keep-alive 連線數
+            max_retries (int): 最多重試次數（連線錯誤；冪等方法另外包含讀取逾時與 5xx）
+            backoff_factor (float): 指數退避的基準秒數
+        """
+        super().__init__(timeout)
+        retry = JitterRetry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            status_forcelist=(500, 502, 503, 504),
+            # 讀取逾時與 5xx 只重試冪等方法；連線錯誤時請求還沒送出，POST 也會重試
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            backoff_factor=backoff_factor,
+            raise_on_status=False,  # 重試用完後把最後的回應交給 SDK 處理錯誤
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._local = threading.local()
+
+    def _request(self, method, url, timeout, **kwargs):
+        started = time.perf_counter()
+        error = False
+        self._local.retries = 0
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            retries = getattr(response.raw, 'retries', None)
+            self._local.retries = len(retries.history) if retries else 0
+            error = response.status_code >= 500
+            return RequestsHttpResponse(response)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._record(endpoint_key(method, url), (time.perf_counter() - started) * 1000, error)
+
+    def _record(self, key, elapsed_ms, error):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(elapsed_ms, error)
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request('GET', url, timeout, headers=headers, params=params, stream=stream)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request('POST', url, timeout, headers=headers, data=data)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request('DELETE', url, timeout, headers=headers, data=data)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request('PUT', url, timeout, headers=headers, data=data)
+
+    def last_retries(self):
+        """目前執行緒上一個請求的重試次數（呼叫端判斷第一次送出是否已經到達 LINE）"""
+        return getattr(self._local, 'retries', 0)
+
+    def stats(self):
+        """各端點的延遲分佈（含重試與退避時間）"""
+        with self._lock:
+            return {key: histogram.as_dict() for key, histogram in sorted(self._histograms.items())}
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+資料庫管理工具
+
+用法：
+    python manage.py rebuild-rollups          # 重新計算每月彙總表
+    python manage.py rebuild-rollups --check  # 只比對，不修改
+    python manage.py import-expenses data.csv # 從 CSV 批量匯入支出記錄
+    python manage.py export expenses.csv.gz   # 匯出支出記錄（CSV / JSONL / XLSX，依副檔名判斷）
+    python manage.py export expenses.csv --resume  # 接續上次中斷的匯出
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+
+# 管理指令不需要 LINE 憑證
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rebuild_rollups(db, args):
+    """比對並重建每月彙總表"""
+    mismatches = db.check_monthly_rollups()
+
+    if mismatches:
+        print(f"⚠️ 每月彙總與原始記錄有 {len(mismatches)} 筆不一致:")
+        for item in mismatches[:20]:
+            print(f"  {item['user_id']} {item['month']} [{item['category'] or '-'}] "
+                  f"彙總={item['stored']} 實際={item['expected']}")
+        if len(mismatches) > 20:
+            print(f"  ... 其餘 {len(mismatches) - 20} 筆省略")
+    else:
+        print("✅ 每月彙總與原始記錄一致")
+
+    if args.check:
+        return 1 if mismatches else 0
+
+    row_count = db.rebuild_monthly_rollups()
+    print(f"✅ 已重建每月彙總表，共 {row_count} 列")
+    return 0
+
+
+def _read_expense_csv(path, default_user_id=None):
+    """讀取 CSV：欄位 user_id, amount（元）, description, location, category, timestamp
+
+    user_id 可由 --user 指定；timestamp 為 ISO 格式，沒有時區時視為 TIMEZONE 當地時間。
+    """
+    from money import to_cents
+    from timeutils import from_local
+
+    rows = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for line_number, record in enumerate(csv.DictReader(f), start=2):
+            user_id = (record.get('user_id') or '').strip() or default_user_id
+            if not user_id:
+                raise ValueError(f"第 {line_number} 行缺少 user_id（或使用 --user 指定）")
+            try:
+                amount_cents = to_cents(record['amount'])
+                timestamp = (record.get('timestamp') or '').strip()
+                timestamp = from_local(datetime.fromisoformat(timestamp)) if timestamp else None
+            except (KeyError, ValueError) as e:
+                raise ValueError(f"第 {line_number} 行格式錯誤: {e}")
+            rows.append({
+                'user_id': user_id,
+                'amount_cents': amount_cents,
+                'description': record.get('description') or None,
+                'location': record.get('location') or None,
+                'category': record.get('category') or None,
+                'timestamp': timestamp,
+            })
+    return rows
+
+
+def import_expenses(db, args):
+    """從 CSV 批量匯入支出記錄，每批一個交易"""
+    try:
+        rows = _read_expense_csv(args.file, args.user)
+    except (OSError, ValueError) as e:
+        print(f"❌ 讀取失敗: {e}")
+        return 1
+
+    print(f"📥 讀取 {len(rows)} 筆記錄，每批 {args.batch_size} 筆")
+    started = time.perf_counter()
+    imported = 0
+    for offset in range(0, len(rows), args.batch_size):
+        imported += len(db.add_expenses_bulk(rows[offset:offset + args.batch_size]))
+
+    elapsed = time.perf_counter() - started
+    rate = imported / elapsed if elapsed > 0 else 0
+    print(f"✅ 已匯入 {imported} 筆，耗時 {elapsed:.2f} 秒（{rate:,.0f} 筆/秒）")
+    return 0
+
+
+def _export_format(path, fmt):
+    """由 --format 或副檔名決定匯出格式與是否 gzip 壓縮"""
+    compress = path.endswith('.gz')
+    if fmt:
+        return fmt, compress
+    extension = path[:-3] if compress else path
+    return os.path.splitext(extension)[1].lstrip('.').lower() or 'csv', compress
+
+
+def export_expenses(db, args):
+    """匯出支出記錄到檔案，邊查詢邊寫入"""
+    from expense_browser import ExpenseQuery
+    from expense_export import ExpenseExport, FORMATS, last_exported_id
+
+    fmt, compress = _export_format(args.file, args.format)
+    if fmt not in FORMATS:
+        print(f"❌ 不支援的匯出格式: {fmt}（可用: {', '.join(FORMATS)}）")
+        return 1
+    try:
+        filters = ExpenseQuery.from_args({
+            'user': args.user or '', 'from': args.date_from or '', 'to': args.date_to or '',
+        })
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    after_id = args.after_id
+    header = after_id is None
+    mode = 'wb'
+    if args.resume:
+        if fmt == 'xlsx' or compress:
+            print("❌ --resume 只支援未壓縮的 CSV / JSONL，其他格式請使用 --after-id 另存新檔")
+            return 1
+        if os.path.exists(args.file):
+            after_id = last_exported_id(args.file, fmt)
+            header = os.path.getsize(args.file) == 0
+            mode = 'ab'
+            print(f"📤 接續匯出：從編號 {after_id} 之後開始" if after_id else "📤 檔案中沒有完整記錄，從頭開始")
+
+    until_id = args.until_id if args.until_id is not None else db.get_max_expense_id()
+    export = ExpenseExport(db, filters.for_export(after_id, until_id), fmt, compress=compress, header=header)
+
+    started = time.perf_counter()
+    with open(args.file, mode) as f:
+        for chunk in export:
+            f.write(chunk)
+
+    elapsed = time.perf_counter() - started
+    rate = export.count / elapsed if elapsed > 0 else 0
+    print(f"✅ 已匯出 {export.count} 筆到 {args.file}（編號上限 {until_id}），耗時 {elapsed:.2f} 秒（{rate:,.0f} 筆/秒）")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LINE 記帳機器人 - 資料庫管理工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = subparsers.add_parser('rebuild-rollups', help="從 expenses 重新計算每月彙總表")
+    rebuild.add_argument('--check', action='store_true', help="只比對，不重建")
+    rebuild.set_defaults(func=rebuild_rollups)
+
+    importer = subparsers.add_parser('import-expenses', help="從 CSV 批量匯入支出記錄")
+    importer.add_argument('file', help="CSV 檔案（欄位: user_id, amount, description, location, category, timestamp）")
+    importer.add_argument('--user', help="CSV 沒有 user_id 欄位時使用的用戶 ID")
+    importer.add_argument('--batch-size', type=int, default=1000, help="每個交易的筆數（預設 1000）")
+    importer.set_defaults(func=import_expenses)
+
+    exporter = subparsers.add_parser('export', help="匯出支出記錄（CSV / JSONL / XLSX）")
+    exporter.add_argument('file', help="輸出檔案，依副檔名決定格式，.gz 結尾時 gzip 壓縮（例如 expenses.jsonl.gz）")
+    exporter.add_argument('--format', choices=['csv', 'jsonl', 'xlsx'], help="指定格式（預設依副檔名）")
+    exporter.add_argument('--user', help="只匯出這個用戶")
+    exporter.add_argument('--from', dest='date_from', help="起始日期 YYYY-MM-DD（含）")
+    exporter.add_argument('--to', dest='date_to', help="結束日期 YYYY-MM-DD（含）")
+    exporter.add_argument('--after-id', type=int, help="只匯出編號大於此值的記錄")
+    exporter.add_argument('--until-id', type=int, help="只匯出編號不大於此值的記錄（預設為目前最大編號）")
+    exporter.add_argument('--resume', action='store_true', help="接續未完成的 CSV / JSONL 檔案（從最後一筆完整記錄之後）")
+    exporter.set_defaults(func=export_expenses)
+
+    args = parser.parse_args(argv)
+
+    from database import ExpenseDatabase
+    db = ExpenseDatabase()
+    try:
+        return args.func(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,17 +11,98 @@
 
 import re
 
-class MessageParser:
-    def __init__(self):
-        # 金額相關的正則表達式
-        self.amount_patterns = [
-            r'(\d+(?:\.\d+)?)\s*[元塊錢]',  # 120元, 50塊, 30錢
-            r'NT?\$\s*(\d+(?:\.\d+)?)',      # NT$100, $80
-            r'花了?\s*(\d+(?:\.\d+)?)',      # 花了60, 花60
-            r'(\d+(?:\.\d+)?)$',             # 純數字在最後
-            r'^(\d+(?:\.\d+)?)$',            # 純數字
-        ]
+from money import to_cents, format_amount
+
+_NUMBER = r'(\d+(?:\.\d+)?)'
+
+# 金額格式（依優先順序），以及判斷是否需要比對的觸發字元：
+# 訊息中沒有觸發字元的格式一定不會匹配，直接略過
+AMOUNT_PATTERNS = [
+    (re.compile(_NUMBER + r'\s*[元塊錢]'), '元塊錢'),  # 120元, 50塊, 30錢
+    (re.compile(r'NT?\$\s*' + _NUMBER), '$'),        # NT$100
+    (re.compile(r'花了?\s*' + _NUMBER), '花'),        # 花了60, 花60
+]
+TRAILING_AMOUNT = re.compile(_NUMBER + '$')           # 純數字在最後
+TRIGGER_CHARS = re.compile('[' + re.escape(''.join(chars for _, chars in AMOUNT_PATTERNS)) + ']')
+# 刪除可以一次多筆：/del #1 #2 #5-#9（也接受逗號、頓號分隔）
+_DELETE_ITEM = r'#\d+(?:\s*[-~]\s*#?\d+)?'
+DELETE_PATTERN = re.compile(rf'/del\s+({_DELETE_ITEM}(?:[\s,，、]*{_DELETE_ITEM})*)', re.IGNORECASE)
+DELETE_ITEM = re.compile(r'#(\d+)(?:\s*[-~]\s*#?(\d+))?')
+MAX_DELETE_IDS = 50  # 一次最多刪除的筆數，避免 #1-#99999 這類範圍
+
+# 一則訊息多筆記帳，必須明確標出每一筆：
+# 1. 以換行、逗號、頓號、分號分隔：「早餐 60，午餐 120、咖啡 50」
+# 2. 每個金額都有貨幣標記：「早餐 60元 午餐 120元」、「高鐵 1490元 計程車 NT$250」
+# 其他情況（例如「iPhone 15 保護殼 500」、「停車 2 小時 60」）一律是一筆，以最後的金額為準
+# 最後一筆是合計（「早餐 60元 午餐 120元 共 180元」）時也不拆，避免把合計再記一筆
+ITEM_SEPARATOR = re.compile(r'\n|(?<!\d),|,(?!\d)|[，、;；]')  # 1,200 的千分位逗號不算分隔
+TOTAL_KEYWORDS = frozenset({'共', '一共', '總共', '共計', '合計', '總計', 'total'})
+CURRENCY_MARKER = re.compile(r'\d\s*[元塊錢]|\$\s*\d')
+MARKED_ITEM = re.compile(
+    r'\s*(?P<reason>.+?)\s*(?:(?:NT?)?\$\s*' + _NUMBER + r'|(?<![\d.])' + _NUMBER + r'\s*[元塊錢])(?=\s|$)\s*'
+)
+
+
+class ParseResult:
+    """解析結果
+
+    以屬性存取；為了相容舊程式，也支援 result['amount_cents'] / result.get('reason')。
+    """
+    __slots__ = ('amount_cents', 'description', 'reason', 'location', 'category',
+                 'is_valid_format', 'delete_id', 'action_type', 'items', 'delete_ids')
+
+    def __init__(self, action_type=None, amount_cents=None, reason='', delete_id=None, description=None,
+                 items=None, delete_ids=None):
+        self.action_type = action_type  # 'expense' 或 'delete'
+        self.is_valid_format = action_type is not None
+        self.amount_cents = amount_cents
+        self.reason = reason
+        self.description = reason if description is None else description
+        self.delete_id = delete_id
+        self.location = None  # 不再使用
+        self.category = None  # 不再使用
+        self.items = items    # 多筆記帳時為 [(原因, 金額分), ...]，amount_cents 為合計
+        self.delete_ids = delete_ids  # 多筆刪除時為排序後的記錄編號，delete_id 為第一個
+
+    @classmethod
+    def delete(cls, delete_id, delete_ids=None):
+        """刪除指令的解析結果"""
+        if delete_ids:
+            return cls('delete', delete_id=delete_id, delete_ids=delete_ids,
+                       description=f'刪除記錄 {len(delete_ids)} 筆')
+        return cls('delete', delete_id=delete_id,
+                   description=f'刪除記錄 #{delete_id}' if delete_id is not None else '')
     
+    def target_ids(self):
+        """要刪除的記錄編號列表，單筆刪除也回傳一個編號"""
+        return self.delete_ids or [self.delete_id]
+
+    @classmethod
+    def multi(cls, items):
+        """多筆記帳的解析結果"""
+        return cls('expense', sum(cents for _, cents in items),
+                   '、'.join(reason for reason, _ in items), items=items)
+
+    def expense_items(self):
+        """要寫入的記帳項目 [(原因, 金額分), ...]，單筆記帳也回傳一個項目"""
+        return self.items or [(self.reason or self.description, self.amount_cents)]
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __repr__(self):
+        return f"ParseResult({self.to_dict()!r})"
+
+
+class MessageParser:
     def parse_message(self, message):
         """
         解析訊息，支援格式：
@@ -32,104 +113,153 @@ class MessageParser:
             message (str): 用戶輸入的訊息
             
         Returns:
-            dict: 解析結果，包含 amount, description, reason, delete_id
+            ParseResult: 解析結果，包含 amount_cents（整數分）, description, reason, delete_id
         """
-        result = {
-            'amount': None,
-            'description': '',
-            'reason': '',
-            'location': None,  # 不再使用
-            'category': None,  # 不再使用
-            'is_valid_format': False,
-            'delete_id': None,  # 新增：要刪除的記錄 ID
-            'action_type': None  # 新增：動作類型 ('expense' 或 'delete')
-        }
+        text = message.strip()
         
         # 檢查是否以 @ai 開頭
-        if not message.strip().lower().startswith('@ai'):
-            return result
+        if not text[:3].lower().startswith('@ai'):
+            return ParseResult()
         
         # 移除 @ai 前綴
-        content = message.strip()[3:].strip()
+        content = text[3:].strip()
         
         if not content:
-            return result
-        
-        # 標記為有效格式
-        result['is_valid_format'] = True
+            return ParseResult()
         
         # 檢查是否為刪除指令
-        if content.lower().startswith('/del'):
-            return self._parse_delete_command(content, result)
+        if content[:4].lower().startswith('/del'):
+            return self._parse_delete_command(content)
         
         # 否則解析為記帳指令
-        return self._parse_expense_command(content, result)
+        return self._parse_expense_command(content)
     
-    def _parse_delete_command(self, content, result):
-        """解析刪除指令：/del #數字"""
-        result['action_type'] = 'delete'
-        
-        # 使用正則表達式匹配 /del #數字 格式
-        delete_pattern = r'/del\s+#(\d+)'
-        match = re.search(delete_pattern, content, re.IGNORECASE)
-        
-        if match:
-            try:
-                delete_id = int(match.group(1))
-                result['delete_id'] = delete_id
-                result['description'] = f'刪除記錄 #{delete_id}'
-            except ValueError:
-                pass
-        
-        return result
+    def parse_many(self, messages):
+        """批次解析多則訊息，回傳與 messages 對應的 ParseResult 列表"""
+        parse = self.parse_message
+        return [parse(message) for message in messages]
     
-    def _parse_expense_command(self, content, result):
-        """解析記帳指令：原因 金額"""
-        result['action_type'] = 'expense'
+    def _parse_delete_command(self, content):
+        """解析刪除指令：/del #數字，可以多個編號或範圍（/del #1 #2 #5-#9）
         
-        # 提取金額
-        amount = self._extract_amount(content)
+        超過 MAX_DELETE_IDS 筆或包含 #0 時視為格式錯誤（delete_id 為 None）。
+        """
+        match = DELETE_PATTERN.search(content)
+        if match is None:
+            return ParseResult.delete(None)
         
-        if amount:
-            result['amount'] = amount
-            
-            # 移除金額部分，剩下的作為原因/描述
-            reason = self._extract_reason(content, amount)
-            result['reason'] = reason.strip()
-            result['description'] = reason.strip()
+        ranges = []
+        for item in DELETE_ITEM.finditer(match.group(1)):
+            start = int(item.group(1))
+            end = int(item.group(2)) if item.group(2) else start
+            ranges.append((min(start, end), max(start, end)))
+        
+        if len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+            return ParseResult.delete(ranges[0][0])
         
-        return result
+        if sum(end - start + 1 for start, end in ranges) > MAX_DELETE_IDS or min(ranges)[0] < 1:
+            return ParseResult.delete(None)
+        
+        delete_ids = sorted({i for start, end in ranges for i in range(start, end + 1)})
+        if len(delete_ids) == 1:
+            return ParseResult.delete(delete_ids[0])
+        return ParseResult.delete(delete_ids[0], delete_ids)
     
-    def _extract_amount(self, text):
-        """提取金額"""
-        for pattern in self.amount_patterns:
-            match = re.search(pattern, text)
-            if match:
-                try:
-                    return float(match.group(1))
-                except (ValueError, IndexError):
-                    continue
-        return None
+    def _parse_expense_command(self, content):
+        """解析記帳指令：原因 金額（可以多筆，見 ITEM_SEPARATOR / CURRENCY_MARKER）
+        
+        金額格式依序比對，取第一個匹配的；原因為移除所有金額表達後的文字。
+        最常見的「原因 數字」只需要一次比對，取出金額的同時就得到原因。
+        """
+        if ITEM_SEPARATOR.search(content) or len(CURRENCY_MARKER.findall(content)) > 1:
+            items = self._split_items(content)
+            if items:
+                return ParseResult.multi(items)
+        return self._parse_single(content)
     
-    def _extract_reason(self, text, amount):
-        """提取原因，移除金額相關文字"""
-        reason = text
+    def _parse_single(self, content):
+        """解析一筆記帳：原因 金額"""
+        amount_cents = None
+        triggered = ()
+        if TRIGGER_CHARS.search(content):
+            triggered = [pattern for pattern, chars in AMOUNT_PATTERNS if any(c in content for c in chars)]
+        
+        # 提取金額
+        for pattern in triggered:
+            match = pattern.search(content)
+            if match:
+                amount_cents = to_cents(match.group(1))
+                break
+        
+        trailing = None
+        if amount_cents is None:
+            trailing = TRAILING_AMOUNT.search(content)
+            if trailing is None:
+                return ParseResult('expense')
+            amount_cents = to_cents(trailing.group(1))
+        
+        if not amount_cents:
+            return ParseResult('expense')
         
-        # 移除所有找到的金額表達
-        for pattern in self.amount_patterns:
-            reason = re.sub(pattern, '', reason)
+        # 移除金額部分，剩下的作為原因/描述
+        if triggered:
+            reason = content
+            for pattern in triggered:
+                reason = pattern.sub('', reason)
+            reason = TRAILING_AMOUNT.sub('', reason)
+        else:
+            reason = content[:trailing.start()]
         
         # 清理多餘的空白
-        reason = ' '.join(reason.split())
+        return ParseResult('expense', amount_cents, ' '.join(reason.split()))
+    
+    def _split_items(self, content):
+        """把內容拆成多筆 (原因, 金額分)
+        
+        有分隔符號時每一段各自以單筆規則解析；沒有時每一筆都要是「原因 金額+貨幣標記」。
+        至少兩筆、每筆原因不是純數字、金額大於 0、最後一筆不是合計，否則回傳 None，改用單筆解析。
+        """
+        items = []
+        if ITEM_SEPARATOR.search(content):
+            for segment in ITEM_SEPARATOR.split(content):
+                if not segment.strip():
+                    continue
+                result = self._parse_single(segment.strip())
+                if not result.amount_cents or not self._is_reason(result.reason):
+                    return None
+                items.append((result.reason, result.amount_cents))
+            return self._checked_items(items)
         
-        return reason
+        position = 0
+        while position < len(content):
+            match = MARKED_ITEM.match(content, position)
+            if match is None:
+                return None
+            reason = match.group('reason')
+            amount_cents = to_cents(match.group(2) or match.group(3))
+            if not amount_cents or not self._is_reason(reason):
+                return None
+            items.append((reason, amount_cents))
+            position = match.end()
+        return self._checked_items(items)
+    
+    @staticmethod
+    def _checked_items(items):
+        """至少兩筆，且最後一筆不是合計（共 / 合計 / total ...）"""
+        if len(items) < 2 or items[-1][0].strip(' :：').lower() in TOTAL_KEYWORDS:
+            return None
+        return items
+    
+    @staticmethod
+    def _is_reason(reason):
+        return bool(reason.strip(' .$').strip('0123456789'))
     
     def is_valid_expense(self, parsed_data):
         """
         檢查是否為有效的支出記錄
         
         Args:
-            parsed_data (dict): 解析結果
+            parsed_data (ParseResult): 解析結果
             
         Returns:
             bool: 是否有效
@@ -140,8 +270,8 @@ class MessageParser:
         action_type = parsed_data.get('action_type')
         
         if action_type == 'expense':
-            return (parsed_data.get('amount') is not None and 
-                    parsed_data.get('amount') > 0 and
+            return (parsed_data.get('amount_cents') is not None and 
+                    parsed_data.get('amount_cents') > 0 and
                     parsed_data.get('reason', '').strip() != '')
         
         # 刪除指令不算作支出記錄
@@ -152,7 +282,7 @@ class MessageParser:
         檢查是否為有效的刪除指令
         
         Args:
-            parsed_data (dict): 解析結果
+            parsed_data (ParseResult): 解析結果
             
         Returns:
             bool: 是否有效的刪除指令
@@ -167,7 +297,7 @@ class MessageParser:
         格式化支出摘要
         
         Args:
-            parsed_data (dict): 解析結果
+            parsed_data (ParseResult): 解析結果
             
         Returns:
             str: 格式化的摘要
@@ -176,7 +306,7 @@ class MessageParser:
             return "❌ 無效的支出記錄"
         
         summary = f"📝 原因: {parsed_data['reason']}\n"
-        summary += f"💰 金額: {parsed_data['amount']:.0f} 元"
+        summary += f"💰 金額: {format_amount(parsed_data['amount_cents'])} 元"
         
         return summary
     
@@ -196,18 +326,22 @@ class MessageParser:
 • @ai 油錢 800
 
 🗑️ **刪除記錄格式**：
-@ai /del #記錄編號
+@ai /del #記錄編號（可以多個：#1 #2 #5-#9）
 
 📝 **刪除範例**：
 • @ai /del #23
 • @ai /del #156
 • @ai /del #7
+• @ai /del #3 #8 #10-#15
 
 💰 **支援的金額格式**：
 • 120元、50塊、30錢
 • NT$100、$80
 • 純數字：120
 
+🧾 **一次記多筆**（用逗號或換行分隔）：
+• @ai 早餐 60，午餐 120，咖啡 50
+
 ✅ **簡化版記帳**：
 • 只記錄原因和金額
 • 不再需要地點和分類
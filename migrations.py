@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+資料庫結構遷移
+
+每個遷移有一個遞增的版本號，以及 PostgreSQL / SQLite 各自的步驟。
+已套用的版本記錄在 schema_version 資料表；啟動時若版本已是最新，
+就不執行任何 DDL。
+
+新增遷移：在 MIGRATIONS 尾端加上一筆，版本號 +1，不要修改已發布的遷移。
+步驟可以是 SQL 字串，或接收 cursor 的函式（用於需要判斷現況的遷移）。
+"""
+
+MIGRATIONS = [
+    {
+        'version': 1,
+        'description': '建立基本資料表',
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS expenses (
+                id SERIAL PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                amount REAL NOT NULL,
+                location TEXT,
+                description TEXT,
+                category TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user_id TEXT PRIMARY KEY,
+                stats_reset_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                user_id TEXT PRIMARY KEY,
+                display_name TEXT,
+                picture_url TEXT,
+                status_message TEXT,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+        ],
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                amount REAL NOT NULL,
+                location TEXT,
+                description TEXT,
+                category TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user_id TEXT PRIMARY KEY,
+                stats_reset_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                user_id TEXT PRIMARY KEY,
+                display_name TEXT,
+                picture_url TEXT,
+                status_message TEXT,
+                last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+        ],
+    },
+    {
+        'version': 2,
+        'description': '新增 expenses(user_id, timestamp) 索引',
+        'postgresql': [
+            'CREATE INDEX IF NOT EXISTS idx_expenses_user_timestamp ON expenses (user_id, timestamp)',
+        ],
+        'sqlite': [
+            'CREATE INDEX IF NOT EXISTS idx_expenses_user_timestamp ON expenses (user_id, timestamp)',
+        ],
+    },
+    {
+        'version': 3,
+        'description': '新增 expenses(user_id, id) 索引',
+        'postgresql': [
+            'CREATE INDEX IF NOT EXISTS idx_expenses_user_id ON expenses (user_id, id)',
+        ],
+        'sqlite': [
+            'CREATE INDEX IF NOT EXISTS idx_expenses_user_id ON expenses (user_id, id)',
+        ],
+    },
+    {
+        'version': 4,
+        'description': '新增每月彙總表 monthly_rollups 並回填',
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS monthly_rollups (
+                user_id TEXT NOT NULL,
+                month TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                sum REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, category)
+            )
+            ''',
+            '''
+            INSERT INTO monthly_rollups (user_id, month, category, sum, count)
+            SELECT user_id, to_char(timestamp, 'YYYY-MM'), COALESCE(category, ''), SUM(amount), COUNT(*)
+            FROM expenses
+            GROUP BY user_id, to_char(timestamp, 'YYYY-MM'), COALESCE(category, '')
+            ''',
+        ],
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS monthly_rollups (
+                user_id TEXT NOT NULL,
+                month TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                sum REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, category)
+            )
+            ''',
+            '''
+            INSERT INTO monthly_rollups (user_id, month, category, sum, count)
+            SELECT user_id, strftime('%Y-%m', timestamp), COALESCE(category, ''), SUM(amount), COUNT(*)
+            FROM expenses
+            GROUP BY user_id, strftime('%Y-%m', timestamp), COALESCE(category, '')
+            ''',
+        ],
+    },
+    {
+        'version': 5,
+        'description': '在 user_settings 新增當前統計的累計欄位並回填',
+        'postgresql': [
+            'ALTER TABLE user_settings ADD COLUMN IF NOT EXISTS current_total REAL NOT NULL DEFAULT 0',
+            'ALTER TABLE user_settings ADD COLUMN IF NOT EXISTS current_count INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE user_settings ADD COLUMN IF NOT EXISTS current_first TIMESTAMP',
+            'ALTER TABLE user_settings ADD COLUMN IF NOT EXISTS current_last TIMESTAMP',
+            # 沒有設定的用戶，原本的行為是從第一筆記錄開始統計
+            '''
+            INSERT INTO user_settings (user_id, stats_reset_date)
+            SELECT user_id, MIN(timestamp)
+            FROM expenses
+            GROUP BY user_id
+            ON CONFLICT (user_id) DO NOTHING
+            ''',
+            '''
+            UPDATE user_settings AS s
+            SET current_total = COALESCE(c.total, 0),
+                current_count = COALESCE(c.count, 0),
+                current_first = c.first,
+                current_last = c.last
+            FROM (
+                SELECT e.user_id, SUM(e.amount) AS total, COUNT(*) AS count,
+                       MIN(e.timestamp) AS first, MAX(e.timestamp) AS last
+                FROM expenses e
+                JOIN user_settings us ON us.user_id = e.user_id
+                WHERE e.timestamp >= us.stats_reset_date
+                GROUP BY e.user_id
+            ) AS c
+            WHERE s.user_id = c.user_id
+            ''',
+        ],
+        'sqlite': [
+            'ALTER TABLE user_settings ADD COLUMN current_total REAL NOT NULL DEFAULT 0',
+            'ALTER TABLE user_settings ADD COLUMN current_count INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE user_settings ADD COLUMN current_first DATETIME',
+            'ALTER TABLE user_settings ADD COLUMN current_last DATETIME',
+            '''
+            INSERT OR IGNORE INTO user_settings (user_id, stats_reset_date)
+            SELECT user_id, MIN(timestamp)
+            FROM expenses
+            GROUP BY user_id
+            ''',
+            '''
+            UPDATE user_settings
+            SET current_total = COALESCE(c.total, 0),
+                current_count = COALESCE(c.count, 0),
+                current_first = c.first,
+                current_last = c.last
+            FROM (
+                SELECT e.user_id, SUM(e.amount) AS total, COUNT(*) AS count,
+                       MIN(e.timestamp) AS first, MAX(e.timestamp) AS last
+                FROM expenses e
+                JOIN user_settings us ON us.user_id = e.user_id
+                WHERE e.timestamp >= us.stats_reset_date
+                GROUP BY e.user_id
+            ) AS c
+            WHERE user_settings.user_id = c.user_id
+            ''',
+        ],
+    },
+    {
+        'version': 6,
+        'description': '時間欄位統一以 UTC 儲存',
+        # 原本的 TIMESTAMP 由 CURRENT_TIMESTAMP 寫入，視為 UTC 轉成 TIMESTAMPTZ
+        'postgresql': [
+            "ALTER TABLE expenses ALTER COLUMN timestamp TYPE TIMESTAMPTZ USING timestamp AT TIME ZONE 'UTC'",
+            "ALTER TABLE user_settings ALTER COLUMN stats_reset_date TYPE TIMESTAMPTZ USING stats_reset_date AT TIME ZONE 'UTC'",
+            "ALTER TABLE user_settings ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC'",
+            "ALTER TABLE user_settings ALTER COLUMN current_first TYPE TIMESTAMPTZ USING current_first AT TIME ZONE 'UTC'",
+            "ALTER TABLE user_settings ALTER COLUMN current_last TYPE TIMESTAMPTZ USING current_last AT TIME ZONE 'UTC'",
+            "ALTER TABLE user_profiles ALTER COLUMN last_updated TYPE TIMESTAMPTZ USING last_updated AT TIME ZONE 'UTC'",
+        ],
+        # SQLite 統一為 CURRENT_TIMESTAMP 的 'YYYY-MM-DD HH:MM:SS' UTC 格式，
+        # 帶 'T' / 'Z' / 時差的舊資料一併換算成 UTC，文字比較與排序才會正確
+        'sqlite': [
+            "UPDATE expenses SET timestamp = strftime('%Y-%m-%d %H:%M:%S', timestamp) WHERE timestamp != strftime('%Y-%m-%d %H:%M:%S', timestamp)",
+            "UPDATE user_settings SET stats_reset_date = strftime('%Y-%m-%d %H:%M:%S', stats_reset_date) WHERE stats_reset_date != strftime('%Y-%m-%d %H:%M:%S', stats_reset_date)",
+            "UPDATE user_settings SET created_at = strftime('%Y-%m-%d %H:%M:%S', created_at) WHERE created_at != strftime('%Y-%m-%d %H:%M:%S', created_at)",
+            "UPDATE user_settings SET current_first = strftime('%Y-%m-%d %H:%M:%S', current_first) WHERE current_first != strftime('%Y-%m-%d %H:%M:%S', current_first)",
+            "UPDATE user_settings SET current_last = strftime('%Y-%m-%d %H:%M:%S', current_last) WHERE current_last != strftime('%Y-%m-%d %H:%M:%S', current_last)",
+            "UPDATE user_profiles SET last_updated = strftime('%Y-%m-%d %H:%M:%S', last_updated) WHERE last_updated != strftime('%Y-%m-%d %H:%M:%S', last_updated)",
+        ],
+    },
+    {
+        'version': 7,
+        'description': '金額改為整數分（amount_cents / sum_cents / current_total_cents）',
+        'postgresql': [
+            # REAL 先轉 numeric 再四捨五入，避免二進位浮點的進位誤差
+            'ALTER TABLE expenses ALTER COLUMN amount TYPE BIGINT USING round(amount::numeric * 100)::bigint',
+            'ALTER TABLE expenses RENAME COLUMN amount TO amount_cents',
+            # 彙總和累計從轉換後的記錄重新計算，不沿用有誤差的浮點加總
+            'DROP TABLE monthly_rollups',
+            '''
+            CREATE TABLE monthly_rollups (
+                user_id TEXT NOT NULL,
+                month TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                sum_cents BIGINT NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, category)
+            )
+            ''',
+            '''
+            INSERT INTO monthly_rollups (user_id, month, category, sum_cents, count)
+            SELECT user_id, to_char(timestamp, 'YYYY-MM'), COALESCE(category, ''), SUM(amount_cents), COUNT(*)
+            FROM expenses
+            GROUP BY user_id, to_char(timestamp, 'YYYY-MM'), COALESCE(category, '')
+            ''',
+            'ALTER TABLE user_settings ADD COLUMN current_total_cents BIGINT NOT NULL DEFAULT 0',
+            '''
+            UPDATE user_settings
+            SET current_total_cents = COALESCE((
+                SELECT SUM(amount_cents) FROM expenses
+                WHERE expenses.user_id = user_settings.user_id
+                  AND expenses.timestamp >= user_settings.stats_reset_date
+            ), 0)
+            ''',
+            'ALTER TABLE user_settings DROP COLUMN current_total',
+        ],
+        'sqlite': [
+            # SQLite 不能直接修改欄位型別，新增整數欄位回填後移除舊欄位
+            'ALTER TABLE expenses ADD COLUMN amount_cents INTEGER NOT NULL DEFAULT 0',
+            'UPDATE expenses SET amount_cents = CAST(ROUND(amount * 100) AS INTEGER)',
+            'ALTER TABLE expenses DROP COLUMN amount',
+            'DROP TABLE monthly_rollups',
+            '''
+            CREATE TABLE monthly_rollups (
+                user_id TEXT NOT NULL,
+                month TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                sum_cents INTEGER NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, category)
+            )
+            ''',
+            '''
+            INSERT INTO monthly_rollups (user_id, month, category, sum_cents, count)
+            SELECT user_id, strftime('%Y-%m', timestamp), COALESCE(category, ''), SUM(amount_cents), COUNT(*)
+            FROM expenses
+            GROUP BY user_id, strftime('%Y-%m', timestamp), COALESCE(category, '')
+            ''',
+            'ALTER TABLE user_settings ADD COLUMN current_total_cents INTEGER NOT NULL DEFAULT 0',
+            '''
+            UPDATE user_settings
+            SET current_total_cents = COALESCE((
+                SELECT SUM(amount_cents) FROM expenses
+                WHERE expenses.user_id = user_settings.user_id
+                  AND expenses.timestamp >= user_settings.stats_reset_date
+            ), 0)
+            ''',
+            'ALTER TABLE user_settings DROP COLUMN current_total',
+        ],
+    },
+    {
+        'version': 8,
+        'description': '建立 processed_events 資料表（webhook 事件去重）',
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS processed_events (
+                event_id TEXT PRIMARY KEY,
+                received_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_processed_events_received_at ON processed_events(received_at)',
+        ],
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS processed_events (
+                event_id TEXT PRIMARY KEY,
+                received_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_processed_events_received_at ON processed_events(received_at)',
+        ],
+    },
+    {
+        'version': 9,
+        'description': '新增管理頁面分頁排序用的索引（時間 / 金額 + id）',
+        'postgresql': [
+            'CREATE INDEX IF NOT EXISTS idx_expenses_timestamp_id ON expenses (timestamp, id)',
+            'CREATE INDEX IF NOT EXISTS idx_expenses_amount_id ON expenses (amount_cents, id)',
+            'CREATE INDEX IF NOT EXISTS idx_expenses_user_timestamp_id ON expenses (user_id, timestamp, id)',
+            'CREATE INDEX IF NOT EXISTS idx_expenses_user_amount_id ON expenses (user_id, amount_cents, id)',
+        ],
+        'sqlite': [
+            'CREATE INDEX IF NOT EXISTS idx_expenses_timestamp_id ON expenses (timestamp, id)',
+            'CREATE INDEX IF NOT EXISTS idx_expenses_amount_id ON expenses (amount_cents, id)',
+            'CREATE INDEX IF NOT EXISTS idx_expenses_user_timestamp_id ON expenses (user_id, timestamp, id)',
+            'CREATE INDEX IF NOT EXISTS idx_expenses_user_amount_id ON expenses (user_id, amount_cents, id)',
+        ],
+    },
+]
+
+LATEST_VERSION = MIGRATIONS[-1]['version']
+
+# 多個程序同時啟動時，用 advisory lock 確保同一個遷移只跑一次
+_PG_ADVISORY_LOCK_KEY = 727104
+
+
+def get_schema_version(conn, use_postgresql):
+    """取得目前的資料庫結構版本（尚未建立 schema_version 時回傳 0）"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        row = cursor.fetchone()
+    except Exception:
+        # 資料表不存在；PostgreSQL 需要 rollback 才能繼續使用這條連線
+        conn.rollback()
+        return 0
+
+    return (row[0] if row else 0) or 0
+
+
+def _ensure_version_table(cursor, use_postgresql):
+    if use_postgresql:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+
+def migrate(conn, use_postgresql):
+    """依序套用尚未執行的遷移，每個遷移各自一個交易
+
+    Returns:
+        list: 本次套用的版本號
+    """
+    dialect = 'postgresql' if use_postgresql else 'sqlite'
+    current = get_schema_version(conn, use_postgresql)
+    if current >= LATEST_VERSION:
+        return []
+
+    cursor = conn.cursor()
+    _ensure_version_table(cursor, use_postgresql)
+    conn.commit()
+
+    applied = []
+    for migration in MIGRATIONS:
+        if migration['version'] <= current:
+            continue
+
+        try:
+            if use_postgresql:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', (_PG_ADVISORY_LOCK_KEY,))
+                # 拿到鎖之後重新確認，其他程序可能已經套用過
+                cursor.execute('SELECT 1 FROM schema_version WHERE version = %s', (migration['version'],))
+                if cursor.fetchone():
+                    conn.commit()
+                    continue
+            else:
+                # sqlite3 模組不會替 DDL 自動開交易，明確 BEGIN 讓整個遷移可以 rollback
+                cursor.execute('BEGIN')
+
+            for step in migration[dialect]:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+
+            cursor.execute(
+                'INSERT INTO schema_version (version, description) VALUES (%s, %s)'
+                if use_postgresql else
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (migration['version'], migration['description'])
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ DATABASE: 遷移 v{migration['version']} 失敗 - {e}")
+            raise e
+
+        print(f"🔧 DATABASE: 已套用遷移 v{migration['version']} - {migration['description']}")
+        applied.append(migration['version'])
+
+    return applied
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+金額處理工具
+
+金額一律以整數「分」（1 元 = 100 分）儲存與計算，加總不會有浮點誤差；
+只有在解析輸入與顯示時才和「元」互相轉換。
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENTS_PER_UNIT = 100
+
+
+def to_cents(value):
+    """把元（字串、整數或 Decimal）轉換為整數分，小數第三位四捨五入
+
+    Raises:
+        ValueError: 無法解析的金額
+    """
+    if isinstance(value, str) and value.isdecimal():
+        # 最常見的整數金額不需要經過 Decimal
+        return int(value) * CENTS_PER_UNIT
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"無效的金額: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"無效的金額: {value!r}")
+    return int((amount * CENTS_PER_UNIT).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def format_amount(cents):
+    """格式化金額（元）：整數元不顯示小數，否則顯示到分，例如 12000 -> '120'、99999 -> '999.99'"""
+    cents = int(cents or 0)
+    sign = '-' if cents < 0 else ''
+    units, remainder = divmod(abs(cents), CENTS_PER_UNIT)
+    if remainder:
+        return f"{sign}{units}.{remainder:02d}"
+    return f"{sign}{units}"
+
+
+def format_average(total_cents, count):
+    """格式化平均金額（元），保留一位小數"""
+    if not count:
+        return '0.0'
+    return f"{(total_cents or 0) / count / CENTS_PER_UNIT:.1f}"
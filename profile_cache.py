@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+LINE 用戶資料快取
+
+查詢順序：記憶體 LRU → user_profiles 資料表 → LINE API。
+
+- 資料超過 ttl_seconds（依 user_profiles.last_updated 計算）視為過期：
+  先回傳舊資料，由背景執行緒重新向 LINE API 查詢，不阻塞請求
+- LINE API 查詢失敗的用戶記錄為負快取，重試間隔以指數退避增加
+  （negative_ttl_seconds、2 倍、4 倍 ... 最多 negative_max_seconds），
+  期間不會再呼叫 API；原本有舊資料的繼續使用舊資料
+- 沒有任何資料的用戶（第一次出現）同步查詢，多位用戶以執行緒池並行查詢，
+  結果以一次批量 upsert 存入資料庫
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from timeutils import to_utc
+
+
+class _Entry:
+    """一位用戶的快取項目；profile 為 None 表示負快取（查詢失敗且沒有舊資料）"""
+    __slots__ = ('profile', 'updated_at', 'failures', 'retry_at')
+
+    def __init__(self, profile, updated_at):
+        self.profile = profile
+        self.updated_at = updated_at  # 資料取得時間（epoch 秒）
+        self.failures = 0             # 連續查詢失敗次數
+        self.retry_at = 0.0           # 負快取：這個時間之前不再呼叫 API
+
+
+class ProfileCache:
+    """兩層用戶資料快取（記憶體 LRU + 資料庫），含負快取與背景更新"""
+
+    def __init__(self, db, fetch_profile, max_size=5000, ttl_seconds=86400,
+                 negative_ttl_seconds=60, negative_max_seconds=3600,
+                 fetch_workers=8, refresh_workers=2):
+        """
+        Args:
+            db (ExpenseDatabase): 提供 get_user_profiles / save_user_profiles
+            fetch_profile (callable): fetch_profile(user_id) 向 LINE API 查詢，回傳
+                {'display_name', 'picture_url', 'status_message'}，失敗時拋出例外
+            max_size (int): 記憶體 LRU 保留的用戶數上限
+            ttl_seconds (float): 資料超過此秒數在背景重新查詢
+            negative_ttl_seconds (float): 查詢失敗後第一次重試的間隔秒數
+            negative_max_seconds (float): 重試間隔上限
+            fetch_workers (int): 同步查詢多位用戶時的並行數
+            refresh_workers (int): 背景更新的執行緒數
+        """
+        self.db = db
+        self._fetch_profile = fetch_profile
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.negative_max_seconds = negative_max_seconds
+        self.fetch_workers = fetch_workers
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {user_id: _Entry}
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='profile-refresh')
+
+        self._memory_hits = 0
+        self._db_hits = 0
+        self._negative_hits = 0
+        self._fetched = 0
+        self._fetch_failed = 0
+        self._refreshed = 0
+
+    def _store(self, user_id, entry):
+        # 呼叫端需持有 self._lock
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _is_stale(self, entry, now):
+        return now - entry.updated_at >= self.ttl_seconds
+
+    def _backoff(self, failures):
+        return min(self.negative_ttl_seconds * 2 ** (failures - 1), self.negative_max_seconds)
+
+    def get(self, user_id):
+        """取得一位用戶的資料，沒有資料（或在負快取退避中）時回傳 None"""
+        return self.get_many([user_id])[user_id]
+
+    def get_many(self, user_ids, stored=None, fetch_limit=None):
+        """取得多位用戶的資料
+
+        Args:
+            user_ids (iterable): 用戶 ID
+            stored (dict): 呼叫端已從資料庫取得的資料 {user_id: (profile, last_updated)}；
+                沒有提供時，記憶體中沒有的用戶以一次查詢向資料庫讀取
+            fetch_limit (int): 這次最多同步向 LINE API 查詢的人數，其餘下次再查
+
+        Returns:
+            dict: {user_id: profile 或 None}
+        """
+        now = time.time()
+        result = {}
+        missing = []
+        stale = []
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry is None:
+                    missing.append(user_id)
+                    continue
+                self._entries.move_to_end(user_id)
+                if entry.profile is None:
+                    if now < entry.retry_at:
+                        self._negative_hits += 1
+                        result[user_id] = None
+                    else:
+                        missing.append(user_id)
+                    continue
+                self._memory_hits += 1
+                result[user_id] = entry.profile
+                if self._is_stale(entry, now) and now >= entry.retry_at:
+                    stale.append(user_id)
+
+        if missing:
+            if stored is None:
+                stored = self._load(missing)
+            to_fetch = []
+            with self._lock:
+                for user_id in missing:
+                    row = stored.get(user_id)
+                    if row is None or row[0] is None:
+                        to_fetch.append(user_id)
+                        continue
+                    profile, last_updated = row
+                    entry = _Entry(profile, to_utc(last_updated).timestamp() if last_updated else 0.0)
+                    self._store(user_id, entry)
+                    self._db_hits += 1
+                    result[user_id] = profile
+                    if self._is_stale(entry, now):
+                        stale.append(user_id)
+
+            if fetch_limit is not None:
+                for user_id in to_fetch[fetch_limit:]:
+                    result[user_id] = None
+                to_fetch = to_fetch[:fetch_limit]
+            result.update(self._fetch(to_fetch))
+
+        for user_id in stale:
+            self._schedule_refresh(user_id)
+        return result
+
+    def _load(self, user_ids):
+        try:
+            return self.db.get_user_profiles(user_ids)
+        except Exception as e:
+            print(f"❌ PROFILE: 讀取用戶資料失敗 - {type(e).__name__}: {e}")
+            return {}
+
+    def _fetch_one(self, user_id):
+        try:
+            return self._fetch_profile(user_id)
+        except Exception as e:
+            print(f"❌ PROFILE: LINE API 查詢 {user_id[:8]}... 失敗 - {type(e).__name__}: {e}")
+            return None
+
+    def _fetch(self, user_ids):
+        """向 LINE API 並行查詢，成功的批量存入資料庫，失敗的記錄負快取"""
+        if not user_ids:
+            return {}
+
+        if len(user_ids) == 1:
+            results = {user_ids[0]: self._fetch_one(user_ids[0])}
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.fetch_workers, len(user_ids)),
+                                    thread_name_prefix='profile-fetch') as executor:
+                results = dict(zip(user_ids, executor.map(self._fetch_one, user_ids)))
+
+        self._record_results(results)
+        return {user_id: self._current(user_id) for user_id in user_ids}
+
+    def _record_results(self, results):
+        fetched = {user_id: profile for user_id, profile in results.items() if profile is not None}
+        if fetched:
+            try:
+                self.db.save_user_profiles(fetched)
+            except Exception as e:
+                print(f"❌ PROFILE: 儲存用戶資料失敗 - {type(e).__name__}: {e}")
+
+        now = time.time()
+        with self._lock:
+            for user_id, profile in results.items():
+                entry = self._entries.get(user_id)
+                if profile is not None:
+                    self._fetched += 1
+                    self._store(user_id, _Entry(profile, now))
+                    continue
+                # 查詢失敗：保留舊資料（如果有），延後下次重試
+                self._fetch_failed += 1
+                if entry is None:
+                    entry = _Entry(None, 0.0)
+                entry.failures += 1
+                entry.retry_at = now + self._backoff(entry.failures)
+                self._store(user_id, entry)
+
+    def _current(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            return entry.profile if entry is not None else None
+
+    def _schedule_refresh(self, user_id):
+        with self._lock:
+            if user_id in self._refreshing:
+                return
+            self._refreshing.add(user_id)
+        try:
+            self._refresher.submit(self._refresh, user_id)
+        except RuntimeError:
+            # 已關閉
+            with self._lock:
+                self._refreshing.discard(user_id)
+
+    def _refresh(self, user_id):
+        try:
+            profile = self._fetch_one(user_id)
+            self._record_results({user_id: profile})
+            if profile is not None:
+                with self._lock:
+                    self._refreshed += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(user_id)
+
+    def invalidate(self, user_id):
+        """移除一位用戶的快取（下次查詢會重新讀取資料庫）"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def wait_for_refresh(self, timeout=None):
+        """等待進行中的背景更新完成（測試與關閉時使用），回傳是否全部完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._refreshing:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def shutdown(self, wait=True):
+        """停止背景更新"""
+        self._refresher.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            negative = sum(1 for entry in self._entries.values() if entry.profile is None)
+            backing_off = sum(1 for entry in self._entries.values() if now < entry.retry_at)
+            return {
+                'cache_size': len(self._entries),
+                'max_cache_size': self.max_size,
+                'negative_entries': negative,
+                'backing_off': backing_off,
+                'refreshing': len(self._refreshing),
+                'memory_hits': self._memory_hits,
+                'db_hits': self._db_hits,
+                'negative_hits': self._negative_hits,
+                'fetched': self._fetched,
+                'fetch_failed': self._fetch_failed,
+                'refreshed': self._refreshed,
+            }
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+回覆訊息與 push 備援
+
+reply token 只在事件發生後短時間內有效。資料庫處理太慢、或程式重新啟動後
+從收件匣重新處理的事件，reply token 可能已經過期，用戶就收不到任何回覆。
+
+每個事件以事件時間（event.timestamp）加上預算秒數作為回覆期限：
+- 期限前：使用 reply_message（免費、不佔 push 額度）
+- 只有確定 reply 沒有送達時才改用 push_message 傳給群組 / 聊天室 / 用戶：
+  送出前已經接近或超過期限、連線就失敗（請求沒有送出），
+  或第一次送出就被回應 reply token 無效
+- 讀取逾時、5xx，或重試之後才出現 reply token 無效：前一次可能已經送達，
+  不再 push，避免用戶收到兩次
+"""
+
+import logging
+import threading
+import time
+
+from line_http import is_connect_error
+
+logger = logging.getLogger(__name__)
+
+
+def push_target(event):
+    """push 的對象：群組或聊天室中的訊息回到原本的群組 / 聊天室，其他回給用戶"""
+    source = event.source
+    source_type = getattr(source, 'type', None)
+    if source_type == 'group' and getattr(source, 'group_id', None):
+        return source.group_id
+    if source_type == 'room' and getattr(source, 'room_id', None):
+        return source.room_id
+    return getattr(source, 'user_id', None)
+
+
+class ReplySender:
+    """依回覆期限選擇 reply 或 push，並統計備援次數"""
+
+    def __init__(self, api, budget_seconds=50.0, margin_seconds=2.0):
+        """
+        Args:
+            api (LineBotApi): LINE API
+            budget_seconds (float): 事件發生後可以使用 reply token 的秒數
+            margin_seconds (float): 距離期限不到此秒數就直接改用 push（預留 API 呼叫時間）
+        """
+        self.api = api
+        self.budget_seconds = budget_seconds
+        self.margin_seconds = margin_seconds
+
+        self._lock = threading.Lock()
+        self._counts = {
+            'replied': 0,
+            'push_near_deadline': 0,
+            'push_after_reply_error': 0,
+            'push_after_connect_error': 0,
+            'push_failed': 0,
+            'failed': 0,
+        }
+
+    def deadline(self, event):
+        """回覆期限（epoch 秒）；事件沒有時間時視為剛收到"""
+        timestamp = getattr(event, 'timestamp', None)
+        started = timestamp / 1000 if timestamp else time.time()
+        return started + self.budget_seconds
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def send(self, event, messages):
+        """回覆事件，回傳實際使用的方式：'reply' / 'push' / None（失敗）"""
+        if messages is None:
+            return None
+
+        remaining = self.deadline(event) - time.time()
+        if remaining > self.margin_seconds and getattr(event, 'reply_token', None):
+            try:
+                self.api.reply_message(event.reply_token, messages)
+                self._count('replied')
+                return 'reply'
+            except Exception as e:
+                fallback = self._reply_fallback(e)
+                if fallback is None:
+                    logger.error(f"回覆訊息時發生錯誤（可能已經送達，不改用 push）: {e}")
+                    self._count('failed')
+                    return None
+                logger.info(f"回覆沒有送達（{e}），改用 push 傳送")
+        else:
+            logger.info(f"已超過回覆期限（剩餘 {remaining:.1f} 秒），改用 push 傳送")
+            fallback = 'push_near_deadline'
+
+        return self._push(event, messages, fallback)
+
+    def _reply_fallback(self, error):
+        """reply 失敗時決定是否改用 push：確定沒有送達才回傳統計名稱，否則回傳 None"""
+        if is_connect_error(error):
+            return 'push_after_connect_error'
+        if "Invalid reply token" not in str(error):
+            return None
+        # 重試過的請求，前一次可能已經用掉 reply token
+        last_retries = getattr(getattr(self.api, 'http_client', None), 'last_retries', None)
+        if last_retries is not None and last_retries():
+            return None
+        return 'push_after_reply_error'
+
+    def _push(self, event, messages, reason):
+        target = push_target(event)
+        if not target:
+            self._count('push_failed')
+            return None
+        try:
+            self.api.push_message(target, messages)
+        except Exception as e:
+            logger.error(f"push 訊息時發生錯誤: {e}")
+            self._count('push_failed')
+            return None
+        self._count(reason)
+        return 'push'
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._counts)
+        attempts = sum(data.values())
+        fallbacks = data['push_near_deadline'] + data['push_after_reply_error'] + data['push_after_connect_error']
+        data['fallback_rate'] = round(fallbacks / attempts, 4) if attempts else 0.0
+        return data
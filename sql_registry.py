@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SQL 語句登錄表
+
+所有查詢集中在 STATEMENTS，以 `?` 作為參數佔位符撰寫一次；
+啟動時依資料庫類型編譯（PostgreSQL 轉為 `%s`），之後以名稱執行。
+兩種資料庫語法不同的語句，可以分別提供 'postgresql' / 'sqlite' 版本。
+
+語句中可使用的方言標記：
+    {month}    以 timestamp 欄位計算 'YYYY-MM' 月份鍵
+    {in_list}  「欄位屬於清單參數」，對應的參數直接傳 list
+               （PostgreSQL 為 = ANY(%s)，SQLite 為 json_each）
+    {list_rows}  把文字清單參數展開成單欄（value）的資料列，可放在 FROM 後面
+
+MIN() / MAX() 等時間運算結果需在別名標註型別（例如 AS "last_record [timestamp]"），
+SQLite 才會轉換為 datetime（見 timeutils.register_sqlite_types）。
+金額以整數分儲存；PostgreSQL 的 SUM(BIGINT) 會回傳 numeric，
+回傳給程式的加總一律 CAST(... AS BIGINT)，兩種資料庫都得到 int。
+
+每次執行都會記錄次數與耗時，可由 stats() 取得。
+"""
+
+import json
+import threading
+import time
+
+DIALECT_TOKENS = {
+    'postgresql': {
+        '{month}': "to_char(timestamp, 'YYYY-MM')",
+        '{in_list}': '= ANY(?)',
+        '{list_rows}': 'unnest(?::text[]) AS items(value)',
+        '{ilike}': 'ILIKE',
+    },
+    'sqlite': {
+        '{month}': "strftime('%Y-%m', timestamp)",
+        '{in_list}': 'IN (SELECT value FROM json_each(?))',
+        '{list_rows}': 'json_each(?)',
+        '{ilike}': 'LIKE',  # SQLite 的 LIKE 對 ASCII 本來就不分大小寫
+    },
+}
+
+# 刪除支出記錄時的範圍條件，對應的刪除 / 彙總扣除語句會依此各產生一組
+DELETE_SCOPES = {
+    'one': 'id = ? AND user_id = ?',
+    'ids': 'id {in_list}',
+    'user_ids': 'user_id = ? AND id {in_list}',
+}
+
+STATEMENTS = {
+    # ---- 支出記錄 ----
+    'expenses.insert': '''
+        INSERT INTO expenses (user_id, amount_cents, location, description, category)
+        VALUES (?, ?, ?, ?, ?)
+        RETURNING id
+    ''',
+    # 批量新增：SQLite 以 executemany 執行；PostgreSQL 以 execute_values 展開成多列 VALUES
+    'expenses.insert_many': {
+        'postgresql': '''
+            INSERT INTO expenses (user_id, amount_cents, location, description, category, timestamp)
+            VALUES ?
+            RETURNING id
+        ''',
+        'sqlite': '''
+            INSERT INTO expenses (user_id, amount_cents, location, description, category, timestamp)
+            VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''',
+    },
+    'expenses.insert_many_row': {
+        'postgresql': '(?, ?, ?, ?, ?, COALESCE(?::timestamptz, CURRENT_TIMESTAMP))',
+    },
+    'expenses.get': '''
+        SELECT id, user_id, amount_cents, description, timestamp
+        FROM expenses
+        WHERE id = ?
+    ''',
+    'expenses.get_many': '''
+        SELECT id, user_id, amount_cents, description, timestamp
+        FROM expenses
+        WHERE id {in_list}
+    ''',
+    'expenses.recent_for_user': '''
+        SELECT id, amount_cents, location, description, category, timestamp
+        FROM expenses
+        WHERE user_id = ?
+        ORDER BY timestamp DESC
+        LIMIT ?
+    ''',
+    # 分頁走 (user_id, id) 索引：第二頁之後以上一頁最後的 id 為游標，不用 OFFSET
+    'expenses.page_for_user': '''
+        SELECT id, amount_cents, location, description, category, timestamp
+        FROM expenses
+        WHERE user_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''',
+    'expenses.page_for_user_before': '''
+        SELECT id, amount_cents, location, description, category, timestamp
+        FROM expenses
+        WHERE user_id = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''',
+    'expenses.time_range_for_user': '''
+        SELECT MIN(timestamp) AS "first_record [timestamp]", MAX(timestamp) AS "last_record [timestamp]"
+        FROM expenses
+        WHERE user_id = ?
+    ''',
+    'expenses.count_for_user': 'SELECT COUNT(*) FROM expenses WHERE user_id = ?',
+    'expenses.max_id': 'SELECT MAX(id) FROM expenses',
+    'expenses.delete_for_user': 'DELETE FROM expenses WHERE user_id = ?',
+    # 管理儀表板：每個用戶的統計，同一個查詢 LEFT JOIN 用戶資料（沒有資料的為 NULL）
+    'expenses.user_summaries': '''
+        SELECT s.user_id, s.count, s.total_cents, s.last_record AS "last_record [timestamp]",
+               p.display_name, p.picture_url, p.status_message, p.last_updated AS "last_updated [timestamp]"
+        FROM (
+            SELECT user_id, COUNT(*) AS count, CAST(SUM(amount_cents) AS BIGINT) AS total_cents,
+                   MAX(timestamp) AS last_record
+            FROM expenses
+            GROUP BY user_id
+        ) AS s
+        LEFT JOIN user_profiles AS p ON p.user_id = s.user_id
+        ORDER BY s.last_record DESC
+    ''',
+
+    # ---- 每月彙總 ----
+    'rollups.add_expense': '''
+        INSERT INTO monthly_rollups (user_id, month, category, sum_cents, count)
+        SELECT user_id, {month}, COALESCE(category, ''), amount_cents, 1
+        FROM expenses
+        WHERE id = ?
+        ON CONFLICT (user_id, month, category) DO UPDATE SET
+            sum_cents = monthly_rollups.sum_cents + EXCLUDED.sum_cents,
+            count = monthly_rollups.count + EXCLUDED.count
+    ''',
+    'rollups.add_expenses': '''
+        INSERT INTO monthly_rollups (user_id, month, category, sum_cents, count)
+        SELECT user_id, {month}, COALESCE(category, ''), SUM(amount_cents), COUNT(*)
+        FROM expenses
+        WHERE id {in_list}
+        GROUP BY user_id, {month}, COALESCE(category, '')
+        ON CONFLICT (user_id, month, category) DO UPDATE SET
+            sum_cents = monthly_rollups.sum_cents + EXCLUDED.sum_cents,
+            count = monthly_rollups.count + EXCLUDED.count
+    ''',
+    'rollups.month_by_category': '''
+        SELECT sum_cents, count, NULLIF(category, '') AS category
+        FROM monthly_rollups
+        WHERE user_id = ? AND month = ?
+    ''',
+    'rollups.month_total': '''
+        SELECT CAST(SUM(sum_cents) AS BIGINT), SUM(count)
+        FROM monthly_rollups
+        WHERE user_id = ? AND month = ?
+    ''',
+    'rollups.user_total': '''
+        SELECT CAST(SUM(sum_cents) AS BIGINT), SUM(count)
+        FROM monthly_rollups
+        WHERE user_id = ?
+    ''',
+    'rollups.range_for_user': '''
+        SELECT month, CAST(SUM(sum_cents) AS BIGINT), SUM(count)
+        FROM monthly_rollups
+        WHERE user_id = ? AND month >= ? AND month <= ?
+        GROUP BY month
+    ''',
+    'rollups.range_all': '''
+        SELECT month, CAST(SUM(sum_cents) AS BIGINT), SUM(count)
+        FROM monthly_rollups
+        WHERE month >= ? AND month <= ?
+        GROUP BY month
+    ''',
+    'rollups.total_for_user': '''
+        SELECT CAST(SUM(sum_cents) AS BIGINT), SUM(count)
+        FROM monthly_rollups
+        WHERE user_id = ?
+    ''',
+    'rollups.recent_months_for_user': '''
+        SELECT month, CAST(SUM(sum_cents) AS BIGINT), SUM(count)
+        FROM monthly_rollups
+        WHERE user_id = ?
+        GROUP BY month
+        ORDER BY month DESC
+        LIMIT ?
+    ''',
+    'rollups.purge_empty': 'DELETE FROM monthly_rollups WHERE count <= 0',
+    'rollups.delete_for_user': 'DELETE FROM monthly_rollups WHERE user_id = ?',
+    'rollups.stored': 'SELECT user_id, month, category, sum_cents, count FROM monthly_rollups',
+    'rollups.expected': '''
+        SELECT user_id, {month}, COALESCE(category, ''), CAST(SUM(amount_cents) AS BIGINT), COUNT(*)
+        FROM expenses
+        GROUP BY user_id, {month}, COALESCE(category, '')
+    ''',
+    'rollups.delete_all': 'DELETE FROM monthly_rollups',
+    'rollups.rebuild': '''
+        INSERT INTO monthly_rollups (user_id, month, category, sum_cents, count)
+        SELECT user_id, {month}, COALESCE(category, ''), SUM(amount_cents), COUNT(*)
+        FROM expenses
+        GROUP BY user_id, {month}, COALESCE(category, '')
+    ''',
+
+    # ---- 當前統計（user_settings 累計欄位）----
+    'current.add_expense': '''
+        INSERT INTO user_settings (user_id, stats_reset_date, current_total_cents, current_count, current_first, current_last)
+        SELECT user_id, timestamp, amount_cents, 1, timestamp, timestamp
+        FROM expenses
+        WHERE id = ?
+        ON CONFLICT (user_id) DO UPDATE SET
+            current_total_cents = user_settings.current_total_cents + EXCLUDED.current_total_cents,
+            current_count = user_settings.current_count + 1,
+            current_first = CASE
+                WHEN user_settings.current_first IS NULL OR EXCLUDED.current_first < user_settings.current_first
+                THEN EXCLUDED.current_first ELSE user_settings.current_first END,
+            current_last = CASE
+                WHEN user_settings.current_last IS NULL OR EXCLUDED.current_last > user_settings.current_last
+                THEN EXCLUDED.current_last ELSE user_settings.current_last END
+        WHERE EXCLUDED.current_last >= user_settings.stats_reset_date
+    ''',
+    # 批量新增後的當前統計：先替沒有設定的用戶建立設定（從第一筆記錄開始統計），
+    # 再把重置日期之後的記錄一次累加
+    'current.init_for_expenses': '''
+        INSERT INTO user_settings (user_id, stats_reset_date)
+        SELECT user_id, MIN(timestamp)
+        FROM expenses
+        WHERE id {in_list}
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO NOTHING
+    ''',
+    'current.add_expenses': '''
+        UPDATE user_settings
+        SET current_total_cents = user_settings.current_total_cents + d.total,
+            current_count = user_settings.current_count + d.count,
+            current_first = CASE
+                WHEN user_settings.current_first IS NULL OR d.first < user_settings.current_first
+                THEN d.first ELSE user_settings.current_first END,
+            current_last = CASE
+                WHEN user_settings.current_last IS NULL OR d.last > user_settings.current_last
+                THEN d.last ELSE user_settings.current_last END
+        FROM (
+            SELECT e.user_id, SUM(e.amount_cents) AS total, COUNT(*) AS count,
+                   MIN(e.timestamp) AS first, MAX(e.timestamp) AS last
+            FROM expenses AS e
+            JOIN user_settings AS s ON s.user_id = e.user_id
+            WHERE e.id {in_list} AND e.timestamp >= s.stats_reset_date
+            GROUP BY e.user_id
+        ) AS d
+        WHERE user_settings.user_id = d.user_id
+    ''',
+    'current.get': '''
+        SELECT stats_reset_date, current_total_cents, current_count, current_first, current_last
+        FROM user_settings
+        WHERE user_id = ?
+    ''',
+    'current.refresh_bounds': '''
+        UPDATE user_settings
+        SET current_first = (
+                SELECT MIN(timestamp) FROM expenses
+                WHERE expenses.user_id = user_settings.user_id
+                  AND expenses.timestamp >= user_settings.stats_reset_date
+            ),
+            current_last = (
+                SELECT MAX(timestamp) FROM expenses
+                WHERE expenses.user_id = user_settings.user_id
+                  AND expenses.timestamp >= user_settings.stats_reset_date
+            )
+        WHERE user_id {in_list}
+    ''',
+    'current.clear_for_user': '''
+        UPDATE user_settings
+        SET current_total_cents = 0, current_count = 0, current_first = NULL, current_last = NULL
+        WHERE user_id = ?
+    ''',
+    'current.reset': {
+        # 單一語句：鎖定舊值、歸零並回傳舊值
+        'postgresql': '''
+            WITH old AS (
+                SELECT user_id, stats_reset_date, current_total_cents, current_count, current_first, current_last
+                FROM user_settings
+                WHERE user_id = ?
+                FOR UPDATE
+            )
+            UPDATE user_settings
+            SET stats_reset_date = CURRENT_TIMESTAMP,
+                current_total_cents = 0, current_count = 0, current_first = NULL, current_last = NULL
+            FROM old
+            WHERE user_settings.user_id = old.user_id
+            RETURNING old.stats_reset_date, old.current_total_cents, old.current_count,
+                      old.current_first, old.current_last
+        ''',
+        # SQLite 的 RETURNING 只能取得新值，由呼叫端在 BEGIN IMMEDIATE 內先讀 current.get
+        'sqlite': '''
+            UPDATE user_settings
+            SET stats_reset_date = CURRENT_TIMESTAMP,
+                current_total_cents = 0, current_count = 0, current_first = NULL, current_last = NULL
+            WHERE user_id = ?
+        ''',
+    },
+    'current.create_if_missing': '''
+        INSERT INTO user_settings (user_id, stats_reset_date)
+        VALUES (?, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id) DO NOTHING
+    ''',
+
+    # ---- 用戶資料 ----
+    'profiles.upsert': '''
+        INSERT INTO user_profiles (user_id, display_name, picture_url, status_message)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            display_name = EXCLUDED.display_name,
+            picture_url = EXCLUDED.picture_url,
+            status_message = EXCLUDED.status_message,
+            last_updated = CURRENT_TIMESTAMP
+    ''',
+    # 批量寫入：SQLite 以 executemany 執行；PostgreSQL 以 execute_values 展開成多列 VALUES
+    'profiles.upsert_many': {
+        'postgresql': '''
+            INSERT INTO user_profiles (user_id, display_name, picture_url, status_message)
+            VALUES ?
+            ON CONFLICT (user_id) DO UPDATE SET
+                display_name = EXCLUDED.display_name,
+                picture_url = EXCLUDED.picture_url,
+                status_message = EXCLUDED.status_message,
+                last_updated = CURRENT_TIMESTAMP
+            RETURNING user_id
+        ''',
+        'sqlite': '''
+            INSERT INTO user_profiles (user_id, display_name, picture_url, status_message)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                display_name = EXCLUDED.display_name,
+                picture_url = EXCLUDED.picture_url,
+                status_message = EXCLUDED.status_message,
+                last_updated = CURRENT_TIMESTAMP
+        ''',
+    },
+    'profiles.upsert_many_row': {
+        'postgresql': '(?, ?, ?, ?)',
+    },
+    'profiles.get': '''
+        SELECT display_name, picture_url, status_message, last_updated
+        FROM user_profiles
+        WHERE user_id = ?
+    ''',
+    'profiles.get_many': '''
+        SELECT user_id, display_name, picture_url, status_message, last_updated AS "last_updated [timestamp]"
+        FROM user_profiles
+        WHERE user_id {in_list}
+    ''',
+
+    # ---- webhook 事件去重 ----
+    # 只回傳這次新寫入的事件編號；已存在的就是重送的事件
+    # （WHERE true 是 SQLite 在 INSERT ... SELECT 搭配 ON CONFLICT 時的語法要求）
+    'events.mark_processed': '''
+        INSERT INTO processed_events (event_id)
+        SELECT value FROM {list_rows}
+        WHERE true
+        ON CONFLICT (event_id) DO NOTHING
+        RETURNING event_id
+    ''',
+    'events.get_processed': '''
+        SELECT event_id FROM processed_events
+        WHERE event_id {in_list}
+    ''',
+    'events.purge': '''
+        DELETE FROM processed_events
+        WHERE received_at < ?
+    ''',
+}
+
+_DELETE_TEMPLATES = {
+    'expenses.affected_users': 'SELECT DISTINCT user_id FROM expenses WHERE {where}',
+    'rollups.subtract': '''
+        UPDATE monthly_rollups
+        SET sum_cents = monthly_rollups.sum_cents - d.sum_cents,
+            count = monthly_rollups.count - d.count
+        FROM (
+            SELECT user_id, {month} AS month, COALESCE(category, '') AS category,
+                   SUM(amount_cents) AS sum_cents, COUNT(*) AS count
+            FROM expenses
+            WHERE {where}
+            GROUP BY user_id, {month}, COALESCE(category, '')
+        ) AS d
+        WHERE monthly_rollups.user_id = d.user_id
+          AND monthly_rollups.month = d.month
+          AND monthly_rollups.category = d.category
+    ''',
+    'current.subtract': '''
+        UPDATE user_settings
+        SET current_total_cents = user_settings.current_total_cents - d.total,
+            current_count = user_settings.current_count - d.count
+        FROM (
+            SELECT e.user_id, SUM(e.amount_cents) AS total, COUNT(*) AS count
+            FROM (SELECT user_id, amount_cents, timestamp FROM expenses WHERE {where}) AS e
+            JOIN user_settings AS s ON s.user_id = e.user_id
+            WHERE e.timestamp >= s.stats_reset_date
+            GROUP BY e.user_id
+        ) AS d
+        WHERE user_settings.user_id = d.user_id
+    ''',
+    'expenses.delete': 'DELETE FROM expenses WHERE {where}',
+    'expenses.delete_returning': '''
+        DELETE FROM expenses WHERE {where}
+        RETURNING id, user_id, amount_cents, description, timestamp
+    ''',
+}
+
+for _scope, _where in DELETE_SCOPES.items():
+    for _name, _template in _DELETE_TEMPLATES.items():
+        STATEMENTS[f'{_name}.{_scope}'] = _template.replace('{where}', _where)
+
+
+def compile_statement(sql, dialect):
+    """把以 `?` 撰寫的語句轉成指定資料庫的語法"""
+    for token, replacement in DIALECT_TOKENS[dialect].items():
+        sql = sql.replace(token, replacement)
+    if dialect == 'postgresql':
+        # psycopg2 以 %s 作為佔位符，字面上的 % 需要跳脫
+        sql = sql.replace('%', '%%').replace('?', '%s')
+    return sql
+
+
+class SQLRegistry:
+    """依資料庫類型編譯好的具名語句，並記錄每個語句的執行次數與耗時"""
+
+    def __init__(self, use_postgresql, statements=None):
+        self.use_postgresql = use_postgresql
+        self.dialect = 'postgresql' if use_postgresql else 'sqlite'
+        self._compiled = {}
+        self._list_params = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        for name, sql in (statements or STATEMENTS).items():
+            if isinstance(sql, dict):
+                # 只提供其中一種資料庫版本的語句，在另一種資料庫不會編譯
+                sql = sql.get(self.dialect)
+                if sql is None:
+                    continue
+            self._compiled[name] = compile_statement(sql, self.dialect)
+            self._list_params[name] = '{in_list}' in sql or '{list_rows}' in sql
+
+    def ensure(self, name, sql):
+        """登錄執行時才組出的語句（例如依篩選條件組合的查詢），已登錄的不會重新編譯
+
+        同一種組合使用同一個名稱，執行統計會依組合分開記錄。
+        """
+        if name not in self._compiled:
+            with self._lock:
+                self._list_params[name] = '{in_list}' in sql or '{list_rows}' in sql
+                self._compiled[name] = compile_statement(sql, self.dialect)
+        return name
+
+    def __contains__(self, name):
+        return name in self._compiled
+
+    def get(self, name):
+        """取得編譯後的 SQL"""
+        return self._compiled[name]
+
+    def _adapt(self, name, params):
+        # SQLite 沒有陣列型別，清單參數轉成 JSON 給 json_each 展開
+        if self.use_postgresql or not self._list_params[name]:
+            return params
+        return tuple(json.dumps(list(p)) if isinstance(p, (list, tuple)) else p for p in params)
+
+    def _record(self, name, elapsed):
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += elapsed
+            if elapsed > stat[2]:
+                stat[2] = elapsed
+
+    def execute(self, cursor, name, params=()):
+        """執行具名語句，回傳 cursor"""
+        started = time.perf_counter()
+        cursor.execute(self._compiled[name], self._adapt(name, params))
+        self._record(name, time.perf_counter() - started)
+        return cursor
+
+    def fetchone(self, cursor, name, params=()):
+        started = time.perf_counter()
+        cursor.execute(self._compiled[name], self._adapt(name, params))
+        row = cursor.fetchone()
+        self._record(name, time.perf_counter() - started)
+        return row
+
+    def fetchall(self, cursor, name, params=()):
+        started = time.perf_counter()
+        cursor.execute(self._compiled[name], self._adapt(name, params))
+        rows = cursor.fetchall()
+        self._record(name, time.perf_counter() - started)
+        return rows
+
+    def iterate(self, cursor, name, params=(), batch_size=500):
+        """逐筆產生查詢結果，每次向資料庫讀取 batch_size 筆
+
+        搭配 PostgreSQL 具名游標時結果留在伺服器端，記憶體用量只和 batch_size 有關；
+        執行統計記錄的是送出查詢到取得第一批的時間。
+        """
+        started = time.perf_counter()
+        cursor.execute(self._compiled[name], self._adapt(name, params))
+        rows = cursor.fetchmany(batch_size)
+        self._record(name, time.perf_counter() - started)
+        while rows:
+            yield from rows
+            rows = cursor.fetchmany(batch_size)
+
+    def executemany(self, cursor, name, seq_of_params):
+        """以同一個語句執行多組參數，回傳 cursor"""
+        started = time.perf_counter()
+        cursor.executemany(self._compiled[name], seq_of_params)
+        self._record(name, time.perf_counter() - started)
+        return cursor
+
+    def execute_values(self, cursor, name, rows, template_name, page_size=1000):
+        """PostgreSQL：把多列資料展開成 VALUES 一次送出，回傳 RETURNING 的結果"""
+        from psycopg2.extras import execute_values
+        started = time.perf_counter()
+        result = execute_values(cursor, self._compiled[name], rows,
+                                template=self._compiled[template_name],
+                                page_size=page_size, fetch=True)
+        self._record(name, time.perf_counter() - started)
+        return result
+
+    def stats(self):
+        """每個語句的執行次數與耗時（毫秒）"""
+        with self._lock:
+            return {
+                name: {
+                    'calls': calls,
+                    'total_ms': round(total * 1000, 3),
+                    'avg_ms': round(total * 1000 / calls, 3),
+                    'max_ms': round(max_elapsed * 1000, 3),
+                }
+                for name, (calls, total, max_elapsed) in sorted(self._stats.items())
+            }
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+管理頁面記錄瀏覽測試腳本
+測試 keyset 分頁在各種排序 / 篩選下逐頁取完的結果正確，以及查詢走索引
+"""
+
+import sys
+import os
+from datetime import datetime, date, timezone, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+from expense_browser import ExpenseQuery
+from line_bot import app, db
+
+
+def collect(query_args, limit):
+    """逐頁取完，回傳所有記錄 ID 與頁數"""
+    ids, pages, cursor = [], 0, None
+    while True:
+        query = ExpenseQuery(limit=limit, cursor=cursor, **query_args)
+        rows, cursor = db.browse_expenses(query)
+        ids += [row[0] for row in rows]
+        pages += 1
+        if cursor is None:
+            return ids, pages
+
+
+def test_keyset_pages():
+    """測試逐頁取完的結果與直接排序一致（含相同金額 / 時間的記錄）"""
+    user_id = f"test_browse_{datetime.now().strftime('%H%M%S%f')}"
+    base = datetime(2024, 3, 1, 4, 0, tzinfo=timezone.utc)
+    rows = [
+        {'user_id': user_id, 'amount_cents': 1000 * (i % 5 + 1), 'description': f'項目{i} {"Coffee" if i % 3 == 0 else "午餐"}',
+         'timestamp': base + timedelta(days=i // 2)}
+        for i in range(23)
+    ]
+    print("🧪 keyset 分頁測試...")
+
+    try:
+        ids = db.add_expenses_bulk(rows)
+        records = [(expense_id, row) for expense_id, row in zip(ids, rows)]
+
+        def expected(key, descending, keep=lambda row: True):
+            selected = [(key(row), expense_id) for expense_id, row in records if keep(row)]
+            return [expense_id for _, expense_id in sorted(selected, reverse=descending)]
+
+        cases = [
+            ({'sort': 'time'}, expected(lambda r: r['timestamp'], True)),
+            ({'sort': 'time', 'descending': False}, expected(lambda r: r['timestamp'], False)),
+            ({'sort': 'amount'}, expected(lambda r: r['amount_cents'], True)),
+            ({'sort': 'amount', 'descending': False}, expected(lambda r: r['amount_cents'], False)),
+            ({'sort': 'id', 'descending': False}, sorted(ids)),
+            ({'sort': 'amount', 'min_cents': 2000, 'max_cents': 4000},
+             expected(lambda r: r['amount_cents'], True, lambda r: 2000 <= r['amount_cents'] <= 4000)),
+            ({'keyword': 'coffee'}, expected(lambda r: r['timestamp'], True, lambda r: 'Coffee' in r['description'])),
+            ({'date_from': date(2024, 3, 3), 'date_to': date(2024, 3, 5)},
+             expected(lambda r: r['timestamp'], True, lambda r: date(2024, 3, 3) <= r['timestamp'].date() <= date(2024, 3, 5))),
+        ]
+        for args, expected_ids in cases:
+            got, pages = collect(dict(args, user_id=user_id), limit=4)
+            print(f"   {args} -> {len(got)} 筆 / {pages} 頁")
+            assert got == expected_ids, args
+
+        # 篩選欄位中的 % 與 _ 視為一般字元
+        assert collect({'user_id': user_id, 'keyword': '%'}, limit=5)[0] == []
+        print("✅ 各種排序與篩選逐頁取完的結果正確")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+def test_query_args_and_cursor():
+    """測試網址參數解析與游標驗證"""
+    query = ExpenseQuery.from_args({'from': '2024-03-01', 'min': '12.5', 'q': ' 咖啡 ', 'sort': 'amount', 'order': 'asc'})
+    assert query.min_cents == 1250 and query.keyword == '咖啡' and not query.descending
+    assert query.to_args() == {'from': '2024-03-01', 'min': '12.5', 'q': '咖啡', 'sort': 'amount', 'order': 'asc'}
+
+    for bad in ({'from': '2024/03/01'}, {'min': 'abc'}, {'limit': 'x'}, {'cursor': '!!!'}, {'sort': 'name'}):
+        try:
+            ExpenseQuery.from_args(bad).statement()
+            raise AssertionError(f'應該拋出 ValueError: {bad}')
+        except ValueError as e:
+            print(f"   {bad} -> {e}")
+
+    cursor = ExpenseQuery(sort='amount').encode_cursor((5, 'u', 100, None, '', None, None))
+    try:
+        ExpenseQuery(sort='time', cursor=cursor).statement()
+        raise AssertionError('游標與排序不符應該拋出 ValueError')
+    except ValueError:
+        pass
+    name, _, params = ExpenseQuery(sort='amount', cursor=cursor, user_id='u').statement()
+    assert name == 'expenses.browse.amount.desc.user+after' and params == ('u', 100, 5, 51)
+    print("✅ 網址參數與游標驗證正確")
+
+
+def test_index_backed():
+    """測試分頁查詢走索引，不需要另外排序"""
+    with db.get_connection() as conn:
+        if db.use_postgresql:
+            print("   （PostgreSQL 略過 SQLite 查詢計畫檢查）")
+            return
+        for args, index in [
+            ({'user_id': 'u'}, 'idx_expenses_user_timestamp_id'),
+            ({'user_id': 'u', 'sort': 'amount'}, 'idx_expenses_user_amount_id'),
+            ({'sort': 'time', 'descending': False}, 'idx_expenses_timestamp_id'),
+        ]:
+            query = ExpenseQuery(**args)
+            query.cursor = query.encode_cursor((10, 'u', 100, None, '', None, datetime(2024, 1, 1, tzinfo=timezone.utc)))
+            name, sql, params = query.statement()
+            db.sql.ensure(name, sql)
+            plan = ' '.join(str(row[-1]) for row in conn.execute('EXPLAIN QUERY PLAN ' + db.sql.get(name), db.sql._adapt(name, params)))
+            print(f"   {name}: {plan}")
+            assert index in plan and 'TEMP B-TREE' not in plan
+    print("✅ 分頁查詢走索引")
+
+
+def test_admin_pages():
+    """測試管理頁面顯示分頁連結與篩選錯誤"""
+    user_id = f"test_browse_page_{datetime.now().strftime('%H%M%S%f')}"
+    try:
+        db.add_expenses_bulk([{'user_id': user_id, 'amount_cents': 100 * i, 'description': f'項目{i}'} for i in range(1, 8)])
+        client = app.test_client()
+        page = client.get(f'/admin/user/{user_id}?limit=5').get_data(as_text=True)
+        assert '本頁 5 筆' in page and '下一頁' in page and '記錄數量: 7' in page
+        page = client.get(f'/admin/expenses?user={user_id}&sort=amount&order=asc&limit=3').get_data(as_text=True)
+        assert '本頁 3 筆' in page and '項目1' in page and '項目4' not in page
+        page = client.get('/admin/expenses?from=yesterday').get_data(as_text=True)
+        assert '起始日期格式錯誤' in page
+        print("✅ 管理頁面分頁與篩選正確")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+if __name__ == "__main__":
+    test_keyset_pages()
+    test_query_args_and_cursor()
+    test_index_backed()
+    test_admin_pages()
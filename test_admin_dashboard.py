@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+管理儀表板測試腳本
+測試用戶資料以 LEFT JOIN 一次取得，缺少的資料並行補抓並批量儲存
+"""
+
+import sys
+import os
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+import line_bot
+from line_bot import app, db
+
+
+class FakeProfileApi:
+    """模擬 LINE get_profile：每次呼叫延遲一段時間，並記錄同時進行的呼叫數"""
+
+    def __init__(self, delay=0.05, fail_ids=()):
+        self.delay = delay
+        self.fail_ids = set(fail_ids)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def get_profile(self, user_id):
+        with self.lock:
+            self.calls.append(user_id)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if user_id in self.fail_ids:
+                raise RuntimeError('profile not found')
+            return SimpleNamespace(display_name=f'名字_{user_id[-4:]}', picture_url=None, status_message='')
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def call_count(name):
+    return db.get_sql_stats().get(name, {}).get('calls', 0)
+
+
+def test_dashboard_profiles():
+    """測試儀表板只查詢一次資料庫，缺少的資料並行補抓"""
+    suffix = datetime.now().strftime('%H%M%S%f')
+    known = f"test_dash_known_{suffix}"
+    missing = [f"test_dash_missing_{i}_{suffix}" for i in range(8)]
+    broken = f"test_dash_broken_{suffix}"
+    users = [known, broken] + missing
+    print("🧪 管理儀表板測試...")
+
+    original_api = line_bot.line_bot_api
+    fake = FakeProfileApi(fail_ids={broken})
+    try:
+        db.add_expenses_bulk([{'user_id': user_id, 'amount_cents': 1000, 'description': '測試'} for user_id in users])
+        db.save_user_profile(known, '已知用戶', None, '')
+        line_bot.line_bot_api = fake
+
+        upserts_before = call_count('profiles.upsert_many')
+        gets_before = call_count('profiles.get')
+        started = time.perf_counter()
+        html = app.test_client().get('/admin').get_data(as_text=True)
+        elapsed = time.perf_counter() - started
+        print(f"   查詢 {len(fake.calls)} 次 LINE API，最多同時 {fake.max_active} 個，耗時 {elapsed * 1000:.0f} ms")
+
+        assert '已知用戶' in html and known not in fake.calls
+        assert all(f'名字_{user_id[-4:]}' in html for user_id in missing)
+        assert f'用戶 {broken[:8]}...' in html
+        assert fake.max_active > 1
+        assert call_count('profiles.get') == gets_before
+        assert call_count('profiles.upsert_many') == upserts_before + 1
+        assert db.get_user_profile(missing[0])['display_name'] == f'名字_{missing[0][-4:]}'
+        assert db.get_user_profile(broken) is None
+
+        # 第二次載入：成功的從快取取得，失敗的在退避期間不再查詢
+        fake.calls.clear()
+        app.test_client().get('/admin')
+        assert fake.calls == []
+        print("✅ 用戶資料一次查詢，缺少的並行補抓並批量儲存")
+    finally:
+        line_bot.line_bot_api = original_api
+        for user_id in users:
+            db.clear_all_expenses(user_id)
+
+
+if __name__ == "__main__":
+    test_dashboard_profiles()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+管理頁面串流輸出測試腳本
+測試記錄頁面與 JSON 以串流回應輸出、內容與分頁查詢一致，以及中途停止時會歸還連線
+"""
+
+import sys
+import os
+import json
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+from expense_browser import ExpenseQuery, ExpensePage
+from line_bot import app, db
+
+
+def test_expense_page():
+    """測試 ExpensePage 與 browse_expenses 的結果一致，提前中斷時歸還連線"""
+    user_id = f"test_stream_{datetime.now().strftime('%H%M%S%f')}"
+    print("🧪 ExpensePage 測試...")
+
+    try:
+        db.add_expenses_bulk([{'user_id': user_id, 'amount_cents': 100 * i, 'description': f'項目{i}'} for i in range(1, 8)])
+        in_use = db.get_pool_stats()['in_use']
+
+        for limit in (3, 7, 10):
+            query = ExpenseQuery(user_id=user_id, sort='amount', limit=limit)
+            rows, next_cursor = db.browse_expenses(query)
+            page = ExpensePage(query, db.iter_expenses(query, batch_size=2))
+            assert page
+            assert list(page) == rows
+            assert page.count == len(rows) and page.next_cursor == next_cursor
+            assert page.total_cents == sum(row[2] for row in rows)
+            assert db.get_pool_stats()['in_use'] == in_use
+
+        # 沒有資料的一頁
+        query = ExpenseQuery(user_id=user_id + '_none')
+        page = ExpensePage(query, db.iter_expenses(query))
+        assert not page and list(page) == []
+
+        # 只讀了第一筆就停止
+        query = ExpenseQuery(user_id=user_id)
+        page = ExpensePage(query, db.iter_expenses(query, batch_size=1))
+        next(iter(page))
+        page.close()
+        assert db.get_pool_stats()['in_use'] == in_use
+        print("✅ ExpensePage 結果與分頁查詢一致，連線正確歸還")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+def test_streamed_responses():
+    """測試管理頁面與 JSON 以串流回應輸出"""
+    user_id = f"test_stream_page_{datetime.now().strftime('%H%M%S%f')}"
+    print("🧪 串流回應測試...")
+
+    try:
+        ids = db.add_expenses_bulk([{'user_id': user_id, 'amount_cents': 100 * i, 'description': f'項目{i}'}
+                                    for i in range(1, 8)])
+        client = app.test_client()
+
+        response = client.get(f'/admin/expenses?user={user_id}&limit=5')
+        assert response.is_streamed
+        page = response.get_data(as_text=True)
+        assert '本頁 5 筆' in page and '顯示總金額: $25' in page and page.rstrip().endswith('</html>')
+
+        response = client.get(f'/admin/user/{user_id}?limit=5')
+        assert response.is_streamed
+        page = response.get_data(as_text=True)
+        assert '本頁 5 筆' in page and '記錄數量: 7' in page
+
+        response = client.get(f'/admin/api/expenses?user={user_id}&sort=id&order=asc&limit=4')
+        assert response.is_streamed and response.mimetype == 'application/json'
+        data = json.loads(response.get_data(as_text=True))
+        assert [row['id'] for row in data['expenses']] == ids[:4] and data['count'] == 4
+        assert data['expenses'][0]['amount_cents'] == 100 and data['expenses'][0]['description'] == '項目1'
+
+        data = client.get(f'/admin/api/expenses?user={user_id}&sort=id&order=asc&cursor={data["next_cursor"]}').get_json()
+        assert [row['id'] for row in data['expenses']] == ids[4:] and data['next_cursor'] is None
+
+        response = client.get('/admin/api/expenses?min=abc')
+        assert response.status_code == 400 and response.get_json()['success'] is False
+        print("✅ 記錄頁面與 JSON 串流輸出正確")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+if __name__ == "__main__":
+    test_expense_page()
+    test_streamed_responses()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量新增測試腳本
+測試 add_expenses_bulk 回傳的 ID、每月彙總與當前統計
+"""
+
+import sys
+import os
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+from database import ExpenseDatabase
+
+
+def test_bulk_insert():
+    """測試批量新增後記錄、彙總與當前統計都正確"""
+    db = ExpenseDatabase()
+    test_user_id = f"test_bulk_user_{datetime.now().strftime('%H%M%S%f')}"
+
+    print("🧪 批量新增測試開始...")
+    print("=" * 50)
+
+    try:
+        rows = [
+            {'user_id': test_user_id, 'amount_cents': 1000 + i, 'description': f'回填{i}',
+             'timestamp': datetime(2024, 1 + i % 3, 15, tzinfo=timezone.utc)}
+            for i in range(300)
+        ]
+        expense_ids = db.add_expenses_bulk(rows)
+
+        assert len(expense_ids) == 300 and expense_ids == sorted(expense_ids)
+        first = db.get_expense(expense_ids[0])
+        last = db.get_expense(expense_ids[-1])
+        assert (first[2], first[3]) == (1000, '回填0')
+        assert (last[2], last[3]) == (1299, '回填299')
+        print(f"   ✅ 300 筆 ID 依序回傳: #{expense_ids[0]} ~ #{expense_ids[-1]}")
+
+        totals = {month: (cents, count) for _, month, cents, count
+                  in db.get_monthly_totals(test_user_id, '2024-01', '2024-03')}
+        assert totals[1] == (sum(1000 + i for i in range(0, 300, 3)), 100)
+        assert sum(count for _, count in totals.values()) == 300
+        print(f"   ✅ 每月彙總: {totals}")
+
+        current = db.get_current_stats(test_user_id)
+        assert current['total_count'] == 300
+        assert current['total_cents'] == sum(row['amount_cents'] for row in rows)
+        assert current['first_record'] == datetime(2024, 1, 15, tzinfo=timezone.utc)
+        print(f"   ✅ 當前統計: {current['total_cents']} 分 / {current['total_count']} 筆")
+
+        mismatches = [m for m in db.check_monthly_rollups() if m['user_id'] == test_user_id]
+        assert not mismatches
+        assert db.add_expenses_bulk([]) == []
+    finally:
+        db.clear_all_expenses(test_user_id)
+
+
+if __name__ == "__main__":
+    test_bulk_insert()
+    print("\n🎉 所有測試完成！")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+指令路由測試腳本
+測試單一正規表示式的分類結果與原本的判斷流程一致，並正確取出參數
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import CORPUS, COMMANDS, legacy_classify
+from command_router import CommandRouter
+
+
+def test_same_as_legacy():
+    """測試語料的分類與原本的判斷流程一致"""
+    router = CommandRouter(COMMANDS)
+    for message in CORPUS:
+        assert router.route(message).kind == legacy_classify(message), message
+    print(f"✅ {len(CORPUS)} 則訊息分類一致")
+
+
+def test_route_args():
+    """測試路由直接取出參數"""
+    router = CommandRouter(COMMANDS)
+    cases = [
+        ('@ai 查詢 30', 'ai_query', {'limit': 30}),
+        ('@ai list', 'ai_query', {'limit': None}),
+        ('@ai ？', 'ai_help', {'topic': 'help'}),
+        ('@ai MENU', 'ai_help', {'topic': 'menu'}),
+        ('@ai hi', 'ai_help', {'topic': 'welcome'}),
+        ('@ai /del #23', 'delete', {'delete_id': 23}),
+        ('@ai /del 看看 /del #5', 'delete', {'delete_id': 5}),
+        ('@ai /del 23', 'delete', {'delete_id': None}),
+        ('  @ai 午餐 120  ', 'expense', {'content': '午餐 120'}),
+        ('LIST30', 'number_query', {'limit': 30}),
+        ('當前統計', 'command', {'name': '當前統計'}),
+        ('Help', 'chat', {}),
+        ('大家好', 'chat', {}),
+    ]
+    for message, kind, args in cases:
+        route = router.route(message)
+        print(f"   {message!r} -> {route}")
+        assert (route.kind, route.args) == (kind, args), message
+    print("✅ 參數取出正確")
+
+
+if __name__ == "__main__":
+    test_same_as_legacy()
+    test_route_args()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+連線池測試腳本
+測試 PostgreSQL 連線池的上限 / 健康檢查，以及 SQLite 每執行緒重用連線
+"""
+
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from connection_pool import PostgresConnectionPool, SQLiteConnectionPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise RuntimeError("connection lost")
+
+    def fetchone(self):
+        return (1,)
+
+
+class FakeConnection:
+    """模擬 psycopg2 連線，只實作連線池會用到的部分"""
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise RuntimeError("connection lost")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def test_postgres_pool_bounded():
+    """測試連線數上限與等待逾時"""
+    print("🧪 PostgreSQL 連線池上限測試...")
+    pool = PostgresConnectionPool(FakeConnection, min_size=1, max_size=2, timeout=0.1)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    stats = pool.stats()
+    print(f"   取得 2 條連線後: {stats}")
+    assert stats['in_use'] == 2 and stats['size'] == 2
+
+    try:
+        pool.acquire()
+        print("   ❌ 超過上限卻沒有逾時")
+        assert False
+    except PoolTimeoutError:
+        print("   ✅ 超過上限時正確逾時")
+
+    # 歸還後應可重用，而不是建立新連線
+    raw = first.raw
+    first.close()
+    first.close()  # 重複歸還不應影響計數
+    third = pool.acquire()
+    assert third.raw is raw
+    print("   ✅ 歸還的連線被重用")
+
+    second.close()
+    third.close()
+    stats = pool.stats()
+    print(f"   全部歸還後: {stats}")
+    assert stats['in_use'] == 0 and stats['idle'] == 2 and stats['timeouts'] == 1
+
+
+def test_postgres_pool_health_check():
+    """測試閒置連線的健康檢查"""
+    print("\n🧪 PostgreSQL 連線池健康檢查測試...")
+    pool = PostgresConnectionPool(FakeConnection, min_size=1, max_size=2, health_check_interval=0)
+
+    conn = pool.acquire()
+    broken = conn.raw
+    conn.close()
+    broken.broken = True
+
+    conn = pool.acquire()
+    assert conn.raw is not broken and broken.closed
+    conn.close()
+    print(f"   ✅ 斷線的連線被丟棄並重建: {pool.stats()}")
+
+
+def test_sqlite_pool_per_thread(tmp_db='test_connection_pool.db'):
+    """測試 SQLite 每個執行緒重用同一條連線"""
+    print("\n🧪 SQLite 每執行緒連線測試...")
+    pool = SQLiteConnectionPool(tmp_db)
+    try:
+        a = pool.acquire()
+        b = pool.acquire()  # 巢狀取得
+        assert a.raw is b.raw
+        b.close()
+        a.close()
+
+        seen = []
+
+        def worker():
+            conn = pool.acquire()
+            seen.append(conn.raw)
+            conn.close()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+        assert seen[0] is not a.raw
+        stats = pool.stats()
+        print(f"   連線池統計: {stats}")
+        assert stats['in_use'] == 0 and stats['size'] == 2
+        print("   ✅ 同一執行緒重用連線，不同執行緒各自一條")
+    finally:
+        pool.close_all()
+        if os.path.exists(tmp_db):
+            os.remove(tmp_db)
+
+
+if __name__ == "__main__":
+    print("🚀 開始測試連線池...")
+    test_postgres_pool_bounded()
+    test_postgres_pool_health_check()
+    test_sqlite_pool_per_thread()
+    print("\n🎉 所有測試完成！")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 事件去重測試腳本
+測試 /callback 的記憶體 LRU、工作執行緒以 processed_events 判斷重送事件、記帳與事件編號同一個交易寫入，以及過期清理
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+from database import ExpenseDatabase, DuplicateEventError
+from event_dedupe import EventDeduplicator
+
+
+def forget_events(db, event_ids):
+    """測試結束後從測試資料庫移除事件編號記錄"""
+    name = db.sql.ensure('test.events.forget', 'DELETE FROM processed_events WHERE event_id {in_list}')
+    with db.get_connection() as conn:
+        db.sql.execute(conn.cursor(), name, (list(event_ids),))
+        conn.commit()
+
+
+def make_event(event_id):
+    return {'type': 'message', 'webhookEventId': event_id, 'message': {'type': 'text', 'text': '@ai 午餐 120'}}
+
+
+def test_memory_filter():
+    """測試 /callback 的記憶體 LRU 擋下短時間內的重送，不寫入資料庫"""
+    print("🧪 記憶體去重測試...")
+    db = ExpenseDatabase()
+    event_id = f"test_dedupe_memory_{datetime.now().strftime('%H%M%S%f')}"
+
+    dedupe = EventDeduplicator(db, max_size=1)
+    accepted = dedupe.filter_new([make_event(event_id), make_event(event_id), {'type': 'follow'}])
+    assert [e.get('webhookEventId') for e in accepted] == [event_id, None]
+    assert dedupe.filter_new([make_event(event_id)]) == []
+    # 只記在記憶體，資料表中沒有
+    assert db.get_processed_events([event_id]) == set()
+
+    # 寫入收件匣失敗時撤銷，LINE 重送的事件可以再被接受
+    dedupe.forget([make_event(event_id)])
+    assert len(dedupe.filter_new([make_event(event_id)])) == 1
+    # 被擠出 LRU 後視為新事件，由工作執行緒判斷
+    assert len(dedupe.filter_new([make_event(event_id + '_other')])) == 1
+    assert len(dedupe.filter_new([make_event(event_id)])) == 1
+    print(f"   去重統計: {dedupe.stats()}")
+    print("✅ 記憶體去重正確，不查資料庫")
+
+
+def test_redelivery_rejected():
+    """測試事件編號與記帳在同一個交易寫入，重新處理時不會重複記帳"""
+    print("🧪 事件去重測試...")
+    db = ExpenseDatabase()
+    prefix = f"test_dedupe_{datetime.now().strftime('%H%M%S%f')}"
+    user_id, first_id, second_id = f"{prefix}_user", f"{prefix}_1", f"{prefix}_2"
+    row = {'user_id': user_id, 'amount_cents': 12000, 'description': '午餐'}
+
+    try:
+        dedupe = EventDeduplicator(db)
+        assert dedupe.processed([first_id, second_id]) == set()
+
+        expense_ids, _, _ = db.apply_expense_batch([row], [], [first_id])
+        assert len(expense_ids) == 1
+        assert dedupe.processed([first_id, second_id]) == {first_id}
+
+        # 同一個事件再寫入一次：整批回滾，不會多一筆
+        try:
+            db.apply_expense_batch([row, row], [], [first_id, second_id])
+            assert False, "應該拋出 DuplicateEventError"
+        except DuplicateEventError as e:
+            assert e.event_ids == {first_id}
+        assert len(db.get_user_expenses(user_id)) == 1
+        assert dedupe.processed([second_id]) == set()
+
+        # 寫入失敗時事件編號一起回滾，重新處理時仍會寫入
+        try:
+            db.apply_expense_batch([{'user_id': user_id, 'amount_cents': None}], [], [second_id])
+            assert False, "應該寫入失敗"
+        except DuplicateEventError:
+            raise
+        except Exception:
+            pass
+        assert dedupe.processed([second_id]) == set()
+
+        # 重新啟動（記憶體清空）後仍然擋得下
+        restarted = EventDeduplicator(db)
+        assert restarted.processed([first_id]) == {first_id}
+        assert restarted.stats()['duplicates_in_db'] == 1
+        print("✅ 記帳與事件編號一起寫入，重送事件不會重複記帳")
+    finally:
+        db.clear_all_expenses(user_id)
+        forget_events(db, [first_id, second_id])
+
+
+def test_purge_expired():
+    """測試過期記錄會被清除"""
+    print("🧪 事件去重過期清理測試...")
+    db = ExpenseDatabase()
+    event_id = f"test_dedupe_purge_{datetime.now().strftime('%H%M%S%f')}"
+
+    try:
+        assert db.mark_events_processed([event_id]) == {event_id}
+        assert db.purge_processed_events(datetime.now(timezone.utc) - timedelta(hours=1)) == 0
+        assert db.purge_processed_events(datetime.now(timezone.utc) + timedelta(seconds=5)) >= 1
+        assert db.mark_events_processed([event_id]) == {event_id}
+        print("✅ 過期記錄清除後視為新事件")
+    finally:
+        forget_events(db, [event_id])
+
+
+if __name__ == "__main__":
+    test_memory_filter()
+    test_redelivery_rejected()
+    test_purge_expired()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 事件收件匣測試腳本
+測試批次認領、完成 / 失敗標記、失敗後延遲重試，以及模擬程式當掉後的重新處理
+"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import event_inbox
+from event_inbox import EventInbox
+
+
+def make_event(i):
+    return {'type': 'message', 'webhookEventId': f'evt-{i}', 'message': {'type': 'text', 'text': f'@ai 午餐 {i}'}}
+
+
+def test_claim_and_complete():
+    """測試批次認領不會重複，完成後不再被認領"""
+    print("🧪 收件匣認領測試...")
+    tmp_dir = tempfile.mkdtemp()
+    inbox = EventInbox(os.path.join(tmp_dir, 'inbox.db'))
+    try:
+        ids = inbox.append([make_event(i) for i in range(5)])
+        assert len(ids) == 5
+        assert inbox.pending_count() == 5 and inbox.pending_count(limit=3) == 3
+
+        first = inbox.claim('worker-1', limit=3)
+        second = inbox.claim('worker-2', limit=3)
+        assert [row[0] for row in first] == ids[:3]
+        assert [row[0] for row in second] == ids[3:]
+        assert first[0][1]['webhookEventId'] == 'evt-0'
+        assert inbox.claim('worker-3', limit=3) == []
+
+        inbox.complete([row[0] for row in first + second])
+        stats = inbox.stats()
+        print(f"   收件匣統計: {stats}")
+        assert stats['done'] == 5 and stats['pending'] == 0
+        print("✅ 批次認領正確")
+    finally:
+        inbox.close()
+
+
+def test_fail_and_retry():
+    """測試失敗會放回待處理，超過嘗試次數後標記為 failed"""
+    print("🧪 收件匣重試測試...")
+    tmp_dir = tempfile.mkdtemp()
+    inbox = EventInbox(os.path.join(tmp_dir, 'inbox.db'), max_attempts=2)
+    try:
+        inbox.append([make_event(1)])
+        for expected_attempts in (1, 2):
+            batch = inbox.claim('worker', limit=10)
+            assert len(batch) == 1 and batch[0][2] == expected_attempts
+            inbox.fail(batch[0][0], RuntimeError("boom"))
+
+        assert inbox.claim('worker', limit=10) == []
+        assert inbox.stats()['failed'] == 1
+        print("✅ 超過嘗試次數後不再重試")
+    finally:
+        inbox.close()
+
+
+def test_retry_backoff():
+    """測試失敗的事件要等待一段時間（每次加倍）才會再被認領"""
+    print("🧪 收件匣延遲重試測試...")
+    tmp_dir = tempfile.mkdtemp()
+    inbox = EventInbox(os.path.join(tmp_dir, 'inbox.db'), max_attempts=3, retry_delay=0.2)
+    try:
+        inbox.append([make_event(1)])
+        assert inbox.next_retry_in() is None
+
+        batch = inbox.claim('worker', limit=10)
+        assert inbox.fail(batch[0][0], RuntimeError("database is down")) is True
+        assert inbox.claim('worker', limit=10) == []
+        assert 0 < inbox.next_retry_in() <= 0.2
+        time.sleep(0.25)
+        batch = inbox.claim('worker', limit=10)
+        assert len(batch) == 1 and batch[0][2] == 2
+
+        # 第二次失敗等待加倍
+        assert inbox.fail(batch[0][0], RuntimeError("database is down")) is True
+        assert 0.2 < inbox.next_retry_in() <= 0.4
+        time.sleep(0.45)
+        batch = inbox.claim('worker', limit=10)
+        assert inbox.fail(batch[0][0], RuntimeError("database is down")) is False
+        assert inbox.stats()['failed'] == 1 and inbox.next_retry_in() is None
+        print("✅ 失敗的事件延遲重試，超過次數後標記為 failed")
+    finally:
+        inbox.close()
+
+
+def test_upgrade_old_inbox():
+    """測試舊版收件匣檔案（沒有 available_at 欄位）開啟時會補上欄位"""
+    print("🧪 舊版收件匣升級測試...")
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'inbox.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE webhook_inbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, event_id TEXT, payload TEXT NOT NULL, received_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending', claimed_pid INTEGER, claimed_by TEXT, claimed_at REAL,
+            finished_at REAL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT
+        )
+    ''')
+    conn.execute("INSERT INTO webhook_inbox (event_id, payload, received_at) VALUES ('evt-old', '{}', 0)")
+    conn.commit()
+    conn.close()
+
+    inbox = EventInbox(path)
+    try:
+        assert [row[0] for row in inbox.claim('worker', limit=10)] == [1]
+        print("✅ 舊版收件匣可以直接使用")
+    finally:
+        inbox.close()
+
+
+def test_recover_after_crash():
+    """測試已結束行程認領的事件會在啟動時放回待處理"""
+    print("🧪 收件匣當機復原測試...")
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'inbox.db')
+    inbox = EventInbox(path)
+    try:
+        inbox.append([make_event(i) for i in range(3)])
+        claimed = inbox.claim('worker', limit=2)
+        assert len(claimed) == 2
+        # 模擬認領事件的行程已經結束
+        with inbox.pool.acquire() as conn:
+            conn.execute("UPDATE webhook_inbox SET claimed_pid = -1 WHERE status = 'claimed'")
+    finally:
+        inbox.close()
+
+    original = event_inbox._pid_alive
+    event_inbox._pid_alive = lambda pid: pid != -1
+    restarted = EventInbox(path)
+    try:
+        pending = restarted.recover()
+        assert pending == 3
+        replayed = restarted.claim('worker', limit=10)
+        assert [row[1]['webhookEventId'] for row in replayed] == ['evt-0', 'evt-1', 'evt-2']
+        print("✅ 重新啟動後找回所有未完成事件")
+    finally:
+        event_inbox._pid_alive = original
+        restarted.close()
+
+
+if __name__ == "__main__":
+    test_claim_and_complete()
+    test_fail_and_retry()
+    test_retry_backoff()
+    test_upgrade_old_inbox()
+    test_recover_after_crash()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+支出記錄匯出測試腳本
+測試 CSV / JSONL / XLSX 匯出內容、gzip 壓縮、以 after_id 接續匯出，以及 /admin/export 與 manage.py export
+"""
+
+import sys
+import os
+import csv
+import gzip
+import io
+import json
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+import manage
+from expense_browser import ExpenseQuery
+from expense_export import ExpenseExport, last_exported_id
+from line_bot import app, db
+
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def add_test_expenses(prefix, count=7):
+    user_id = f"{prefix}_{datetime.now().strftime('%H%M%S%f')}"
+    ids = db.add_expenses_bulk([
+        {'user_id': user_id, 'amount_cents': 150 * i, 'description': f'項目{i}, "引號"\n第二行' if i == 2 else f'項目{i}'}
+        for i in range(1, count + 1)
+    ])
+    return user_id, ids
+
+
+def export_bytes(user_id, fmt, **kwargs):
+    after_id = kwargs.pop('after_id', None)
+    query = ExpenseQuery(user_id=user_id).for_export(after_id, db.get_max_expense_id())
+    export = ExpenseExport(db, query, fmt, header=after_id is None, **kwargs)
+    return b''.join(export), export
+
+
+def test_csv_and_jsonl():
+    """測試 CSV / JSONL 內容、gzip 與接續匯出"""
+    user_id, ids = add_test_expenses('test_export')
+    print("🧪 CSV / JSONL 匯出測試...")
+
+    try:
+        data, export = export_bytes(user_id, 'csv')
+        assert export.count == 7 and export.last_id == ids[-1]
+        records = list(csv.DictReader(io.StringIO(data.decode('utf-8-sig'), newline='')))
+        assert [int(record['id']) for record in records] == ids
+        assert records[1]['amount'] == '3' and records[1]['description'] == '項目2, "引號"\n第二行'
+        assert records[0]['user_id'] == user_id and records[0]['timestamp']
+
+        # 接續匯出：兩段合起來與一次匯出相同
+        rest, resumed = export_bytes(user_id, 'csv', after_id=ids[3])
+        assert resumed.count == 3 and data.endswith(rest) and not rest.startswith(b'\xef\xbb\xbf')
+
+        data, _ = export_bytes(user_id, 'jsonl')
+        lines = [json.loads(line) for line in data.decode('utf-8').splitlines()]
+        assert [line['id'] for line in lines] == ids and lines[0]['amount'] == '1.50'
+
+        compressed, export = export_bytes(user_id, 'jsonl', compress=True)
+        assert export.extension == 'jsonl.gz' and gzip.decompress(compressed) == data
+        print("✅ CSV / JSONL 匯出內容正確")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+def test_xlsx():
+    """測試 XLSX 匯出為合法的活頁簿，超過工作表列數時換下一個工作表"""
+    user_id, ids = add_test_expenses('test_export_xlsx')
+    print("🧪 XLSX 匯出測試...")
+
+    try:
+        data, export = export_bytes(user_id, 'xlsx', compress=True)
+        assert export.extension == 'xlsx'
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.testzip() is None
+            rows = ET.fromstring(archive.read('xl/worksheets/sheet1.xml')).iter(f'{SHEET_NS}row')
+            values = [[cell.findtext(f'.//{SHEET_NS}t') or cell.findtext(f'{SHEET_NS}v') for cell in row] for row in rows]
+            assert values[0][:3] == ['id', 'user_id', 'amount']
+            assert [int(row[0]) for row in values[1:]] == ids and values[1][2] == '1.50'
+            assert '<sheets><sheet name="expenses"' in archive.read('xl/workbook.xml').decode()
+
+        # 每個工作表 3 列資料：7 筆分成 3 個工作表
+        query = ExpenseQuery(user_id=user_id).for_export()
+        export = ExpenseExport(db, query, 'xlsx')
+        data = b''.join(export._xlsx(export._records(db.iter_expenses(query)), sheet_rows=3))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            sheets = sorted(name for name in archive.namelist() if name.startswith('xl/worksheets/'))
+            assert len(sheets) == 3
+            assert archive.read('xl/worksheets/sheet3.xml').count(b'<row ') == 2
+        print("✅ XLSX 匯出內容正確")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+def test_export_endpoint():
+    """測試 /admin/export 串流輸出與參數檢查"""
+    user_id, ids = add_test_expenses('test_export_http')
+    print("🧪 /admin/export 測試...")
+
+    try:
+        client = app.test_client()
+        response = client.get(f'/admin/export?user={user_id}&format=jsonl&gzip=1')
+        assert response.is_streamed and response.mimetype == 'application/gzip'
+        until_id = int(response.headers['X-Export-Until-Id'])
+        assert until_id >= ids[-1] and 'jsonl.gz' in response.headers['Content-Disposition']
+        lines = gzip.decompress(response.get_data()).decode('utf-8').splitlines()
+        assert [json.loads(line)['id'] for line in lines] == ids
+
+        response = client.get(f'/admin/export?user={user_id}&after_id={ids[4]}&until_id={ids[5]}')
+        records = list(csv.reader(io.StringIO(response.get_data(as_text=True), newline='')))
+        assert [int(record[0]) for record in records] == [ids[5]]
+
+        assert client.get('/admin/export?format=pdf').status_code == 400
+        assert client.get('/admin/export?after_id=abc').status_code == 400
+        assert client.get('/admin/export?from=yesterday').status_code == 400
+        print("✅ /admin/export 串流輸出正確")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+def test_manage_export_resume():
+    """測試 manage.py export 與 --resume 接續中斷的檔案"""
+    user_id, ids = add_test_expenses('test_export_cli')
+    print("🧪 manage.py export 測試...")
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            full = os.path.join(directory, 'full.csv')
+            assert manage.main(['export', full, '--user', user_id]) == 0
+            with open(full, 'rb') as f:
+                expected = f.read()
+
+            # 模擬在第 4 筆中間中斷
+            partial = os.path.join(directory, 'partial.csv')
+            cut = expected.index(f'{ids[3]},'.encode()) + 5
+            with open(partial, 'wb') as f:
+                f.write(expected[:cut])
+            assert last_exported_id(partial, 'csv') == ids[2]
+            with open(partial, 'wb') as f:
+                f.write(expected[:cut])
+            assert manage.main(['export', partial, '--user', user_id, '--resume']) == 0
+            with open(partial, 'rb') as f:
+                assert f.read() == expected
+
+            jsonl = os.path.join(directory, 'out.jsonl.gz')
+            assert manage.main(['export', jsonl, '--user', user_id]) == 0
+            with gzip.open(jsonl, 'rt', encoding='utf-8') as f:
+                assert [json.loads(line)['id'] for line in f] == ids
+            assert manage.main(['export', jsonl, '--resume']) == 1
+        print("✅ manage.py export 與接續匯出正確")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+def test_resume_csv_with_line_breaks():
+    """測試描述含 \r\n（看起來像記錄結尾）時，接續匯出仍找到正確的最後一筆"""
+    user_id = f"test_export_crlf_{datetime.now().strftime('%H%M%S%f')}"
+    ids = db.add_expenses_bulk([
+        {'user_id': user_id, 'amount_cents': 100, 'description': '第一筆'},
+        {'user_id': user_id, 'amount_cents': 200, 'description': '備註\r\n999,假記錄,"1.00"\r\n結尾'},
+        {'user_id': user_id, 'amount_cents': 300, 'description': '第三筆'},
+    ])
+    print("🧪 描述含 \\r\\n 的接續匯出測試...")
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            full = os.path.join(directory, 'full.csv')
+            assert manage.main(['export', full, '--user', user_id]) == 0
+            with open(full, 'rb') as f:
+                expected = f.read()
+            partial = os.path.join(directory, 'partial.csv')
+
+            def resume_from(cut):
+                with open(partial, 'wb') as f:
+                    f.write(expected[:cut])
+                return last_exported_id(partial, 'csv')
+
+            # 在描述中的假記錄之後中斷：第二筆不完整
+            fake = expected.index('假記錄'.encode())
+            assert resume_from(fake + len('假記錄'.encode()) + 5) == ids[0]
+            with open(partial, 'rb') as f:
+                assert f.read() == expected[:expected.index(f'{ids[1]},'.encode())]
+
+            # 剛好在第二筆結尾中斷
+            second_end = expected.index(f'{ids[2]},'.encode())
+            assert resume_from(second_end) == ids[1]
+
+            # 只有標題列、空檔案
+            header_end = expected.index(b'\r\n') + 2
+            assert resume_from(header_end + 3) is None
+            assert resume_from(0) is None
+
+            # 從描述中間接續，結果與一次匯出相同
+            resume_from(fake)
+            assert manage.main(['export', partial, '--user', user_id, '--resume']) == 0
+            with open(partial, 'rb') as f:
+                assert f.read() == expected
+        print("✅ 描述含換行時仍正確接續匯出")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+if __name__ == "__main__":
+    test_csv_and_jsonl()
+    test_xlsx()
+    test_export_endpoint()
+    test_manage_export_resume()
+    test_resume_csv_with_line_breaks()
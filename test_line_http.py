@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+LINE API 連線測試腳本
+以本機 HTTP 伺服器測試 keep-alive 連線重用、5xx 重試（只限冪等方法）與端點延遲統計
+"""
+
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from line_http import PooledHttpClient, endpoint_key
+
+
+class FakeLineHandler(BaseHTTPRequestHandler):
+    """前 N 次回應 503，之後回應 200"""
+    protocol_version = 'HTTP/1.1'
+    failures_left = 0
+    connections = set()
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        FakeLineHandler.connections.add(self.client_address)
+        if FakeLineHandler.failures_left > 0:
+            FakeLineHandler.failures_left -= 1
+            status, body = 503, b'{"message":"busy"}'
+        else:
+            status, body = 200, b'{}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeLineHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_endpoint_key():
+    """測試端點名稱會把 ID 換成佔位符"""
+    url = 'https://api.line.me/v2/bot/profile/U' + '0' * 32
+    assert endpoint_key('GET', url) == 'GET /v2/bot/profile/{id}'
+    assert endpoint_key('POST', 'https://api.line.me/v2/bot/message/reply') == 'POST /v2/bot/message/reply'
+    print("✅ 端點名稱正確")
+
+
+def test_keep_alive_and_retry():
+    """測試連線重用、5xx 重試成功，以及延遲統計"""
+    print("🧪 LINE API 連線測試...")
+    server = start_server()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    client = PooledHttpClient(timeout=(1, 2), max_retries=2, backoff_factor=0.01)
+    try:
+        FakeLineHandler.connections.clear()
+        for _ in range(5):
+            response = client.post(f"{base}/v2/bot/message/reply", data='{}')
+            assert response.status_code == 200
+        print(f"   5 次請求使用 {len(FakeLineHandler.connections)} 條連線")
+        assert len(FakeLineHandler.connections) == 1
+
+        FakeLineHandler.failures_left = 2
+        assert client.get(f"{base}/v2/bot/profile/U{'a' * 32}").status_code == 200
+        assert client.last_retries() == 2
+
+        FakeLineHandler.failures_left = 5
+        assert client.get(f"{base}/v2/bot/profile/U{'b' * 32}").status_code == 503
+
+        # POST 不在 5xx 時重試：推播可能已經送達，重送會重複
+        FakeLineHandler.failures_left = 1
+        assert client.post(f"{base}/v2/bot/message/push", data='{}').status_code == 503
+        assert FakeLineHandler.failures_left == 0
+        assert client.post(f"{base}/v2/bot/message/push", data='{}').status_code == 200
+        assert client.last_retries() == 0
+
+        stats = client.stats()
+        print(f"   端點統計: { {key: (value['count'], value['errors']) for key, value in stats.items()} }")
+        assert stats['POST /v2/bot/message/reply']['count'] == 5
+        push = stats['POST /v2/bot/message/push']
+        assert push['count'] == 2 and push['errors'] == 1
+        profile = stats['GET /v2/bot/profile/{id}']
+        assert profile['count'] == 2 and profile['errors'] == 1
+        assert sum(profile['buckets'].values()) == 2
+        print("✅ 重試與延遲統計正確")
+    finally:
+        FakeLineHandler.failures_left = 0
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_endpoint_key()
+    test_keep_alive_and_retry()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+訊息解析器測試腳本
+測試預先編譯的 MessageParser 與原本的解析結果一致，以及 ParseResult / parse_many
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import PARSER_CORPUS, LegacyMessageParser, same_as_legacy
+from message_parser import MessageParser, ParseResult
+
+
+def test_same_as_legacy():
+    """測試語料的解析結果與原本的 MessageParser 一致"""
+    legacy = LegacyMessageParser()
+    parser = MessageParser()
+    for message in PARSER_CORPUS:
+        assert same_as_legacy(parser.parse_message(message), legacy.parse_message(message)), message
+    print(f"✅ {len(PARSER_CORPUS)} 則訊息解析一致")
+
+
+def test_parse_result():
+    """測試 ParseResult 屬性存取、相容 dict 存取與 parse_many"""
+    parser = MessageParser()
+    result = parser.parse_message('@ai 咖啡 50元')
+    print(f"   {result}")
+    assert result.amount_cents == 5000 and result.reason == '咖啡'
+    assert result['amount_cents'] == 5000 and result.get('reason') == '咖啡'
+    assert result.get('unknown', 'x') == 'x'
+    assert not hasattr(result, '__dict__')
+    try:
+        result['unknown']
+        raise AssertionError('應該拋出 KeyError')
+    except KeyError:
+        pass
+
+    results = parser.parse_many(['@ai 午餐 120', '@ai /del #7', '大家好'])
+    assert [r.action_type for r in results] == ['expense', 'delete', None]
+    assert parser.is_valid_expense(results[0]) and parser.is_valid_delete(results[1])
+    assert results[1].delete_id == 7 and not results[2].is_valid_format
+    assert ParseResult.delete(3).description == '刪除記錄 #3'
+    print("✅ ParseResult 與 parse_many 正確")
+
+
+def test_multi_items():
+    """測試一則訊息多筆記帳的拆分（需要分隔符號或每筆都有貨幣標記）"""
+    parser = MessageParser()
+    cases = [
+        ('@ai 早餐 60，午餐 120、咖啡 50', [('早餐', 6000), ('午餐', 12000), ('咖啡', 5000)]),
+        ('@ai 早餐 60\n午餐 120; 咖啡 50元', [('早餐', 6000), ('午餐', 12000), ('咖啡', 5000)]),
+        ('@ai 高鐵 1490元 計程車 NT$250', [('高鐵', 149000), ('計程車', 25000)]),
+        ('@ai 咖啡 2 杯 100元 蛋糕 80.5元', [('咖啡 2 杯', 10000), ('蛋糕', 8050)]),
+        ('@ai 7-11 50元 全家 30元', [('7-11', 5000), ('全家', 3000)]),
+        ('@ai 水果 2 斤 150', None),
+        ('@ai 咖啡 50元 2', None),
+        ('@ai 午餐 0 晚餐 100', None),
+        ('@ai 午餐, 飲料 120', None),
+        ('@ai 電腦 1,200', None),
+        # 最後一筆是合計：不拆，避免合計被多記一筆
+        ('@ai 早餐 60元 午餐 120元 共 180元', None),
+        ('@ai 早餐 60，午餐 120，合計 180', None),
+    ]
+    for message, items in cases:
+        result = parser.parse_message(message)
+        print(f"   {message!r} -> {result.items}")
+        assert result.items == items, message
+        assert parser.is_valid_expense(result)
+    result = parser.parse_message(cases[0][0])
+    assert result.amount_cents == 23000 and result.reason == '早餐、午餐、咖啡'
+    assert result.expense_items() == cases[0][1]
+    assert parser.parse_message('@ai 午餐 120').expense_items() == [('午餐', 12000)]
+    print("✅ 多筆記帳拆分正確")
+
+
+def test_numbers_in_description():
+    """測試描述中有數字時仍是一筆，以最後的金額為準（與原本的解析相同）"""
+    parser = MessageParser()
+    cases = [
+        ('@ai iPhone 15 保護殼 500', 'iPhone 15 保護殼', 50000),
+        ('@ai 7-11 買東西 50', '7-11 買東西', 5000),
+        ('@ai 午餐 2 人 300', '午餐 2 人', 30000),
+        ('@ai 停車 2 小時 60', '停車 2 小時', 6000),
+        ('@ai 早餐 60 午餐 120 咖啡 50', '早餐 60 午餐 120 咖啡', 5000),
+    ]
+    for message, reason, amount_cents in cases:
+        result = parser.parse_message(message)
+        print(f"   {message!r} -> {result.reason!r} {result.amount_cents}")
+        assert result.items is None, message
+        assert (result.reason, result.amount_cents) == (reason, amount_cents), message
+    print("✅ 描述中的數字不會被拆成多筆")
+
+
+def test_delete_lists():
+    """測試刪除指令的多個編號與範圍"""
+    parser = MessageParser()
+    cases = [
+        ('@ai /del #23', 23, None),
+        ('@ai /del #1 #2 #5-#9', 1, [1, 2, 5, 6, 7, 8, 9]),
+        ('@ai /del #9-5, #2 #2', 2, [2, 5, 6, 7, 8, 9]),
+        ('@ai /del #4~#6、#10', 4, [4, 5, 6, 10]),
+        ('@ai /del #3 #3', 3, None),
+        ('@ai /del #1-#100', None, None),
+        ('@ai /del #0-#3', None, None),
+    ]
+    for message, delete_id, delete_ids in cases:
+        result = parser.parse_message(message)
+        print(f"   {message!r} -> {result.delete_id} {result.delete_ids}")
+        assert (result.delete_id, result.delete_ids) == (delete_id, delete_ids), message
+        assert parser.is_valid_delete(result) == (delete_id is not None)
+    assert parser.parse_message('@ai /del #5-#6').target_ids() == [5, 6]
+    assert parser.parse_message('@ai /del #5').target_ids() == [5]
+    print("✅ 多筆刪除解析正確")
+
+
+if __name__ == "__main__":
+    test_same_as_legacy()
+    test_parse_result()
+    test_multi_items()
+    test_numbers_in_description()
+    test_delete_lists()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+資料庫遷移測試腳本
+測試全新資料庫、舊版資料庫（沒有 schema_version）以及已是最新版本的情況
+"""
+
+import sys
+import os
+import sqlite3
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import migrations
+
+TEST_DB = 'test_migrations.db'
+
+
+def _fresh_connection():
+    if os.path.exists(TEST_DB):
+        os.remove(TEST_DB)
+    return sqlite3.connect(TEST_DB)
+
+
+def _indexes(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall()
+    return {row[0] for row in rows}
+
+
+def test_fresh_database():
+    """全新資料庫應套用所有遷移"""
+    print("🧪 全新資料庫遷移測試...")
+    conn = _fresh_connection()
+    try:
+        applied = migrations.migrate(conn, use_postgresql=False)
+        print(f"   套用版本: {applied}")
+        assert applied == [m['version'] for m in migrations.MIGRATIONS]
+        assert migrations.get_schema_version(conn, False) == migrations.LATEST_VERSION
+        assert {'idx_expenses_user_timestamp', 'idx_expenses_user_id'} <= _indexes(conn)
+        print("   ✅ 所有遷移已套用，索引已建立")
+
+        # 第二次啟動不應再執行任何遷移
+        assert migrations.migrate(conn, use_postgresql=False) == []
+        print("   ✅ 版本已是最新時略過遷移")
+    finally:
+        conn.close()
+        os.remove(TEST_DB)
+
+
+def test_legacy_database():
+    """舊版資料庫（已有資料表但沒有版本記錄）應保留資料並補上索引"""
+    print("\n🧪 舊版資料庫遷移測試...")
+    conn = _fresh_connection()
+    try:
+        for step in migrations.MIGRATIONS[0]['sqlite']:
+            conn.execute(step)
+        conn.execute("INSERT INTO expenses (user_id, amount, description) VALUES ('u1', 120, '午餐')")
+        # 舊資料可能是帶時差的 ISO 格式
+        conn.execute("INSERT INTO expenses (user_id, amount, description, timestamp) "
+                     "VALUES ('u2', 80, '早餐', '2024-01-01T08:30:00+08:00')")
+        conn.commit()
+
+        assert migrations.get_schema_version(conn, False) == 0
+        migrations.migrate(conn, use_postgresql=False)
+
+        count = conn.execute('SELECT COUNT(*) FROM expenses').fetchone()[0]
+        assert count == 2
+        # 金額轉為整數分，彙總從轉換後的記錄重新計算
+        rollup = conn.execute("SELECT sum_cents, count FROM monthly_rollups WHERE user_id = 'u1'").fetchone()
+        assert rollup == (12000, 1)
+        # 沒有設定的用戶應從第一筆記錄開始累計當前統計
+        current = conn.execute("SELECT current_total_cents, current_count FROM user_settings WHERE user_id = 'u1'").fetchone()
+        assert current == (12000, 1)
+        # 時間統一為 UTC 的 'YYYY-MM-DD HH:MM:SS'
+        legacy = conn.execute("SELECT timestamp FROM expenses WHERE user_id = 'u2'").fetchone()[0]
+        assert legacy == '2024-01-01 00:30:00'
+        assert {'idx_expenses_user_timestamp', 'idx_expenses_user_id'} <= _indexes(conn)
+        print(f"   ✅ 既有 {count} 筆記錄保留，版本 v{migrations.get_schema_version(conn, False)}")
+    finally:
+        conn.close()
+        os.remove(TEST_DB)
+
+
+if __name__ == "__main__":
+    print("🚀 開始測試資料庫遷移...")
+    test_fresh_database()
+    test_legacy_database()
+    print("\n🎉 所有測試完成！")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+金額處理測試腳本
+測試元與整數分的轉換、顯示格式，以及解析器輸出的整數金額
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from money import to_cents, format_amount, format_average
+from message_parser import MessageParser
+
+
+def test_to_cents():
+    """測試元轉換為整數分"""
+    print("🧪 金額轉換測試...")
+    cases = [('120', 12000), ('999.99', 99999), ('0.1', 10), ('12.345', 1235), (50, 5000)]
+    for value, expected in cases:
+        result = to_cents(value)
+        status = "✅" if result == expected else "❌"
+        print(f"   {status} {value!r} -> {result}")
+        assert result == expected
+
+    # 浮點數加總會有誤差，整數分不會
+    assert sum(to_cents('0.1') for _ in range(10)) == to_cents('1')
+
+
+def test_format_amount():
+    """測試金額顯示格式"""
+    print("\n🧪 金額格式測試...")
+    assert format_amount(12000) == '120'
+    assert format_amount(99999) == '999.99'
+    assert format_amount(5) == '0.05'
+    assert format_amount(-1250) == '-12.50'
+    assert format_average(10000, 3) == '33.3'
+    print("   ✅ 顯示格式正確")
+
+
+def test_parser_returns_cents():
+    """測試解析器回傳整數分"""
+    print("\n🧪 解析器金額測試...")
+    parser = MessageParser()
+    result = parser.parse_message('@ai 咖啡 45.5')
+    print(f"   解析結果: {result['amount_cents']} 分")
+    assert result['amount_cents'] == 4550 and isinstance(result['amount_cents'], int)
+    assert parser.is_valid_expense(result)
+    assert '45.50 元' in parser.format_expense_summary(result)
+
+
+if __name__ == "__main__":
+    print("🚀 開始測試金額處理...")
+    test_to_cents()
+    test_format_amount()
+    test_parser_returns_cents()
+    print("\n🎉 所有測試完成！")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+每月彙總測試腳本
+測試新增 / 刪除 / 清空記錄後，monthly_rollups 與原始記錄保持一致
+"""
+
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+from database import ExpenseDatabase
+
+
+def test_rollups_follow_writes():
+    """測試寫入路徑同步更新每月彙總"""
+    db = ExpenseDatabase()
+    test_user_id = f"test_rollup_user_{datetime.now().strftime('%H%M%S%f')}"
+    now = datetime.utcnow()
+
+    print("🧪 每月彙總測試開始...")
+    print("=" * 50)
+
+    try:
+        lunch_id = db.add_expense(test_user_id, 12000, description='午餐')
+        coffee_id = db.add_expense(test_user_id, 5050, description='咖啡')
+        db.add_expense(test_user_id, 3000, description='停車費')
+
+        total, count = db.get_monthly_total(test_user_id, now.year, now.month)
+        print(f"   新增 3 筆後: {total} 分 / {count} 筆")
+        assert (total, count) == (20050, 3)
+
+        # 時間欄位回傳帶時區的 UTC datetime
+        timestamp = db.get_user_expenses(test_user_id, 1)[0][5]
+        assert timestamp.utcoffset() is not None and timestamp.utcoffset().total_seconds() == 0
+        assert db.get_current_stats(test_user_id)['last_record'].tzinfo is not None
+
+        db.delete_expense(lunch_id, test_user_id)
+        db.delete_expenses_by_ids([coffee_id])
+        total, count = db.get_monthly_total(test_user_id, now.year, now.month)
+        print(f"   刪除 2 筆後: {total} 分 / {count} 筆")
+        assert (total, count) == (3000, 1)
+
+        stats = db.get_all_time_stats(test_user_id)
+        assert stats['total_count'] == 1 and len(stats['monthly_stats']) == 1
+
+        db.clear_all_expenses(test_user_id)
+        stats = db.get_all_time_stats(test_user_id)
+        print(f"   清空後: {stats['total_cents']} 分 / {stats['total_count']} 筆")
+        assert stats['total_count'] == 0 and stats['monthly_stats'] == []
+
+        mismatches = [m for m in db.check_monthly_rollups() if m['user_id'] == test_user_id]
+        assert not mismatches
+        print("   ✅ 每月彙總與原始記錄一致")
+    finally:
+        db.clear_all_expenses(test_user_id)
+
+
+if __name__ == "__main__":
+    test_rollups_follow_writes()
+    print("\n🎉 所有測試完成！")
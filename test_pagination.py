@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+記錄分頁測試腳本
+測試游標分頁 API，以及「下一頁」postback 按鈕
+"""
+
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+from linebot.models import PostbackAction
+from line_bot import ExpenseBot, db, encode_page_cursor, decode_page_cursor
+
+
+def test_page_api():
+    """測試 get_user_expenses_page 逐頁取得所有記錄且不重複"""
+    test_user_id = f"test_page_user_{datetime.now().strftime('%H%M%S%f')}"
+    print("🧪 游標分頁 API 測試...")
+
+    try:
+        ids = [db.add_expense(test_user_id, (i + 1) * 100, description=f'第{i + 1}筆') for i in range(7)]
+
+        seen = []
+        before_id = None
+        pages = 0
+        while True:
+            rows, before_id = db.get_user_expenses_page(test_user_id, before_id=before_id, limit=3)
+            seen.extend(row[0] for row in rows)
+            pages += 1
+            if before_id is None:
+                break
+
+        print(f"   共 {pages} 頁，{len(seen)} 筆")
+        assert pages == 3
+        assert seen == sorted(ids, reverse=True)
+        print("   ✅ 分頁結果新到舊且不重複")
+    finally:
+        db.clear_all_expenses(test_user_id)
+
+
+def test_next_page_postback():
+    """測試查詢結果附上「下一頁」按鈕，postback 可以取得下一頁"""
+    bot = ExpenseBot()
+    test_user_id = f"test_page_user_{datetime.now().strftime('%H%M%S%f')}"
+    print("\n🧪 下一頁 postback 測試...")
+
+    try:
+        for i in range(4):
+            db.add_expense(test_user_id, 1000, description=f'記錄{i + 1}')
+
+        response = bot.handle_message(test_user_id, "查詢3")
+        actions = [item.action for item in response.quick_reply.items]
+        next_page = [action for action in actions if isinstance(action, PostbackAction)]
+        assert len(next_page) == 1
+        print(f"   ✅ 第一頁附上下一頁按鈕: {next_page[0].data}")
+
+        response = bot.handle_postback(test_user_id, next_page[0].data)
+        print(f"   第二頁: {response.text.splitlines()[0]}")
+        assert "更早的 1 筆" in response.text
+        assert not any(isinstance(item.action, PostbackAction) for item in response.quick_reply.items)
+        print("   ✅ 最後一頁沒有下一頁按鈕")
+    finally:
+        db.clear_all_expenses(test_user_id)
+
+
+def test_cursor_encoding():
+    """測試游標編碼與無效游標"""
+    print("\n🧪 游標編碼測試...")
+    assert decode_page_cursor(encode_page_cursor(1234, 10)) == (1234, 10)
+    for bad in ['', 'abc', encode_page_cursor(10, 500), encode_page_cursor(0, 10)]:
+        assert decode_page_cursor(bad) is None
+    print("   ✅ 無效游標回傳 None")
+
+
+if __name__ == "__main__":
+    print("🚀 開始測試記錄分頁...")
+    test_page_api()
+    test_next_page_postback()
+    test_cursor_encoding()
+    print("\n🎉 所有測試完成！")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+用戶資料快取測試腳本
+測試記憶體 / 資料庫兩層快取、過期資料的背景更新，以及查詢失敗的負快取退避
+"""
+
+import sys
+import os
+import time
+from datetime import datetime, timezone, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from profile_cache import ProfileCache
+
+
+class FakeDb:
+    """模擬 user_profiles 資料表"""
+
+    def __init__(self, rows=None):
+        self.rows = dict(rows or {})  # {user_id: (profile, last_updated)}
+        self.loads = 0
+        self.saves = []
+
+    def get_user_profiles(self, user_ids):
+        self.loads += 1
+        return {user_id: self.rows[user_id] for user_id in user_ids if user_id in self.rows}
+
+    def save_user_profiles(self, profiles):
+        self.saves.append(sorted(profiles))
+        now = datetime.now(timezone.utc)
+        for user_id, profile in profiles.items():
+            self.rows[user_id] = (profile, now)
+
+
+class FakeFetch:
+    """模擬 LINE API：fail_ids 內的用戶查詢失敗"""
+
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.calls = []
+
+    def __call__(self, user_id):
+        self.calls.append(user_id)
+        if user_id in self.fail_ids:
+            raise RuntimeError('not found')
+        return {'display_name': f'新名字_{user_id}', 'picture_url': None, 'status_message': ''}
+
+
+def profile(name):
+    return {'display_name': name, 'picture_url': None, 'status_message': ''}
+
+
+def test_two_tiers_and_refresh():
+    """測試記憶體命中、資料庫命中，以及過期資料先回傳舊值再背景更新"""
+    now = datetime.now(timezone.utc)
+    db = FakeDb({
+        'fresh': (profile('新鮮'), now),
+        'stale': (profile('舊名字'), now - timedelta(days=3)),
+    })
+    fetch = FakeFetch()
+    cache = ProfileCache(db, fetch, ttl_seconds=86400)
+    try:
+        result = cache.get_many(['fresh', 'stale', 'new'])
+        assert result['fresh']['display_name'] == '新鮮'
+        assert result['stale']['display_name'] == '舊名字'  # 不阻塞，先回傳舊資料
+        assert result['new']['display_name'] == '新名字_new'
+        assert db.loads == 1
+
+        assert cache.wait_for_refresh(timeout=2)
+        assert sorted(fetch.calls) == ['new', 'stale']
+        assert cache.get('stale')['display_name'] == '新名字_stale'
+        assert db.rows['stale'][0]['display_name'] == '新名字_stale'
+
+        fetch.calls.clear()
+        cache.get_many(['fresh', 'stale', 'new'])
+        assert fetch.calls == [] and db.loads == 1
+        stats = cache.stats()
+        print(f"   統計: {stats}")
+        assert stats['refreshed'] == 1 and stats['db_hits'] == 2
+        print("✅ 兩層快取與背景更新正確")
+    finally:
+        cache.shutdown()
+
+
+def test_negative_backoff():
+    """測試查詢失敗的用戶在退避期間不再呼叫 API，且間隔以指數增加"""
+    db = FakeDb()
+    fetch = FakeFetch(fail_ids={'ghost'})
+    cache = ProfileCache(db, fetch, negative_ttl_seconds=0.05, negative_max_seconds=0.15)
+    try:
+        assert cache.get('ghost') is None
+        assert cache.get('ghost') is None
+        assert fetch.calls == ['ghost']
+
+        delays = []
+        for _ in range(3):
+            entry = cache._entries['ghost']
+            delays.append(round(entry.retry_at - time.time(), 2))
+            time.sleep(entry.retry_at - time.time() + 0.01)
+            cache.get('ghost')
+        print(f"   重試間隔: {delays}")
+        assert len(fetch.calls) == 4
+        assert delays[0] <= 0.05 < delays[1] <= 0.1 < delays[2] <= 0.15
+        assert cache._entries['ghost'].retry_at - time.time() <= 0.15
+
+        # 恢復後成功取得，失敗次數重設
+        fetch.fail_ids.clear()
+        time.sleep(0.16)
+        assert cache.get('ghost')['display_name'] == '新名字_ghost'
+        assert cache._entries['ghost'].failures == 0
+        print("✅ 負快取指數退避正確")
+    finally:
+        cache.shutdown()
+
+
+def test_lru_and_stale_fallback():
+    """測試 LRU 上限，以及背景更新失敗時保留舊資料"""
+    now = datetime.now(timezone.utc)
+    db = FakeDb({'old': (profile('舊名字'), now - timedelta(days=2))})
+    fetch = FakeFetch(fail_ids={'old'})
+    cache = ProfileCache(db, fetch, max_size=3, ttl_seconds=3600, negative_ttl_seconds=60)
+    try:
+        assert cache.get('old')['display_name'] == '舊名字'
+        assert cache.wait_for_refresh(timeout=2)
+        assert cache.get('old')['display_name'] == '舊名字'
+        assert fetch.calls == ['old']  # 退避期間不會再排背景更新
+
+        cache.get_many(['a', 'b', 'c'])
+        assert len(cache._entries) == 3 and 'old' not in cache._entries
+        print("✅ LRU 上限與更新失敗保留舊資料正確")
+    finally:
+        cache.shutdown()
+
+
+if __name__ == "__main__":
+    test_two_tiers_and_refresh()
+    test_negative_backoff()
+    test_lru_and_stale_fallback()
@@ -83,7 +83,7 @@ def test_query_limit_functionality():
                         print(f"   ⚠️ 回應中沒有筆數信息")
                     
                     # 檢查是否有警告訊息（超限時）
-                    if expected_limit == 50 and "最多只能查詢 50 筆" in text:
+                    if expected_limit == 50 and "每頁最多 50 筆" in text:
                         print(f"   ✅ 包含超限警告訊息")
                     elif expected_limit == 5 and message.endswith('0') and "數量不能小於 1" in text:
                         print(f"   ✅ 包含無效數量警告訊息")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+回覆期限測試腳本
+測試期限內使用 reply、確定沒有送達時才改用 push，以及備援統計
+"""
+
+import sys
+import os
+import time
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from linebot.models import MessageEvent, TextSendMessage
+from reply_sender import ReplySender
+
+
+class FakeHttpClient:
+    def __init__(self, retries=0):
+        self.retries = retries
+
+    def last_retries(self):
+        return self.retries
+
+
+class FakeApi:
+    """記錄 reply / push 呼叫，可指定 reply 失敗的錯誤與重試次數"""
+
+    def __init__(self, reply_error=None, retries=0):
+        self.reply_error = reply_error
+        self.http_client = FakeHttpClient(retries)
+        self.calls = []
+
+    def reply_message(self, reply_token, messages):
+        if isinstance(self.reply_error, Exception):
+            raise self.reply_error
+        if self.reply_error:
+            raise RuntimeError(self.reply_error)
+        self.calls.append(('reply', reply_token))
+
+    def push_message(self, to, messages):
+        self.calls.append(('push', to))
+
+
+def make_event(age_seconds, source=None):
+    return MessageEvent.new_from_json_dict({
+        'type': 'message',
+        'timestamp': int((time.time() - age_seconds) * 1000),
+        'replyToken': 'token',
+        'source': source or {'type': 'user', 'userId': 'U1'},
+        'message': {'type': 'text', 'id': '1', 'text': '@ai 午餐 120'},
+    })
+
+
+def test_reply_within_budget():
+    """測試期限內直接 reply"""
+    api = FakeApi()
+    sender = ReplySender(api, budget_seconds=50, margin_seconds=2)
+    assert sender.send(make_event(1), TextSendMessage(text='ok')) == 'reply'
+    assert api.calls == [('reply', 'token')]
+    assert sender.send(make_event(1), None) is None
+    print("✅ 期限內使用 reply")
+
+
+def test_push_fallback():
+    """測試接近期限與 reply token 失效時改用 push"""
+    api = FakeApi()
+    sender = ReplySender(api, budget_seconds=50, margin_seconds=2)
+    group = {'type': 'group', 'groupId': 'G1', 'userId': 'U1'}
+    assert sender.send(make_event(49), TextSendMessage(text='late')) == 'push'
+    assert sender.send(make_event(120, group), TextSendMessage(text='late')) == 'push'
+    assert api.calls == [('push', 'U1'), ('push', 'G1')]
+
+    expired = FakeApi(reply_error='LineBotApiError: status_code=400, error_response={"message":"Invalid reply token"}')
+    sender_expired = ReplySender(expired, budget_seconds=50)
+    assert sender_expired.send(make_event(1), TextSendMessage(text='retry')) == 'push'
+
+    broken = FakeApi(reply_error='connection reset')
+    sender_broken = ReplySender(broken, budget_seconds=50)
+    assert sender_broken.send(make_event(1), TextSendMessage(text='x')) is None
+    assert broken.calls == []
+
+    stats = sender.stats()
+    print(f"   備援統計: {stats} / {sender_expired.stats()}")
+    assert stats['push_near_deadline'] == 2 and stats['fallback_rate'] == 1.0
+    assert sender_expired.stats()['push_after_reply_error'] == 1
+    assert sender_broken.stats()['failed'] == 1
+    print("✅ 超過期限或 token 失效時改用 push")
+
+
+def test_no_push_when_reply_may_have_arrived():
+    """測試只有確定 reply 沒有送達時才改用 push，避免用戶收到兩次"""
+    invalid = 'LineBotApiError: status_code=400, error_response={"message":"Invalid reply token"}'
+
+    # 重試之後才被回應 token 無效：第一次可能已經送達
+    retried = FakeApi(reply_error=invalid, retries=1)
+    sender = ReplySender(retried, budget_seconds=50)
+    assert sender.send(make_event(1), TextSendMessage(text='x')) is None
+    assert retried.calls == [] and sender.stats()['failed'] == 1
+
+    # 讀取逾時：LINE 可能已經收到
+    timeout = FakeApi(reply_error=requests.exceptions.ReadTimeout('read timed out'))
+    sender = ReplySender(timeout, budget_seconds=50)
+    assert sender.send(make_event(1), TextSendMessage(text='x')) is None
+    assert timeout.calls == []
+
+    # 連線就失敗：請求沒有送出，改用 push
+    refused = NewConnectionError(None, 'Connection refused')
+    unreachable = FakeApi(reply_error=requests.exceptions.ConnectionError(MaxRetryError(None, '/v2/bot/message/reply', refused)))
+    sender = ReplySender(unreachable, budget_seconds=50)
+    assert sender.send(make_event(1), TextSendMessage(text='x')) == 'push'
+    assert unreachable.calls == [('push', 'U1')]
+    assert sender.stats()['push_after_connect_error'] == 1
+    print("✅ 可能已經送達的回覆不會再 push")
+
+
+if __name__ == "__main__":
+    test_reply_within_budget()
+    test_push_fallback()
+    test_no_push_when_reply_may_have_arrived()
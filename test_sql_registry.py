@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SQL 語句登錄表測試腳本
+測試語句依資料庫類型編譯，以及透過 SQLite 執行具名語句
+"""
+
+import sys
+import os
+import sqlite3
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import migrations
+from sql_registry import SQLRegistry, STATEMENTS
+
+
+def test_compile_dialects():
+    """測試佔位符與方言標記的編譯結果"""
+    print("🧪 語句編譯測試...")
+    pg = SQLRegistry(use_postgresql=True)
+    lite = SQLRegistry(use_postgresql=False)
+
+    for name in STATEMENTS:
+        # 只有單一資料庫版本的語句（例如 PostgreSQL 的 execute_values 模板）
+        for registry in (pg, lite):
+            if name in registry:
+                assert '{' not in registry.get(name), name
+        if name in pg:
+            assert '?' not in pg.get(name), name
+
+    assert 'to_char' in pg.get('rollups.rebuild')
+    assert "strftime('%Y-%m'" in lite.get('rollups.rebuild')
+    assert '= ANY(%s)' in pg.get('expenses.delete.ids')
+    assert 'json_each(?)' in lite.get('expenses.delete.ids')
+    print("   ✅ PostgreSQL / SQLite 語句編譯正確")
+
+
+def test_execute_sqlite():
+    """測試在 SQLite 執行具名語句（含清單參數）並記錄耗時"""
+    print("\n🧪 SQLite 執行測試...")
+    conn = sqlite3.connect(':memory:')
+    migrations.migrate(conn, use_postgresql=False)
+    sql = SQLRegistry(use_postgresql=False)
+    cursor = conn.cursor()
+
+    ids = [sql.fetchone(cursor, 'expenses.insert', ('u1', amount, None, '測試', None))[0]
+           for amount in (10, 20, 30)]
+    sql.execute(cursor, 'expenses.delete.ids', (ids[:2],))
+    remaining = sql.fetchall(cursor, 'expenses.recent_for_user', ('u1', 10))
+    assert [row[0] for row in remaining] == [ids[2]]
+
+    sql.execute(cursor, 'profiles.upsert', ('u1', '小明', None, None))
+    sql.execute(cursor, 'profiles.upsert', ('u1', '小華', None, None))
+    assert sql.fetchone(cursor, 'profiles.get', ('u1',))[0] == '小華'
+
+    stats = sql.stats()
+    assert stats['expenses.insert']['calls'] == 3
+    print(f"   ✅ 執行統計: {stats['expenses.insert']}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    print("🚀 開始測試 SQL 語句登錄表...")
+    test_compile_dialects()
+    test_execute_sqlite()
+    print("\n🎉 所有測試完成！")
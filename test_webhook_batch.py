@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 批次處理測試腳本
+測試同一批訊息的記帳 / 刪除合併在一個交易內寫入，回覆仍逐則對應
+"""
+
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+import line_bot
+from line_bot import ExpenseBot, BatchWriteError, db
+from linebot.models import MessageEvent
+
+
+def forget_events(db, event_ids):
+    """測試結束後從測試資料庫移除事件編號記錄"""
+    name = db.sql.ensure('test.events.forget', 'DELETE FROM processed_events WHERE event_id {in_list}')
+    with db.get_connection() as conn:
+        db.sql.execute(conn.cursor(), name, (list(event_ids),))
+        conn.commit()
+
+
+def call_count(name):
+    return db.get_sql_stats().get(name, {}).get('calls', 0)
+
+
+def test_batch_writes():
+    """測試群組同時多則記帳與刪除只寫入一次，回覆內容正確"""
+    bot = ExpenseBot()
+    suffix = datetime.now().strftime('%H%M%S%f')
+    alice, bob = f"test_batch_alice_{suffix}", f"test_batch_bob_{suffix}"
+    print("🧪 批次寫入測試...")
+
+    try:
+        old_id = db.add_expense(alice, 5000, description='舊記錄')
+        bob_id = db.add_expense(bob, 7000, description='別人的記錄')
+
+        inserts_before = call_count('expenses.insert_many')
+        replies = bot.handle_messages([
+            (alice, "@ai 午餐 120", True),
+            (bob, "@ai 咖啡 50", True),
+            (alice, f"@ai /del #{old_id}", True),
+            (alice, f"@ai /del #{old_id}", True),
+            (alice, f"@ai /del #{bob_id}", True),
+            (bob, "大家好", True),
+        ])
+        texts = [reply.text if reply else None for reply in replies]
+        for text in texts:
+            print(f"   回覆: {text.splitlines()[0] if text else None}")
+
+        assert call_count('expenses.insert_many') == inserts_before + 1
+        assert texts[0].startswith("✅ 記帳成功") and texts[1].startswith("✅ 記帳成功")
+        assert texts[2].startswith(f"✅ 成功刪除記錄 #{old_id}")
+        assert "可能已被刪除" in texts[3]
+        assert "不屬於您" in texts[4]
+        assert texts[5] is None
+
+        alice_rows = db.get_user_expenses(alice)
+        assert [(row[1], row[3]) for row in alice_rows] == [(12000, '午餐')]
+        assert db.get_current_stats(alice)['total_cents'] == 12000
+        assert db.get_expense(bob_id) is not None
+        assert db.check_monthly_rollups() == []
+        print("✅ 記帳與刪除在同一批寫入，回覆逐則對應")
+    finally:
+        db.clear_all_expenses(alice)
+        db.clear_all_expenses(bob)
+
+
+def test_query_sees_earlier_writes():
+    """測試同一批中的查詢會看到前面的記帳"""
+    bot = ExpenseBot()
+    user_id = f"test_batch_query_{datetime.now().strftime('%H%M%S%f')}"
+    print("🧪 批次中查詢測試...")
+
+    try:
+        replies = bot.handle_messages([
+            (user_id, "@ai 早餐 80", False),
+            (user_id, "記錄", False),
+        ])
+        assert "早餐" in replies[1].text
+        print("✅ 查詢前先寫入累積的記帳")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+def test_multi_item_message():
+    """測試一則訊息多筆記帳一次寫入並合併回覆"""
+    bot = ExpenseBot()
+    user_id = f"test_batch_multi_{datetime.now().strftime('%H%M%S%f')}"
+    print("🧪 一則訊息多筆記帳測試...")
+
+    try:
+        inserts_before = call_count('expenses.insert_many')
+        reply = bot.handle_message(user_id, "@ai 早餐 60，午餐 120，咖啡 50")
+        replies = bot.handle_messages([
+            (user_id, "@ai 晚餐 200、飲料 40", False),
+            (user_id, "@ai 宵夜 90", False),
+        ])
+        print(f"   回覆:\n{reply.text}")
+
+        assert call_count('expenses.insert_many') == inserts_before + 2
+        assert reply.text.startswith("✅ 記帳成功！共 3 筆") and "合計: 230 元" in reply.text
+        assert "共 2 筆" in replies[0].text and "記錄編號" in replies[1].text
+        rows = db.get_user_expenses(user_id, limit=10)
+        assert sorted(row[3] for row in rows) == sorted(['早餐', '午餐', '咖啡', '晚餐', '飲料', '宵夜'])
+        assert db.get_current_stats(user_id)['total_cents'] == 56000
+        print("✅ 多筆記帳一次寫入並合併回覆")
+    finally:
+        db.clear_all_expenses(user_id)
+
+
+def test_multi_delete():
+    """測試一次刪除多筆與範圍，只刪除自己的記錄並更新統計"""
+    bot = ExpenseBot()
+    suffix = datetime.now().strftime('%H%M%S%f')
+    alice, bob = f"test_multi_del_alice_{suffix}", f"test_multi_del_bob_{suffix}"
+    print("🧪 多筆刪除測試...")
+
+    try:
+        ids = db.add_expenses_bulk([
+            {'user_id': alice, 'amount_cents': 1000 * (i + 1), 'description': f'項目{i}'} for i in range(5)
+        ])
+        bob_id = db.add_expense(bob, 9900, description='別人的記錄')
+
+        deletes_before = call_count('expenses.delete_returning.user_ids')
+        reply = bot.handle_message(alice, f"@ai /del #{ids[0]} #{ids[2]}-#{ids[3]} #{bob_id}")
+        print(f"   回覆:\n{reply.text}")
+        assert call_count('expenses.delete_returning.user_ids') == deletes_before + 1
+        assert reply.text.startswith("✅ 成功刪除 3 筆記錄") and "合計: 80 元" in reply.text
+        assert f"#{bob_id}" in reply.text.splitlines()[-2]
+        assert db.get_expense(bob_id) is not None
+        assert [row[0] for row in db.get_user_expenses(alice)] == [ids[4], ids[1]]
+        assert db.get_current_stats(alice)['total_cents'] == 7000
+
+        replies = bot.handle_messages([
+            (alice, f"@ai /del #{ids[1]}-#{ids[4]}", True),
+            (alice, f"@ai /del #{ids[0]} #{ids[2]}", True),
+        ])
+        assert replies[0].text.startswith("✅ 成功刪除 2 筆記錄")
+        assert "沒有刪除任何記錄" in replies[1].text
+        assert db.get_user_expenses(alice) == []
+        assert db.check_monthly_rollups() == []
+        print("✅ 多筆刪除只刪除自己的記錄，統計同步更新")
+    finally:
+        db.clear_all_expenses(alice)
+        db.clear_all_expenses(bob)
+
+
+def test_reprocessed_events():
+    """測試同一批事件重新處理（例如程式當掉後）時，已寫入的記帳不會重複"""
+    bot = ExpenseBot()
+    suffix = datetime.now().strftime('%H%M%S%f')
+    user_id = f"test_batch_replay_{suffix}"
+    event_ids = [f"{user_id}_1", f"{user_id}_2", f"{user_id}_3"]
+    print("🧪 事件重新處理測試...")
+
+    try:
+        bot.handle_messages([(user_id, "@ai 午餐 120", False)], event_ids[:1])
+        replies = bot.handle_messages([
+            (user_id, "@ai 午餐 120", False),
+            (user_id, "@ai 咖啡 50", False),
+            (user_id, "記錄", False),
+        ], event_ids)
+        assert replies[0] is None and replies[1].text.startswith("✅ 記帳成功") and "咖啡" in replies[2].text
+        assert sorted(row[3] for row in db.get_user_expenses(user_id)) == ['午餐', '咖啡']
+        # 記帳的事件在寫入時記錄；查詢要等回覆送出後才記錄（handle_message_events）
+        assert db.get_processed_events(event_ids) == set(event_ids[:2])
+        print("✅ 已處理過的事件不會重複記帳")
+    finally:
+        db.clear_all_expenses(user_id)
+        forget_events(db, event_ids)
+
+
+def test_write_error_raised():
+    """測試寫入資料庫失敗時拋出錯誤（由收件匣重試），不回覆「記帳失敗」也不記錄事件"""
+    bot = ExpenseBot()
+    user_id = f"test_batch_error_{datetime.now().strftime('%H%M%S%f')}"
+    event_id = f"{user_id}_1"
+    print("🧪 寫入失敗測試...")
+
+    original = db.apply_expense_batch
+
+    def failing_batch(inserts, deletes, event_ids=()):
+        raise RuntimeError("database is down")
+
+    db.apply_expense_batch = failing_batch
+    try:
+        try:
+            bot.handle_messages([(user_id, "@ai 午餐 120", False)], [event_id])
+            assert False, "應該拋出錯誤"
+        except BatchWriteError as e:
+            assert e.failed_from == 0 and isinstance(e.__cause__, RuntimeError)
+    finally:
+        db.apply_expense_batch = original
+
+    try:
+        assert db.get_processed_events([event_id]) == set()
+        # 重試時正常寫入
+        replies = bot.handle_messages([(user_id, "@ai 午餐 120", False)], [event_id])
+        assert replies[0].text.startswith("✅ 記帳成功") and len(db.get_user_expenses(user_id)) == 1
+        assert bot.error_reply("大家好", is_group=True) is None
+        assert bot.error_reply("@ai 午餐 120", is_group=True).text.startswith("❌")
+        print("✅ 寫入失敗交給收件匣重試")
+    finally:
+        db.clear_all_expenses(user_id)
+        forget_events(db, [event_id])
+
+
+def make_message_event(user_id, event_id, text):
+    return MessageEvent.new_from_json_dict({
+        'type': 'message', 'mode': 'active', 'timestamp': 0, 'webhookEventId': event_id, 'replyToken': 'dummy',
+        'source': {'type': 'user', 'userId': user_id},
+        'message': {'type': 'text', 'id': event_id, 'text': text},
+    })
+
+
+def test_partial_batch_failure():
+    """測試批次中後面的寫入失敗時，前面已 commit 的記帳與查詢仍會回覆，只有失敗的部分重試"""
+    user_id = f"test_batch_partial_{datetime.now().strftime('%H%M%S%f')}"
+    event_ids = [f"{user_id}_{i}" for i in range(3)]
+    events = [make_message_event(user_id, event_ids[0], "@ai 午餐 120"),
+              make_message_event(user_id, event_ids[1], "記錄"),
+              make_message_event(user_id, event_ids[2], "@ai 咖啡 50")]
+    print("🧪 批次部分失敗測試...")
+
+    original_batch, original_send = db.apply_expense_batch, line_bot.send_reply
+    calls = []
+
+    def second_batch_fails(inserts, deletes, event_ids=()):
+        calls.append(event_ids)
+        if len(calls) == 2:
+            raise RuntimeError("database is down")
+        return original_batch(inserts, deletes, event_ids)
+
+    sent = []
+    db.apply_expense_batch = second_batch_fails
+    line_bot.send_reply = lambda event, reply: sent.append((event.webhook_event_id, reply))
+    try:
+        try:
+            line_bot.handle_message_events(events)
+            assert False, "應該拋出錯誤"
+        except BatchWriteError as e:
+            assert e.failed_from == 2
+        # 已 commit 的記帳與前面的查詢都有回覆，失敗的不回覆
+        assert [event_id for event_id, _ in sent] == event_ids[:2]
+        assert sent[0][1].text.startswith("✅ 記帳成功") and "午餐" in sent[1][1].text
+        # 查詢在回覆送出後記錄，失敗的記帳沒有記錄
+        assert db.get_processed_events(event_ids) == set(event_ids[:2])
+
+        # 重試失敗的部分
+        db.apply_expense_batch = original_batch
+        sent.clear()
+        line_bot.handle_message_events(events[2:])
+        assert sent[0][1].text.startswith("✅ 記帳成功")
+        assert sorted(row[3] for row in db.get_user_expenses(user_id)) == ['午餐', '咖啡']
+        print("✅ 已完成的部分先回覆，只重試失敗的訊息")
+    finally:
+        db.apply_expense_batch, line_bot.send_reply = original_batch, original_send
+        db.clear_all_expenses(user_id)
+        forget_events(db, event_ids)
+
+
+def test_query_marked_after_reply():
+    """測試查詢事件在回覆送出後才記錄為已處理（回覆前當掉時重新處理仍會回覆）"""
+    user_id = f"test_batch_mark_{datetime.now().strftime('%H%M%S%f')}"
+    event_id = f"{user_id}_1"
+    event = make_message_event(user_id, event_id, "記錄")
+    print("🧪 查詢事件記錄時機測試...")
+
+    original_send = line_bot.send_reply
+
+    def crash(event, reply):
+        raise SystemError("process crashed before reply")
+
+    line_bot.send_reply = crash
+    try:
+        try:
+            line_bot.handle_message_events([event])
+            assert False, "應該拋出錯誤"
+        except SystemError:
+            pass
+        assert db.get_processed_events([event_id]) == set()
+
+        sent = []
+        line_bot.send_reply = lambda event, reply: sent.append(reply)
+        line_bot.handle_message_events([event])
+        assert len(sent) == 1 and db.get_processed_events([event_id]) == {event_id}
+        print("✅ 查詢事件回覆後才記錄")
+    finally:
+        line_bot.send_reply = original_send
+        forget_events(db, [event_id])
+
+
+if __name__ == "__main__":
+    test_batch_writes()
+    test_query_sees_earlier_writes()
+    test_multi_item_message()
+    test_multi_delete()
+    test_reprocessed_events()
+    test_write_error_raised()
+    test_partial_batch_failure()
+    test_query_marked_after_reply()
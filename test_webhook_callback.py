@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 回調測試腳本
+測試 /callback 驗證簽章、寫入收件匣、記憶體去重，以及收件匣積壓時回應 503
+"""
+
+import sys
+import os
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DEBUG_MODE', 'true')
+
+import line_bot
+from line_bot import app, LINE_CHANNEL_SECRET
+
+
+def post_events(client, events):
+    body = json.dumps({'destination': 'test', 'events': events})
+    signature = base64.b64encode(hmac.new(LINE_CHANNEL_SECRET.encode(), body.encode(), hashlib.sha256).digest())
+    return client.post('/callback', data=body, headers={'X-Line-Signature': signature.decode()})
+
+
+def make_event(event_id):
+    # follow 事件不需要處理，工作執行緒會直接標記完成
+    return {'type': 'follow', 'webhookEventId': event_id, 'timestamp': 0, 'mode': 'active',
+            'source': {'type': 'user', 'userId': 'test_callback_user'}, 'replyToken': 'dummy'}
+
+
+def test_callback_accepts_events():
+    """測試事件寫入收件匣，重送的事件在記憶體中就被擋下"""
+    print("🧪 /callback 測試...")
+    client = app.test_client()
+    event_id = f"test_callback_{datetime.now().strftime('%H%M%S%f')}"
+
+    assert client.post('/callback', data='{}', headers={'X-Line-Signature': 'bad'}).status_code == 400
+
+    accepted = line_bot.event_dedupe.stats()['accepted']
+    assert post_events(client, [make_event(event_id)]).status_code == 200
+    assert line_bot.event_dedupe.stats()['accepted'] == accepted + 1
+    assert post_events(client, [make_event(event_id)]).status_code == 200
+    assert line_bot.event_dedupe.stats()['accepted'] == accepted + 1
+    print("✅ 事件寫入收件匣，重送事件被略過")
+
+
+def test_backpressure():
+    """測試收件匣待處理事件達到上限時回應 503，且事件不會被記為已收過"""
+    print("🧪 /callback 背壓測試...")
+    client = app.test_client()
+    event_id = f"test_callback_busy_{datetime.now().strftime('%H%M%S%f')}"
+
+    original = line_bot.INBOX_MAX_PENDING
+    line_bot.INBOX_MAX_PENDING = 0
+    try:
+        assert post_events(client, [make_event(event_id)]).status_code == 503
+        # 沒有事件時不受影響
+        assert post_events(client, []).status_code == 200
+    finally:
+        line_bot.INBOX_MAX_PENDING = original
+
+    # LINE 重送時可以正常接受
+    assert post_events(client, [make_event(event_id)]).status_code == 200
+    print("✅ 收件匣積壓時回應 503，之後重送的事件可以接受")
+
+
+if __name__ == "__main__":
+    test_callback_accepts_events()
+    test_backpressure()
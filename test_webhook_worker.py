@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 背景處理測試腳本
+測試佇列上限（背壓）、關閉時等待處理完畢，以及統計資訊
+"""
+
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from webhook_worker import WebhookWorkerPool
+
+
+def test_backpressure():
+    """測試佇列已滿時拒絕新工作"""
+    print("🧪 Webhook 佇列上限測試...")
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_job(job):
+        started.set()
+        release.wait(5)
+
+    pool = WebhookWorkerPool(slow_job, num_workers=1, max_queue_size=2)
+    assert pool.submit(['first'])
+    started.wait(5)
+
+    # 工作執行緒忙碌中，佇列只能再放 2 個
+    assert pool.submit(['second'])
+    assert pool.submit(['third'])
+    assert not pool.submit(['fourth'])
+
+    stats = pool.stats()
+    print(f"   佇列已滿時: {stats}")
+    assert stats['busy_workers'] == 1
+    assert stats['queue_depth'] == 2
+    assert stats['rejected'] == 1
+
+    release.set()
+    assert pool.shutdown(timeout=5)
+    print("✅ 佇列已滿時正確拒絕")
+
+
+def test_drain_on_shutdown():
+    """測試關閉時處理完佇列中的工作，之後不再接收"""
+    print("🧪 Webhook 關閉測試...")
+    handled = []
+    lock = threading.Lock()
+
+    def record_job(job):
+        if job == ['boom']:
+            raise RuntimeError("bad event")
+        with lock:
+            handled.extend(job)
+
+    pool = WebhookWorkerPool(record_job, num_workers=3, max_queue_size=50)
+    for i in range(20):
+        assert pool.submit([i])
+    assert pool.submit(['boom'])
+
+    assert pool.shutdown(timeout=5)
+    assert sorted(handled) == list(range(20))
+    assert not pool.submit([99])
+    assert pool.shutdown(timeout=5)
+
+    stats = pool.stats()
+    print(f"   關閉後: {stats}")
+    assert stats['processed'] == 21
+    assert stats['failed'] == 1
+    assert stats['rejected'] == 1
+    assert not stats['accepting']
+    print("✅ 關閉前已處理完所有工作")
+
+
+if __name__ == "__main__":
+    test_backpressure()
+    test_drain_on_shutdown()
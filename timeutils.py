@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+時間處理工具
+
+資料庫一律以 UTC 儲存時間，讀取時回傳帶時區的 datetime：
+- PostgreSQL：欄位型別為 TIMESTAMPTZ，連線時區固定為 UTC
+- SQLite：以 'YYYY-MM-DD HH:MM:SS' 的 UTC 文字儲存（與 CURRENT_TIMESTAMP 相同），
+  透過 sqlite3 的 adapter / converter 在寫入與讀取時轉換
+
+顯示給用戶時再轉換為 config.TIMEZONE 的當地時間。
+"""
+
+import sqlite3
+from datetime import datetime, timezone
+
+from config import TIMEZONE
+
+UTC = timezone.utc
+
+try:
+    from zoneinfo import ZoneInfo
+    DISPLAY_TZ = ZoneInfo(TIMEZONE)
+except Exception as e:
+    # 沒有時區資料庫（例如 Windows 未安裝 tzdata）時退回 UTC
+    print(f"⚠️ 無法載入時區 {TIMEZONE}，改用 UTC 顯示 - {e}")
+    DISPLAY_TZ = UTC
+
+
+def to_utc(value):
+    """轉換為 UTC 的 datetime；沒有時區資訊的 datetime 視為 UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value.astimezone(UTC)
+
+
+def to_local(value):
+    """轉換為顯示用的當地時間"""
+    if value is None:
+        return None
+    return to_utc(value).astimezone(DISPLAY_TZ)
+
+
+def from_local(value):
+    """沒有時區資訊的 datetime 視為當地時間，轉換為 UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=DISPLAY_TZ)
+    return value.astimezone(UTC)
+
+
+def format_local(value, fmt='%m/%d %H:%M', default='時間未知'):
+    """以當地時間格式化，沒有時間時回傳 default"""
+    if value is None:
+        return default
+    return to_local(value).strftime(fmt)
+
+
+def _adapt_datetime(value):
+    return to_utc(value).replace(tzinfo=None).isoformat(' ')
+
+
+def _convert_timestamp(raw):
+    return to_utc(datetime.fromisoformat(raw.decode()))
+
+
+def register_sqlite_types():
+    """註冊 SQLite 的 datetime 轉換
+
+    連線需以 detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES 開啟：
+    宣告為 DATETIME / TIMESTAMP 的欄位會自動轉換；MIN() / MAX() 等運算結果沒有宣告型別，
+    需在別名加上型別，例如 `MAX(timestamp) AS "last_record [timestamp]"`。
+    """
+    sqlite3.register_adapter(datetime, _adapt_datetime)
+    sqlite3.register_converter('DATETIME', _convert_timestamp)
+    sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
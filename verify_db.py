@@ -11,6 +11,8 @@ import sys
 import sqlite3
 from datetime import datetime
 
+from money import format_amount, to_cents
+
 # 設定調試模式
 os.environ['DEBUG_MODE'] = 'true'
 
@@ -18,7 +20,8 @@ def direct_sqlite_query():
     """直接查詢 SQLite 資料庫，不經過我們的 ExpenseDatabase 類別"""
     print("🔍 直接查詢 SQLite 資料庫檔案...")
     
-    db_file = 'expense_tracker.db'
+    from config import DATABASE_NAME
+    db_file = DATABASE_NAME
     
     if not os.path.exists(db_file):
         print(f"❌ 資料庫檔案 {db_file} 不存在")
@@ -45,7 +48,7 @@ def direct_sqlite_query():
         
         if total_count > 0:
             cursor.execute("""
-                SELECT id, user_id, amount, location, description, timestamp 
+                SELECT id, user_id, amount_cents, location, description, timestamp 
                 FROM expenses 
                 ORDER BY timestamp DESC 
                 LIMIT 10
@@ -54,7 +57,7 @@ def direct_sqlite_query():
             
             print("\n📋 最近 10 筆記錄:")
             for i, record in enumerate(records, 1):
-                print(f"  {i}. ID:{record[0]} | User:{record[1]} | 金額:{record[2]} | 地點:{record[3]} | 描述:{record[4]} | 時間:{record[5]}")
+                print(f"  {i}. ID:{record[0]} | User:{record[1]} | 金額:{format_amount(record[2])} | 地點:{record[3]} | 描述:{record[4]} | 時間:{record[5]}")
         
         conn.close()
         
@@ -77,7 +80,7 @@ def test_our_database_class():
             print(f"\n👤 用戶 {user_id}: {len(expenses)} 筆記錄")
             
             for i, expense in enumerate(expenses, 1):
-                print(f"  {i}. {expense[1]}元 - {expense[3]} ({expense[2]}) - {expense[5]}")
+                print(f"  {i}. {format_amount(expense[1])}元 - {expense[3]} ({expense[2]}) - {expense[5]}")
         
     except Exception as e:
         print(f"❌ ExpenseDatabase 查詢失敗: {e}")
@@ -89,7 +92,7 @@ def test_persistence():
     print("\n🔍 測試持久化：新增 -> 重新初始化 -> 查詢...")
     
     test_user = "persistence_test_user"
-    test_amount = 999.99
+    test_amount_cents = to_cents('999.99')
     test_description = f"持久化測試 {datetime.now().strftime('%H:%M:%S')}"
     
     try:
@@ -99,7 +102,7 @@ def test_persistence():
         
         expense_id = db1.add_expense(
             user_id=test_user,
-            amount=test_amount,
+            amount_cents=test_amount_cents,
             location="測試地點",
             description=test_description,
             category=None
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 背景處理
+
+/callback 驗證簽章後就立即回應 LINE，
+資料庫寫入和回覆訊息由固定數量的工作執行緒處理。
+
+- 佇列滿時 submit() 回傳 False，由呼叫端決定如何處理（背壓）
+- stats() 提供佇列深度、處理中數量與處理時間
+- shutdown() 停止接收新工作，等待佇列處理完畢（有逾時上限）
+"""
+
+import queue
+import threading
+import time
+
+# 通知工作執行緒結束
+_STOP = object()
+
+
+class WebhookWorkerPool:
+    """有上限佇列 + 固定數量工作執行緒"""
+
+    def __init__(self, handle_job, num_workers=4, max_queue_size=100, name='webhook-worker'):
+        """
+        Args:
+            handle_job (callable): 處理一個工作（一個 webhook 的事件列表）的函式
+            num_workers (int): 工作執行緒數量
+            max_queue_size (int): 佇列中等待處理的工作上限
+        """
+        self._handle_job = handle_job
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._accepting = True
+        self._busy = 0
+
+        self._submitted = 0
+        self._rejected = 0
+        self._processed = 0
+        self._failed = 0
+        self._max_depth = 0
+        self._total_time = 0.0
+        self._max_time = 0.0
+
+        self._threads = []
+        for i in range(num_workers):
+            thread = threading.Thread(target=self._run, name=f"{name}-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job):
+        """放入工作；佇列已滿或正在關閉時回傳 False"""
+        with self._lock:
+            if not self._accepting:
+                self._rejected += 1
+                return False
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._rejected += 1
+                return False
+            self._submitted += 1
+            depth = self._queue.qsize()
+            if depth > self._max_depth:
+                self._max_depth = depth
+        return True
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                with self._lock:
+                    self._busy += 1
+                started = time.perf_counter()
+                failed = False
+                try:
+                    self._handle_job(job)
+                except Exception as e:
+                    failed = True
+                    print(f"❌ WEBHOOK: 處理事件失敗 - {type(e).__name__}: {e}")
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self._busy -= 1
+                    self._processed += 1
+                    if failed:
+                        self._failed += 1
+                    self._total_time += elapsed
+                    if elapsed > self._max_time:
+                        self._max_time = elapsed
+            finally:
+                self._queue.task_done()
+
+    def drain(self, timeout=None):
+        """等待佇列中的工作全部處理完，回傳是否在逾時前完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=10.0):
+        """停止接收新工作並等待處理完畢（重複呼叫不會有副作用）"""
+        with self._lock:
+            if not self._accepting:
+                return True
+            self._accepting = False
+
+        pending = self._queue.qsize()
+        if pending:
+            print(f"🔧 WEBHOOK: 關閉中，等待 {pending} 個工作處理完畢...")
+        drained = self.drain(timeout)
+        if not drained:
+            print(f"⚠️ WEBHOOK: 等待逾時，仍有 {self._queue.qsize()} 個工作未處理")
+
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(_STOP)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        return drained
+
+    def stats(self):
+        """佇列深度、處理中數量與處理時間"""
+        with self._lock:
+            finished = self._processed
+            return {
+                'workers': self.num_workers,
+                'busy_workers': self._busy,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_depth,
+                'max_queue_size': self.max_queue_size,
+                'accepting': self._accepting,
+                'submitted': self._submitted,
+                'rejected': self._rejected,
+                'processed': finished,
+                'failed': self._failed,
+                'avg_process_ms': round(self._total_time * 1000 / finished, 3) if finished else 0.0,
+                'max_process_ms': round(self._max_time * 1000, 3),
+            }